@@ -0,0 +1,51 @@
+"""
+Data URI 解析基准测试
+
+对比旧的正则解析（re.match + group）与 split_data_uri/FileAttachment
+在 10MB 内联图片上的耗时。
+
+运行：python bench/bench_data_uri.py
+"""
+import base64
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.message import FileAttachment  # noqa: E402
+
+PAYLOAD_BYTES = 10 * 1024 * 1024
+ROUNDS = 20
+
+
+def bench(name: str, func, url: str):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(url)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{name:<32} {elapsed * 1000:>10.3f} ms/次")
+
+
+def regex_parse(url: str):
+    match = re.match(r"data:([^;]+);base64,(.+)", url)
+    return {"mime": match.group(1), "data": match.group(2)}
+
+
+def lazy_parse(url: str):
+    return FileAttachment.from_data_uri(url)
+
+
+def lazy_parse_and_upload(url: str):
+    attachment = FileAttachment.from_data_uri(url)
+    return attachment.data
+
+
+if __name__ == "__main__":
+    payload = base64.b64encode(os.urandom(PAYLOAD_BYTES)).decode()
+    url = f"data:image/png;base64,{payload}"
+    print(f"Data URI 长度: {len(url) / 1024 / 1024:.1f} MB, 轮数: {ROUNDS}")
+    bench("re.match + group(2)", regex_parse, url)
+    bench("FileAttachment（未上传）", lazy_parse, url)
+    bench("FileAttachment + 读取 data", lazy_parse_and_upload, url)
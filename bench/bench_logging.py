@@ -0,0 +1,111 @@
+"""
+请求日志开销基准测试
+
+模拟高并发下每个聊天请求的日志调用（8 条 INFO，其中 2 条带 500 字预览），
+统计事件循环线程上每个请求花在日志调用里的时间：
+1. 同步处理：LogStoreHandler + 控制台 StreamHandler 直接挂在日志器上（旧方式）
+2. 队列处理：LogQueueHandler 只入队，由 QueueListener 后台线程处理（start_log_pipeline）
+
+控制台输出写入 os.devnull，避免终端速度影响结果。
+
+运行：python bench/bench_logging.py [并发数] [请求数]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.log_store import LogStore, LogStoreHandler, log_extra, start_log_pipeline  # noqa: E402
+
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+PREVIEW = "用户消息预览 " * 50
+
+
+def make_logger(name: str) -> logging.Logger:
+    bench_logger = logging.getLogger(name)
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    return bench_logger
+
+
+def console_handler(devnull) -> logging.Handler:
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s", datefmt="%H:%M:%S"))
+    return handler
+
+
+def log_request(bench_logger: logging.Logger, account_id: str) -> float:
+    """一个请求的日志调用，返回耗时（秒）"""
+    request_id = uuid.uuid4().hex[:6]
+    start = time.perf_counter()
+    bench_logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 收到请求: gemini-2.5-pro | 3条消息 | stream=True",
+                      extra=log_extra(request_id, account_id, "request_start", model="gemini-2.5-pro", message_count=3))
+    bench_logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 用户消息: {PREVIEW[:500]}",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: abcdef123456",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[API] [{account_id}] [req_{request_id}] 发送内容: {PREVIEW[:200]}",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[API] [{account_id}] [req_{request_id}] 附带文件: 0个",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[CHAT] [{account_id}] [req_{request_id}] AI响应: {PREVIEW[:500]}",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[IMAGE] [{account_id}] [req_{request_id}] 图片处理完成: 0/0 成功",
+                      extra=log_extra(request_id, account_id))
+    bench_logger.info(f"[API] [{account_id}] [req_{request_id}] 响应完成: 1.23秒",
+                      extra=log_extra(request_id, account_id, "request_complete", duration=1.23))
+    return time.perf_counter() - start
+
+
+async def run(bench_logger: logging.Logger) -> list:
+    samples = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i: int):
+        async with semaphore:
+            await asyncio.sleep(0)
+            samples.append(log_request(bench_logger, f"account_{i % 50}"))
+
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    return samples
+
+
+def report(name: str, samples: list, wall: float):
+    samples.sort()
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"{name:<12} 每请求 p50 {p50:>8.1f} µs   p99 {p99:>8.1f} µs   总耗时 {wall:.2f}s")
+    return p50
+
+
+def main():
+    print(f"并发 {CONCURRENCY}，请求 {REQUESTS}（每请求 8 条日志）")
+    with open(os.devnull, "w") as devnull:
+        sync_logger = make_logger("bench.sync")
+        sync_logger.addHandler(LogStoreHandler(LogStore()))
+        sync_logger.addHandler(console_handler(devnull))
+        start = time.perf_counter()
+        samples = asyncio.run(run(sync_logger))
+        sync_p50 = report("同步处理", samples, time.perf_counter() - start)
+
+        queued_logger = make_logger("bench.queued")
+        store = LogStore()
+        listener = start_log_pipeline(queued_logger, LogStoreHandler(store), console_handler(devnull))
+        start = time.perf_counter()
+        samples = asyncio.run(run(queued_logger))
+        wall = time.perf_counter() - start
+        listener.stop()
+        drained = time.perf_counter() - start
+        queued_p50 = report("队列处理", samples, wall)
+        print(f"后台线程处理完全部日志: {drained:.2f}s（已写入 {len(store)} 条）")
+    print(f"事件循环上每请求节省: {sync_p50 - queued_p50:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+存储层调用延迟基准测试
+
+对比异步调用方访问存储层的三种路径：
+1. asyncio.to_thread(*_sync)：事件循环 → 工作线程 → 数据库线程循环 → 返回（旧方式）
+2. storage.run_async（未绑定应用连接池）：事件循环 → 数据库线程循环 → 返回
+3. storage.run_async（已 open_app_pool）：直接在应用事件循环中执行
+
+未设置 DATABASE_URL 时只测量线程中转本身的开销（空协程）；
+设置后额外测量真实查询（get_accounts_cursor）。
+
+运行：python bench/bench_storage.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import storage  # noqa: E402
+
+ROUNDS = 2000
+DB_ROUNDS = 200
+
+
+async def _noop():
+    return None
+
+
+async def bench(name: str, call, rounds: int):
+    for _ in range(min(rounds, 50)):  # 预热
+        await call()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"{name:<40} p50 {p50:>9.1f} µs   p99 {p99:>9.1f} µs")
+    return p50
+
+
+async def main():
+    print(f"线程中转开销（空协程，{ROUNDS} 次）")
+    old = await bench(
+        "to_thread(_run_in_db_loop)",
+        lambda: asyncio.to_thread(storage._run_in_db_loop, _noop()),
+        ROUNDS,
+    )
+    bridged = await bench("run_async → 数据库线程", lambda: storage.run_async(_noop()), ROUNDS)
+    direct = await bench("直接 await", _noop, ROUNDS)
+    print(f"每次调用节省: {old - direct:.1f} µs（仅去掉工作线程: {old - bridged:.1f} µs）")
+
+    if not storage.is_database_enabled():
+        print("\n未设置 DATABASE_URL，跳过真实查询测试")
+        return
+
+    print(f"\n真实查询 get_accounts_cursor（{DB_ROUNDS} 次）")
+    old = await bench(
+        "to_thread(get_accounts_cursor_sync)",
+        lambda: asyncio.to_thread(storage.get_accounts_cursor_sync),
+        DB_ROUNDS,
+    )
+    await storage.open_app_pool()
+    try:
+        native = await bench(
+            "应用连接池",
+            lambda: storage.run_async(storage.get_accounts_cursor()),
+            DB_ROUNDS,
+        )
+    finally:
+        await storage.close_app_pool()
+    print(f"每次调用节省: {old - native:.1f} µs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,18 +3,29 @@
 负责账户配置、多账户协调和会话缓存管理
 """
 import asyncio
+import heapq
 import json
 import logging
 import os
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
 
 from fastapi import HTTPException
 
 # 导入存储层（支持数据库）
 from core import storage
+from core.config import config_manager
+from core.health_bus import (
+    EVENT_FAILED,
+    EVENT_RATE_LIMITED,
+    EVENT_RECOVERED,
+    EVENT_RESET,
+    HealthBus,
+    make_event,
+)
+from core.session_cache import MemorySessionBackend, SessionBackend
 
 if TYPE_CHECKING:
     from core.jwt import JWTManager
@@ -44,25 +55,26 @@ class AccountConfig:
     mail_client_id: Optional[str] = None
     mail_refresh_token: Optional[str] = None
     mail_tenant: Optional[str] = None
+    # (expires_at, 过期时间戳) 解析缓存，expires_at 变化时重新解析
+    _expires_cache: tuple = field(default=(None, None), init=False, repr=False, compare=False)
+
+    def get_expires_timestamp(self) -> Optional[float]:
+        """过期时间戳（按本地时区解析，避免时区不一致导致误判）"""
+        cached = self._expires_cache
+        if cached[0] != self.expires_at:
+            try:
+                ts = datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S").timestamp() if self.expires_at else None
+            except (TypeError, ValueError):
+                ts = None
+            cached = self._expires_cache = (self.expires_at, ts)
+        return cached[1]
 
     def get_remaining_hours(self) -> Optional[float]:
         """计算账户剩余小时数"""
-        if not self.expires_at:
-            return None
-        try:
-            # 解析过期时间（按本地时区计算，避免时区不一致导致误判）
-            local_tz = datetime.now().astimezone().tzinfo
-            expire_time = datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S")
-            expire_time = expire_time.replace(tzinfo=local_tz)
-
-            # 当前时间（本地时区）
-            now = datetime.now(local_tz)
-
-            # 计算剩余时间
-            remaining = (expire_time - now).total_seconds() / 3600
-            return remaining
-        except Exception:
+        expires_ts = self.get_expires_timestamp()
+        if expires_ts is None:
             return None
+        return (expires_ts - time.time()) / 3600
 
     def is_expired(self) -> bool:
         """检查账户是否已过期"""
@@ -71,6 +83,23 @@ class AccountConfig:
             return False  # 未设置过期时间，默认不过期
         return remaining <= 0
 
+    def to_dict(self) -> dict:
+        """转换为账户配置格式（与 accounts.json 中的单个账户一致，未设置的邮箱字段省略）"""
+        data = {
+            "id": self.account_id,
+            "secure_c_ses": self.secure_c_ses,
+            "host_c_oses": self.host_c_oses,
+            "csesidx": self.csesidx,
+            "config_id": self.config_id,
+            "expires_at": self.expires_at,
+            "disabled": self.disabled,
+        }
+        for name in ("mail_provider", "mail_address", "mail_password", "mail_client_id", "mail_refresh_token", "mail_tenant"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
 
 def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
     """
@@ -93,6 +122,10 @@ def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
         return ("正常", "#4caf50", f"{remaining_hours:.1f} 小时")
 
 
+ACCOUNT_STATUSES = ("active", "cooldown", "failed", "expired", "disabled")
+BULK_ACCOUNT_ACTIONS = ("enable", "disable", "delete", "reset_errors")
+
+
 class AccountManager:
     """单个账户管理器"""
     def __init__(self, config: AccountConfig, http_client, user_agent: str, account_failure_threshold: int, rate_limit_cooldown_seconds: int):
@@ -107,12 +140,108 @@ class AccountManager:
         self.last_429_time = 0.0  # 429错误专属时间戳
         self.error_count = 0
         self.conversation_count = 0  # 累计对话次数
+        # 健康状态变化回调（由 MultiAccountManager 设置，用于广播给其他 worker）
+        self.health_listener: Optional[Callable[[dict], None]] = None
+        # 状态变化回调（由 MultiAccountManager 设置，用于维护按状态筛选的索引）
+        self.status_listener: Optional[Callable[["AccountManager"], None]] = None
+
+    def update_config(self, config: AccountConfig) -> bool:
+        """
+        原地替换账户配置（保留 JWT 和运行时状态）
+
+        Returns:
+            凭据是否变化（变化时丢弃缓存的 JWT，下次使用时重新获取）
+        """
+        old = self.config
+        credentials_changed = (
+            old.secure_c_ses != config.secure_c_ses
+            or old.host_c_oses != config.host_c_oses
+            or old.csesidx != config.csesidx
+        )
+        self.config = config
+        if self.jwt_manager is not None:
+            if credentials_changed:
+                self.jwt_manager = None
+            else:
+                self.jwt_manager.config = config
+        self._status_changed()
+        return credentials_changed
+
+    def set_disabled(self, disabled: bool):
+        """设置手动禁用状态"""
+        self.config.disabled = disabled
+        self._status_changed()
+
+    def _emit_health(self, kind: str, at: float):
+        if self.health_listener is not None:
+            self.health_listener(make_event(self.config.account_id, kind, at))
+
+    def _status_changed(self):
+        if self.status_listener is not None:
+            self.status_listener(self)
+
+    def mark_success(self):
+        """请求成功：恢复可用并清零失败计数（之前处于异常状态时广播恢复事件）"""
+        recovered = not self.is_available or self.error_count > 0
+        self.is_available = True
+        self.error_count = 0
+        if recovered:
+            self._status_changed()
+            self._emit_health(EVENT_RECOVERED, time.time())
+
+    def mark_rate_limited(self):
+        """遇到429：进入冷却期（不增加失败计数）"""
+        self.last_429_time = time.time()
+        self.is_available = False  # 临时禁用，冷却期后自动恢复
+        self._status_changed()
+        self._emit_health(EVENT_RATE_LIMITED, self.last_429_time)
+
+    def mark_failed(self) -> bool:
+        """普通失败：失败计数 +1，达到阈值后禁用。返回账户是否已被禁用"""
+        self.last_error_time = time.time()
+        self._apply_failure()
+        self._status_changed()
+        self._emit_health(EVENT_FAILED, self.last_error_time)
+        return not self.is_available
+
+    def reset_health(self):
+        """手动重置错误状态（允许恢复错误禁用的账户）"""
+        self._apply_reset()
+        self._status_changed()
+        self._emit_health(EVENT_RESET, time.time())
+
+    def _apply_failure(self):
+        self.error_count += 1
+        if self.error_count >= self.account_failure_threshold:
+            self.is_available = False
+
+    def _apply_reset(self):
+        self.is_available = True
+        self.error_count = 0
+        self.last_429_time = 0.0
+
+    def apply_health_event(self, kind: str, at: float):
+        """应用其他 worker 广播的健康事件（不再次广播）"""
+        if kind == EVENT_RATE_LIMITED:
+            if at > self.last_429_time:
+                self.last_429_time = at
+            self.is_available = False
+        elif kind == EVENT_FAILED:
+            self.last_error_time = max(self.last_error_time, at)
+            self._apply_failure()
+        elif kind == EVENT_RECOVERED:
+            self.is_available = True
+            self.error_count = 0
+        elif kind == EVENT_RESET:
+            self._apply_reset()
+        self._status_changed()
 
     async def get_jwt(self, request_id: str = "") -> str:
         """获取 JWT token (带错误处理)"""
         # 检查账户是否过期
         if self.config.is_expired():
             self.is_available = False
+            self._status_changed()
             logger.warning(f"[ACCOUNT] [{self.config.account_id}] 账户已过期，已自动禁用")
             raise HTTPException(403, f"Account {self.config.account_id} has expired")
 
@@ -122,15 +251,11 @@ class AccountManager:
                 from core.jwt import JWTManager
                 self.jwt_manager = JWTManager(self.config, self.http_client, self.user_agent)
             jwt = await self.jwt_manager.get(request_id)
-            self.is_available = True
-            self.error_count = 0
+            self.mark_success()
             return jwt
         except Exception as e:
-            self.last_error_time = time.time()
-            self.error_count += 1
             # 使用配置的失败阈值
-            if self.error_count >= self.account_failure_threshold:
-                self.is_available = False
+            if self.mark_failed():
                 logger.error(f"[ACCOUNT] [{self.config.account_id}] JWT获取连续失败{self.error_count}次，账户已永久禁用")
             else:
                 # 安全：只记录异常类型，不记录详细信息
@@ -151,6 +276,7 @@ class AccountManager:
                 self.is_available = True
                 self.last_429_time = 0.0
                 self.error_count = 0  # 重置错误计数
+                self._status_changed()
                 logger.info(f"[ACCOUNT] [{self.config.account_id}] 429冷却期已过，账户已自动恢复")
                 return True
             return False  # 仍在冷却期
@@ -158,6 +284,33 @@ class AccountManager:
         # 普通错误永久禁用
         return False
 
+    def get_status(self) -> str:
+        """
+        账户状态（管理面板筛选用，按优先级）：
+        disabled 手动禁用 / expired 已过期 / cooldown 429冷却中 / failed 错误禁用 / active 可用
+        """
+        if self.config.disabled:
+            return "disabled"
+        if self.config.is_expired():
+            return "expired"
+        if self.last_429_time > 0 and time.time() - self.last_429_time < self.rate_limit_cooldown_seconds:
+            return "cooldown"
+        if not self.is_available:
+            return "failed"
+        return "active"
+
+    def get_status_deadline(self, status: str) -> Optional[float]:
+        """当前状态因时间推移而改变的时间点（过期、429冷却结束），不会自动改变时返回 None"""
+        if status in ("disabled", "expired"):
+            return None
+        deadlines = []
+        expires_ts = self.config.get_expires_timestamp()
+        if expires_ts is not None:
+            deadlines.append(expires_ts)
+        if status == "cooldown":
+            deadlines.append(self.last_429_time + self.rate_limit_cooldown_seconds)
+        return min(deadlines) if deadlines else None
+
     def get_cooldown_info(self) -> tuple[int, str | None]:
         """
         获取账户冷却信息
@@ -186,90 +339,165 @@ class AccountManager:
 
 class MultiAccountManager:
     """多账户协调器"""
-    def __init__(self, session_cache_ttl_seconds: int):
+    def __init__(
+        self,
+        session_cache_ttl_seconds: int,
+        session_cache_max_size: Optional[int] = None,
+        session_backend: Optional[SessionBackend] = None,
+    ):
         self.accounts: Dict[str, AccountManager] = {}
         self.account_list: List[str] = []  # 账户ID列表 (用于轮询)
         self.current_index = 0
-        self._cache_lock = asyncio.Lock()  # 缓存操作专用锁
         self._index_lock = asyncio.Lock()  # 索引更新专用锁
-        # 全局会话缓存：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}
-        self.global_session_cache: Dict[str, dict] = {}
-        self.cache_max_size = 1000  # 最大缓存条目数
-        self.cache_ttl = session_cache_ttl_seconds  # 缓存过期时间（秒）
-        # Session级别锁：防止同一对话的并发请求冲突
-        self._session_locks: Dict[str, asyncio.Lock] = {}
-        self._session_locks_lock = asyncio.Lock()  # 保护锁字典的锁
-        self._session_locks_max_size = 2000  # 最大锁数量
-
-    def _clean_expired_cache(self):
+        # 会话缓存/锁后端：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}
+        # 默认进程内实现，多副本部署时替换为共享后端（见 core/session_cache.py）
+        if session_backend is None:
+            if session_cache_max_size is None:
+                session_cache_max_size = config_manager.session_cache_max_size
+            session_backend = MemorySessionBackend(session_cache_ttl_seconds, session_cache_max_size)
+        self.session_backend: SessionBackend = session_backend
+        # 账户健康事件总线：本进程的状态变化广播给其他 worker（默认不共享）
+        self.health_bus: HealthBus = HealthBus()
+        # 按状态筛选的索引：{状态: {account_id: None}}（有序集合），由账户状态变化回调维护
+        self._status_members: Dict[str, Dict[str, None]] = {status: {} for status in ACCOUNT_STATUSES}
+        self._account_status: Dict[str, str] = {}
+        # 随时间推移的状态变化（过期、429冷却结束）：(截止时间, account_id) 最小堆
+        self._status_deadlines: List[tuple] = []
+        self._next_deadline: Dict[str, float] = {}
+
+    @property
+    def cache_ttl(self) -> int:
+        """缓存过期时间（秒）"""
+        return self.session_backend.ttl_seconds
+
+    @cache_ttl.setter
+    def cache_ttl(self, value: int):
+        self.session_backend.ttl_seconds = value
+
+    @property
+    def cache_max_size(self) -> int:
+        """最大缓存条目数"""
+        return self.session_backend.max_size
+
+    @cache_max_size.setter
+    def cache_max_size(self, value: int):
+        self.session_backend.max_size = value
+
+    async def _clean_expired_cache(self):
         """清理过期的缓存条目"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, value in self.global_session_cache.items()
-            if current_time - value["updated_at"] > self.cache_ttl
-        ]
-        for key in expired_keys:
-            del self.global_session_cache[key]
-        if expired_keys:
-            logger.info(f"[CACHE] 清理 {len(expired_keys)} 个过期会话缓存")
-
-    def _ensure_cache_size(self):
-        """确保缓存不超过最大大小（LRU策略）"""
-        if len(self.global_session_cache) > self.cache_max_size:
-            # 按更新时间排序，删除最旧的20%
-            sorted_items = sorted(
-                self.global_session_cache.items(),
-                key=lambda x: x[1]["updated_at"]
-            )
-            remove_count = len(sorted_items) - int(self.cache_max_size * 0.8)
-            for key, _ in sorted_items[:remove_count]:
-                del self.global_session_cache[key]
-            logger.info(f"[CACHE] LRU清理 {remove_count} 个最旧会话缓存")
+        removed = await self.session_backend.cleanup()
+        if removed:
+            logger.info(f"[CACHE] 清理 {removed} 个过期会话缓存")
 
     async def start_background_cleanup(self):
         """启动后台缓存清理任务（每5分钟执行一次）"""
         try:
             while True:
                 await asyncio.sleep(300)  # 5分钟
-                async with self._cache_lock:
-                    self._clean_expired_cache()
-                    self._ensure_cache_size()
+                await self._clean_expired_cache()
         except asyncio.CancelledError:
             logger.info("[CACHE] 后台清理任务已停止")
         except Exception as e:
             logger.error(f"[CACHE] 后台清理任务异常: {e}")
 
+    async def get_session_cache(self, conv_key: str) -> Optional[dict]:
+        """读取会话缓存（绑定的账户已不存在时视为未命中）"""
+        cached = await self.session_backend.get(conv_key)
+        if cached and cached["account_id"] not in self.accounts:
+            return None
+        return cached
+
     async def set_session_cache(self, conv_key: str, account_id: str, session_id: str):
-        """线程安全地设置会话缓存"""
-        async with self._cache_lock:
-            self.global_session_cache[conv_key] = {
-                "account_id": account_id,
-                "session_id": session_id,
-                "updated_at": time.time()
-            }
-            # 检查缓存大小
-            self._ensure_cache_size()
+        """设置会话缓存（超过容量时由后端淘汰最久未更新的条目）"""
+        await self.session_backend.set(conv_key, account_id, session_id)
 
     async def update_session_time(self, conv_key: str):
-        """线程安全地更新会话时间戳"""
-        async with self._cache_lock:
-            if conv_key in self.global_session_cache:
-                self.global_session_cache[conv_key]["updated_at"] = time.time()
-
-    async def acquire_session_lock(self, conv_key: str) -> asyncio.Lock:
-        """获取指定对话的锁（用于防止同一对话的并发请求冲突）"""
-        async with self._session_locks_lock:
-            # 清理过多的锁（LRU策略：删除不在缓存中的锁）
-            if len(self._session_locks) > self._session_locks_max_size:
-                # 只保留当前缓存中存在的锁
-                valid_keys = set(self.global_session_cache.keys())
-                keys_to_remove = [k for k in self._session_locks if k not in valid_keys]
-                for k in keys_to_remove[:len(keys_to_remove)//2]:  # 删除一半无效锁
-                    del self._session_locks[k]
-
-            if conv_key not in self._session_locks:
-                self._session_locks[conv_key] = asyncio.Lock()
-            return self._session_locks[conv_key]
+        """更新会话时间戳"""
+        await self.session_backend.touch(conv_key)
+
+    async def resolve_conversation_key(self, prefix_chain: List[str], default_key: str) -> str:
+        """按最长已知历史前缀匹配已有会话，未命中时使用默认指纹"""
+        # 最后一项包含当前新消息，不可能被登记过
+        matched = await self.session_backend.match_prefix(prefix_chain[1:-1])
+        return matched or default_key
+
+    async def remember_prefix(self, prefix_hash: str, conv_key: str):
+        """登记本次请求的完整历史前缀，供下一轮请求匹配"""
+        await self.session_backend.remember_prefix(prefix_hash, conv_key)
+
+    def session_lock(self, conv_key: str):
+        """获取指定对话的锁（async with 使用，防止同一对话的并发请求冲突）"""
+        return self.session_backend.lock(conv_key)
+
+    def _publish_health(self, event: dict):
+        self.health_bus.publish(event)
+
+    def apply_health_event(self, event: dict):
+        """应用其他 worker 广播的账户健康事件"""
+        account = self.accounts.get(event.get("account_id"))
+        if account is None:
+            return
+        account.apply_health_event(event.get("kind"), float(event.get("at") or time.time()))
+        logger.info(f"[HEALTH] [{account.config.account_id}] 同步其他 worker 的账户状态: {event.get('kind')}")
+
+    def _index_status(self, account: AccountManager):
+        """重新计算账户状态并更新状态索引（已移出账户表的账户忽略）"""
+        account_id = account.config.account_id
+        if self.accounts.get(account_id) is not account:
+            return
+        status = account.get_status()
+        old_status = self._account_status.get(account_id)
+        if old_status != status:
+            if old_status is not None:
+                self._status_members[old_status].pop(account_id, None)
+            self._status_members[status][account_id] = None
+            self._account_status[account_id] = status
+        deadline = account.get_status_deadline(status)
+        if deadline is None:
+            self._next_deadline.pop(account_id, None)
+        elif deadline != self._next_deadline.get(account_id):
+            self._next_deadline[account_id] = deadline
+            heapq.heappush(self._status_deadlines, (deadline, account_id))
+
+    def _advance_status_deadlines(self):
+        """处理已到期的状态变化（过期、429冷却结束），只重新计算到期的账户"""
+        now = time.time()
+        heap = self._status_deadlines
+        while heap and heap[0][0] <= now:
+            deadline, account_id = heapq.heappop(heap)
+            if self._next_deadline.get(account_id) != deadline:
+                continue  # 已被更新的截止时间取代
+            del self._next_deadline[account_id]
+            account = self.accounts.get(account_id)
+            if account is not None:
+                self._index_status(account)
+
+    def rebuild_status_index(self):
+        """按当前账户表重建状态索引（账户表替换、冷却时长变化后调用）"""
+        self._status_members = {status: {} for status in ACCOUNT_STATUSES}
+        self._account_status = {}
+        self._status_deadlines = []
+        self._next_deadline = {}
+        for account in self.accounts.values():
+            self._index_status(account)
+
+    def count_by_status(self, statuses: Iterable[str]) -> int:
+        """指定状态的账户数"""
+        self._advance_status_deadlines()
+        return sum(len(self._status_members[status]) for status in statuses)
+
+    def iter_by_status(self, statuses: Iterable[str]) -> Iterator[AccountManager]:
+        """
+        按状态遍历账户（按 ACCOUNT_STATUSES 顺序分组，组内按进入该状态的先后）
+
+        迭代期间不要让出事件循环，索引可能被状态变化修改
+        """
+        self._advance_status_deadlines()
+        wanted = set(statuses)
+        for status in ACCOUNT_STATUSES:
+            if status in wanted:
+                for account_id in self._status_members[status]:
+                    yield self.accounts[account_id]
 
     def update_http_client(self, http_client):
         """更新所有账户使用的 http_client（用于代理变更后重建客户端）"""
@@ -278,33 +506,98 @@ class MultiAccountManager:
             if account_mgr.jwt_manager is not None:
                 account_mgr.jwt_manager.http_client = http_client
 
-    def add_account(self, config: AccountConfig, http_client, user_agent: str, account_failure_threshold: int, rate_limit_cooldown_seconds: int, global_stats: dict):
-        """添加账户"""
+    def _create_account(self, config: AccountConfig, http_client, user_agent: str, account_failure_threshold: int, rate_limit_cooldown_seconds: int, global_stats: dict) -> AccountManager:
         manager = AccountManager(config, http_client, user_agent, account_failure_threshold, rate_limit_cooldown_seconds)
         # 从统计数据加载对话次数
         if "account_conversations" in global_stats:
             manager.conversation_count = global_stats["account_conversations"].get(config.account_id, 0)
+        manager.health_listener = self._publish_health
+        manager.status_listener = self._index_status
+        # 已过期的账户也加载用于展示，但不可用
+        if config.is_expired():
+            manager.is_available = False
+        logger.info(f"[MULTI] [ACCOUNT] 添加账户: {config.account_id}")
+        return manager
+
+    def add_account(self, config: AccountConfig, http_client, user_agent: str, account_failure_threshold: int, rate_limit_cooldown_seconds: int, global_stats: dict):
+        """添加账户"""
+        manager = self._create_account(config, http_client, user_agent, account_failure_threshold, rate_limit_cooldown_seconds, global_stats)
         self.accounts[config.account_id] = manager
         self.account_list.append(config.account_id)
-        logger.info(f"[MULTI] [ACCOUNT] 添加账户: {config.account_id}")
+        self._index_status(manager)
+
+    def apply_account_configs(
+        self,
+        configs: List[AccountConfig],
+        http_client,
+        user_agent: str,
+        account_failure_threshold: int,
+        rate_limit_cooldown_seconds: int,
+        global_stats: dict
+    ) -> Dict[str, List[str]]:
+        """
+        按账户ID对比配置，原地增删改账户
+
+        未变化和仅配置变化的账户沿用原 AccountManager（保留 JWT、运行时状态），
+        会话绑定只移除已删除账户的条目。账户表整体替换，
+        正在遍历旧表的请求不受影响
+
+        Returns:
+            {"added", "updated", "removed", "unchanged"}: 各类账户ID列表
+        """
+        old_accounts = self.accounts
+        new_accounts: Dict[str, AccountManager] = {}
+        diff: Dict[str, List[str]] = {"added": [], "updated": [], "removed": [], "unchanged": []}
+
+        for config in configs:
+            account_id = config.account_id
+            account = old_accounts.get(account_id) or new_accounts.get(account_id)
+            if account is None:
+                account = self._create_account(config, http_client, user_agent, account_failure_threshold, rate_limit_cooldown_seconds, global_stats)
+                diff["added"].append(account_id)
+            else:
+                if account.config != config:
+                    if account.update_config(config):
+                        logger.info(f"[CONFIG] 账户 {account_id} 凭据已变化，将重新获取 JWT")
+                    diff["updated"].append(account_id)
+                elif account_id not in new_accounts:
+                    diff["unchanged"].append(account_id)
+                account.user_agent = user_agent
+                account.account_failure_threshold = account_failure_threshold
+                account.rate_limit_cooldown_seconds = rate_limit_cooldown_seconds
+            new_accounts[account_id] = account
+
+        diff["removed"] = [account_id for account_id in old_accounts if account_id not in new_accounts]
+
+        self.accounts = new_accounts
+        self.account_list = list(new_accounts)
+        self.rebuild_status_index()
+        self.update_http_client(http_client)
+        if diff["removed"]:
+            removed = self.session_backend.retain_accounts(new_accounts)
+            if removed:
+                logger.info(f"[CACHE] 账户已移除，清理 {removed} 个会话缓存")
+        return diff
 
     async def get_account(self, account_id: Optional[str] = None, request_id: str = "") -> AccountManager:
         """获取账户 (智能选择或指定) - 优先选择健康账户，提升响应速度"""
         req_tag = f"[req_{request_id}] " if request_id else ""
 
+        # 重载时账户表整体替换，本次选择使用同一份快照
+        accounts = self.accounts
+
         # 如果指定了账户ID（无需锁）
         if account_id:
-            if account_id not in self.accounts:
+            if account_id not in accounts:
                 raise HTTPException(404, f"Account {account_id} not found")
-            account = self.accounts[account_id]
+            account = accounts[account_id]
             if not account.should_retry():
                 raise HTTPException(503, f"Account {account_id} temporarily unavailable")
             return account
 
         # 智能选择可用账户（优先健康账户，提升响应速度）
         available_accounts = []
-        for acc_id in self.account_list:
-            account = self.accounts[acc_id]
+        for acc_id, account in accounts.items():
             # 检查账户是否可用（会自动恢复429冷却期后的账户）
             if (account.should_retry() and
                 not account.config.is_expired() and
@@ -331,7 +624,7 @@ class MultiAccountManager:
             account_id = healthy_accounts[self._available_index % len(healthy_accounts)]
             self._available_index = (self._available_index + 1) % len(healthy_accounts)
 
-        account = self.accounts[account_id]
+        account = accounts[account_id]
         logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {account_id} (健康度: {account.error_count}错误)")
         return account
 
@@ -370,9 +663,21 @@ def save_accounts_to_file(accounts_data: list):
     _save_to_file(accounts_data)
 
 
-def load_accounts_from_source() -> list:
-    """从环境变量、数据库或文件加载账户配置"""
-    # 1. 优先从环境变量加载
+async def save_accounts_to_file_async(accounts_data: list):
+    """保存账户配置（异步版本，管理接口在应用事件循环上使用）"""
+    if storage.is_database_enabled():
+        try:
+            saved = await storage.run_async(storage.save_accounts(accounts_data))
+            if saved:
+                return
+        except Exception as e:
+            logger.warning(f"[CONFIG] 数据库保存失败: {e}，降级到文件存储")
+
+    await asyncio.to_thread(_save_to_file, accounts_data)
+
+
+def _load_from_env() -> Optional[list]:
+    """从环境变量 ACCOUNTS_CONFIG 加载（未设置或解析失败时返回 None）"""
     env_accounts = os.environ.get('ACCOUNTS_CONFIG')
     if env_accounts:
         try:
@@ -384,16 +689,41 @@ def load_accounts_from_source() -> list:
             return accounts_data
         except Exception as e:
             logger.error(f"[CONFIG] 环境变量加载失败: {str(e)}")
+    return None
+
+
+def _log_db_loaded(accounts_data: list):
+    if accounts_data:
+        logger.info(f"[CONFIG] 从数据库加载配置，共 {len(accounts_data)} 个账户")
+    else:
+        logger.warning(f"[CONFIG] 数据库中账户配置为空")
+
+
+def _log_file_loaded(accounts_data: list):
+    if accounts_data:
+        logger.info(f"[CONFIG] 从文件加载配置: {ACCOUNTS_FILE}，共 {len(accounts_data)} 个账户")
+    else:
+        logger.warning(f"[CONFIG] 账户配置为空，请在管理面板添加账户或编辑 {ACCOUNTS_FILE}")
+
+
+def _log_no_config():
+    logger.warning(f"[CONFIG] 未找到配置，已创建空配置")
+    logger.info(f"[CONFIG] 💡 请在管理面板添加账户，或设置 DATABASE_URL 使用数据库存储")
+
+
+def load_accounts_from_source() -> list:
+    """从环境变量、数据库或文件加载账户配置（同步版本，供启动和后台线程使用）"""
+    # 1. 优先从环境变量加载
+    accounts_data = _load_from_env()
+    if accounts_data is not None:
+        return accounts_data
 
     # 2. 尝试从数据库加载
     if storage.is_database_enabled():
         try:
             accounts_data = storage.load_accounts_sync()
             if accounts_data is not None:
-                if accounts_data:
-                    logger.info(f"[CONFIG] 从数据库加载配置，共 {len(accounts_data)} 个账户")
-                else:
-                    logger.warning(f"[CONFIG] 数据库中账户配置为空")
+                _log_db_loaded(accounts_data)
                 return accounts_data
         except Exception as e:
             logger.warning(f"[CONFIG] 数据库加载失败: {e}，降级到文件存储")
@@ -401,24 +731,90 @@ def load_accounts_from_source() -> list:
     # 3. 从文件加载
     accounts_data = _load_from_file()
     if accounts_data is not None:
-        if accounts_data:
-            logger.info(f"[CONFIG] 从文件加载配置: {ACCOUNTS_FILE}，共 {len(accounts_data)} 个账户")
-        else:
-            logger.warning(f"[CONFIG] 账户配置为空，请在管理面板添加账户或编辑 {ACCOUNTS_FILE}")
+        _log_file_loaded(accounts_data)
         return accounts_data
 
     # 4. 无配置，创建空配置
-    logger.warning(f"[CONFIG] 未找到配置，已创建空配置")
-    logger.info(f"[CONFIG] 💡 请在管理面板添加账户，或设置 DATABASE_URL 使用数据库存储")
+    _log_no_config()
     save_accounts_to_file([])
     return []
 
 
+async def load_accounts_from_source_async() -> list:
+    """从环境变量、数据库或文件加载账户配置（异步版本，管理接口在应用事件循环上使用）"""
+    accounts_data = _load_from_env()
+    if accounts_data is not None:
+        return accounts_data
+
+    if storage.is_database_enabled():
+        try:
+            accounts_data = await storage.run_async(storage.load_accounts())
+            if accounts_data is not None:
+                _log_db_loaded(accounts_data)
+                return accounts_data
+        except Exception as e:
+            logger.warning(f"[CONFIG] 数据库加载失败: {e}，降级到文件存储")
+
+    accounts_data = await asyncio.to_thread(_load_from_file)
+    if accounts_data is not None:
+        _log_file_loaded(accounts_data)
+        return accounts_data
+
+    _log_no_config()
+    await save_accounts_to_file_async([])
+    return []
+
+
+def _use_account_rows() -> bool:
+    """账户是否来自数据库的按行存储（环境变量 ACCOUNTS_CONFIG 优先时不是）"""
+    return storage.is_database_enabled() and not os.environ.get("ACCOUNTS_CONFIG")
+
+
 def get_account_id(acc: dict, index: int) -> str:
     """获取账户ID（有显式ID则使用，否则生成默认ID）"""
     return acc.get("id", f"account_{index}")
 
 
+def build_account_configs(accounts_data: list) -> List[AccountConfig]:
+    """把账户数据解析为 AccountConfig 列表（缺少必需字段时抛出 ValueError）"""
+    configs = []
+    for i, acc in enumerate(accounts_data, 1):
+        config = _build_account_config(acc, i)
+
+        # 检查账户是否已过期（已过期也加载到管理面板）
+        if config.is_expired():
+            logger.warning(f"[CONFIG] 账户 {config.account_id} 已过期，仍加载用于展示")
+        configs.append(config)
+    return configs
+
+
+def _build_account_config(acc: dict, index: int) -> AccountConfig:
+    """解析单个账户数据（缺少必需字段时抛出 ValueError）"""
+    if not isinstance(acc, dict):
+        raise ValueError(f"账户 {index} 不是 JSON 对象")
+    # 验证必需字段
+    required_fields = ["secure_c_ses", "csesidx", "config_id"]
+    missing_fields = [f for f in required_fields if f not in acc]
+    if missing_fields:
+        raise ValueError(f"账户 {index} 缺少必需字段: {', '.join(missing_fields)}")
+
+    return AccountConfig(
+        account_id=get_account_id(acc, index),
+        secure_c_ses=acc["secure_c_ses"],
+        host_c_oses=acc.get("host_c_oses"),
+        csesidx=acc["csesidx"],
+        config_id=acc["config_id"],
+        expires_at=acc.get("expires_at"),
+        disabled=acc.get("disabled", False),  # 读取手动禁用状态，默认为False
+        mail_provider=acc.get("mail_provider"),
+        mail_address=acc.get("mail_address"),
+        mail_password=acc.get("mail_password") or acc.get("email_password"),
+        mail_client_id=acc.get("mail_client_id"),
+        mail_refresh_token=acc.get("mail_refresh_token"),
+        mail_tenant=acc.get("mail_tenant"),
+    )
+
+
 def load_multi_account_config(
     http_client,
     user_agent: str,
@@ -430,39 +826,8 @@ def load_multi_account_config(
     """从文件或环境变量加载多账户配置"""
     manager = MultiAccountManager(session_cache_ttl_seconds)
 
-    accounts_data = load_accounts_from_source()
-
-    for i, acc in enumerate(accounts_data, 1):
-        # 验证必需字段
-        required_fields = ["secure_c_ses", "csesidx", "config_id"]
-        missing_fields = [f for f in required_fields if f not in acc]
-        if missing_fields:
-            raise ValueError(f"账户 {i} 缺少必需字段: {', '.join(missing_fields)}")
-
-        config = AccountConfig(
-            account_id=get_account_id(acc, i),
-            secure_c_ses=acc["secure_c_ses"],
-            host_c_oses=acc.get("host_c_oses"),
-            csesidx=acc["csesidx"],
-            config_id=acc["config_id"],
-            expires_at=acc.get("expires_at"),
-            disabled=acc.get("disabled", False),  # 读取手动禁用状态，默认为False
-            mail_provider=acc.get("mail_provider"),
-            mail_address=acc.get("mail_address"),
-            mail_password=acc.get("mail_password") or acc.get("email_password"),
-            mail_client_id=acc.get("mail_client_id"),
-            mail_refresh_token=acc.get("mail_refresh_token"),
-            mail_tenant=acc.get("mail_tenant"),
-        )
-
-        # 检查账户是否已过期（已过期也加载到管理面板）
-        is_expired = config.is_expired()
-        if is_expired:
-            logger.warning(f"[CONFIG] 账户 {config.account_id} 已过期，仍加载用于展示")
-
+    for config in build_account_configs(load_accounts_from_source()):
         manager.add_account(config, http_client, user_agent, account_failure_threshold, rate_limit_cooldown_seconds, global_stats)
-        if is_expired:
-            manager.accounts[config.account_id].is_available = False
 
     if not manager.accounts:
         logger.warning(f"[CONFIG] 没有有效的账户配置，服务将启动但无法处理请求，请在管理面板添加账户")
@@ -471,6 +836,46 @@ def load_multi_account_config(
     return manager
 
 
+def _format_account_ids(account_ids: List[str], limit: int = 10) -> str:
+    shown = ", ".join(account_ids[:limit])
+    if len(account_ids) > limit:
+        shown += f" 等 {len(account_ids)} 个"
+    return shown
+
+
+def _log_reload_diff(diff: Dict[str, List[str]], multi_account_mgr: MultiAccountManager):
+    for key, label in (("added", "新增"), ("updated", "更新"), ("removed", "移除")):
+        if diff[key]:
+            logger.info(f"[CONFIG] {label}账户: {_format_account_ids(diff[key])}")
+    logger.info(
+        f"[CONFIG] 配置已重载: 新增 {len(diff['added'])}, 更新 {len(diff['updated'])}, "
+        f"移除 {len(diff['removed'])}, 未变 {len(diff['unchanged'])}，当前账户数: {len(multi_account_mgr.accounts)}"
+    )
+
+
+def _apply_loaded_configs(
+    configs: List[AccountConfig],
+    multi_account_mgr: MultiAccountManager,
+    http_client,
+    user_agent: str,
+    account_failure_threshold: int,
+    rate_limit_cooldown_seconds: int,
+    session_cache_ttl_seconds: int,
+    global_stats: dict
+) -> MultiAccountManager:
+    diff = multi_account_mgr.apply_account_configs(
+        configs,
+        http_client,
+        user_agent,
+        account_failure_threshold,
+        rate_limit_cooldown_seconds,
+        global_stats
+    )
+    multi_account_mgr.cache_ttl = session_cache_ttl_seconds
+    _log_reload_diff(diff, multi_account_mgr)
+    return multi_account_mgr
+
+
 def reload_accounts(
     multi_account_mgr: MultiAccountManager,
     http_client,
@@ -480,21 +885,15 @@ def reload_accounts(
     session_cache_ttl_seconds: int,
     global_stats: dict
 ) -> MultiAccountManager:
-    """重新加载账户配置（保留现有账户的运行时状态）"""
-    # 保存现有账户的运行时状态
-    old_states = {}
-    for account_id, account_mgr in multi_account_mgr.accounts.items():
-        old_states[account_id] = {
-            "is_available": account_mgr.is_available,
-            "last_error_time": account_mgr.last_error_time,
-            "last_429_time": account_mgr.last_429_time,
-            "error_count": account_mgr.error_count,
-            "conversation_count": account_mgr.conversation_count
-        }
+    """
+    重新加载账户配置（增量）
 
-    # 清空会话缓存并重新加载配置
-    multi_account_mgr.global_session_cache.clear()
-    new_mgr = load_multi_account_config(
+    只新增、移除和更新有变化的账户，其余账户的 JWT、运行时状态和会话绑定保持不变。
+    返回的仍是传入的管理器（保留返回值以兼容调用方）
+    """
+    return _apply_loaded_configs(
+        build_account_configs(load_accounts_from_source()),
+        multi_account_mgr,
         http_client,
         user_agent,
         account_failure_threshold,
@@ -503,19 +902,77 @@ def reload_accounts(
         global_stats
     )
 
-    # 恢复现有账户的运行时状态
-    for account_id, state in old_states.items():
-        if account_id in new_mgr.accounts:
-            account_mgr = new_mgr.accounts[account_id]
-            account_mgr.is_available = state["is_available"]
-            account_mgr.last_error_time = state["last_error_time"]
-            account_mgr.last_429_time = state["last_429_time"]
-            account_mgr.error_count = state["error_count"]
-            account_mgr.conversation_count = state["conversation_count"]
-            logger.debug(f"[CONFIG] 账户 {account_id} 运行时状态已恢复")
 
-    logger.info(f"[CONFIG] 配置已重载，当前账户数: {len(new_mgr.accounts)}")
-    return new_mgr
+async def reload_accounts_async(
+    multi_account_mgr: MultiAccountManager,
+    http_client,
+    user_agent: str,
+    account_failure_threshold: int,
+    rate_limit_cooldown_seconds: int,
+    session_cache_ttl_seconds: int,
+    global_stats: dict
+) -> MultiAccountManager:
+    """reload_accounts 的异步版本（不阻塞事件循环）"""
+    return _apply_loaded_configs(
+        build_account_configs(await load_accounts_from_source_async()),
+        multi_account_mgr,
+        http_client,
+        user_agent,
+        account_failure_threshold,
+        rate_limit_cooldown_seconds,
+        session_cache_ttl_seconds,
+        global_stats
+    )
+
+
+def apply_account_changes(
+    changed_rows: list,
+    multi_account_mgr: MultiAccountManager,
+    http_client,
+    user_agent: str,
+    account_failure_threshold: int,
+    rate_limit_cooldown_seconds: int,
+    session_cache_ttl_seconds: int,
+    global_stats: dict
+) -> MultiAccountManager:
+    """
+    按数据库中变化的账户行增量更新（自动刷新使用，只读取变化的行）
+
+    Args:
+        changed_rows: storage.load_accounts_changed_since 返回的行，
+            每行包含 account_id、data、deleted
+    """
+    changed = {}
+    deleted = set()
+    for row in changed_rows:
+        if row["deleted"]:
+            deleted.add(row["account_id"])
+        else:
+            changed[row["account_id"]] = row["data"]
+    changed_configs = {
+        config.account_id: config
+        for config in build_account_configs(list(changed.values()))
+    }
+
+    # 现有账户保持顺序（变化的原地替换），新账户追加到末尾
+    configs = []
+    for account_id, account_mgr in multi_account_mgr.accounts.items():
+        if account_id in deleted:
+            continue
+        configs.append(changed_configs.pop(account_id, account_mgr.config))
+    configs.extend(changed_configs.values())
+
+    diff = multi_account_mgr.apply_account_configs(
+        configs,
+        http_client,
+        user_agent,
+        account_failure_threshold,
+        rate_limit_cooldown_seconds,
+        global_stats
+    )
+    multi_account_mgr.cache_ttl = session_cache_ttl_seconds
+    _log_reload_diff(diff, multi_account_mgr)
+    return multi_account_mgr
 
 
 def update_accounts_config(
@@ -541,7 +998,7 @@ def update_accounts_config(
     )
 
 
-def delete_account(
+async def delete_account(
     account_id: str,
     multi_account_mgr: MultiAccountManager,
     http_client,
@@ -552,7 +1009,21 @@ def delete_account(
     global_stats: dict
 ) -> MultiAccountManager:
     """删除单个账户"""
-    accounts_data = load_accounts_from_source()
+    if _use_account_rows():
+        # 数据库按行存储：只删除这一行
+        if not await storage.run_async(storage.delete_account(account_id)):
+            raise ValueError(f"账户 {account_id} 不存在")
+        return await reload_accounts_async(
+            multi_account_mgr,
+            http_client,
+            user_agent,
+            account_failure_threshold,
+            rate_limit_cooldown_seconds,
+            session_cache_ttl_seconds,
+            global_stats
+        )
+
+    accounts_data = await load_accounts_from_source_async()
 
     # 过滤掉要删除的账户
     filtered = [
@@ -563,8 +1034,8 @@ def delete_account(
     if len(filtered) == len(accounts_data):
         raise ValueError(f"账户 {account_id} 不存在")
 
-    save_accounts_to_file(filtered)
-    return reload_accounts(
+    await save_accounts_to_file_async(filtered)
+    return await reload_accounts_async(
         multi_account_mgr,
         http_client,
         user_agent,
@@ -575,7 +1046,7 @@ def delete_account(
     )
 
 
-def update_account_disabled_status(
+async def update_account_disabled_status(
     account_id: str,
     disabled: bool,
     multi_account_mgr: MultiAccountManager,
@@ -592,17 +1063,278 @@ def update_account_disabled_status(
         raise ValueError(f"账户 {account_id} 不存在")
 
     account_mgr = multi_account_mgr.accounts[account_id]
-    account_mgr.config.disabled = disabled
+    account_mgr.set_disabled(disabled)
+
+    # 数据库按行存储：只更新这一行
+    if _use_account_rows() and await storage.run_async(storage.set_account_disabled(account_id, disabled)):
+        status_text = "已禁用" if disabled else "已启用"
+        logger.info(f"[CONFIG] 账户 {account_id} {status_text}")
+        return multi_account_mgr
 
     # 保存到文件
-    accounts_data = load_accounts_from_source()
+    accounts_data = await load_accounts_from_source_async()
     for i, acc in enumerate(accounts_data, 1):
         if get_account_id(acc, i) == account_id:
             acc["disabled"] = disabled
             break
 
-    save_accounts_to_file(accounts_data)
+    await save_accounts_to_file_async(accounts_data)
 
     status_text = "已禁用" if disabled else "已启用"
     logger.info(f"[CONFIG] 账户 {account_id} {status_text}")
     return multi_account_mgr
+
+
+async def bulk_update_accounts(
+    action: str,
+    account_ids: List[str],
+    multi_account_mgr: MultiAccountManager,
+    http_client,
+    user_agent: str,
+    account_failure_threshold: int,
+    rate_limit_cooldown_seconds: int,
+    global_stats: dict
+) -> Dict[str, List[str]]:
+    """
+    批量启用/禁用/删除/重置错误
+
+    先在内存中应用全部变更，再整体保存一次（数据库按行存储时只改动变化的行），
+    避免逐个账户调用时每次都重新读取并完整写入配置。reset_errors 只修改运行时状态，不写入存储
+
+    Returns:
+        {"updated": 实际变更的账户ID, "not_found": 不存在的账户ID}
+    """
+    if action not in BULK_ACCOUNT_ACTIONS:
+        raise ValueError(f"无效的操作: {action}")
+
+    targets = []
+    not_found = []
+    for account_id in dict.fromkeys(account_ids):
+        if account_id in multi_account_mgr.accounts:
+            targets.append(account_id)
+        else:
+            not_found.append(account_id)
+    result = {"updated": targets, "not_found": not_found}
+    if not targets:
+        return result
+
+    if action == "reset_errors":
+        for account_id in targets:
+            multi_account_mgr.accounts[account_id].reset_health()
+        logger.info(f"[CONFIG] 批量重置错误状态: {_format_account_ids(targets)}")
+        return result
+
+    target_set = set(targets)
+    if action == "delete":
+        kept = []
+        for i, acc in enumerate(await load_accounts_from_source_async(), 1):
+            account_id = get_account_id(acc, i)
+            if account_id in target_set:
+                continue
+            # 写入显式ID，避免删除后未设置ID的账户按位置重新编号
+            if "id" not in acc:
+                acc = {"id": account_id, **acc}
+            kept.append(acc)
+        await save_accounts_to_file_async(kept)
+
+        configs = [
+            account_mgr.config
+            for account_id, account_mgr in multi_account_mgr.accounts.items()
+            if account_id not in target_set
+        ]
+        diff = multi_account_mgr.apply_account_configs(
+            configs,
+            http_client,
+            user_agent,
+            account_failure_threshold,
+            rate_limit_cooldown_seconds,
+            global_stats
+        )
+        _log_reload_diff(diff, multi_account_mgr)
+        return result
+
+    disabled = action == "disable"
+    changed = [
+        account_id for account_id in targets
+        if multi_account_mgr.accounts[account_id].config.disabled != disabled
+    ]
+    for account_id in targets:
+        account_mgr = multi_account_mgr.accounts[account_id]
+        account_mgr.set_disabled(disabled)
+        if not disabled:
+            # 与单个启用一致：同时重置错误禁用状态
+            account_mgr.reset_health()
+
+    if changed:
+        accounts_data = await load_accounts_from_source_async()
+        for i, acc in enumerate(accounts_data, 1):
+            if get_account_id(acc, i) in target_set:
+                acc["disabled"] = disabled
+        await save_accounts_to_file_async(accounts_data)
+
+    status_text = "已禁用" if disabled else "已启用"
+    logger.info(f"[CONFIG] 批量{status_text} {len(targets)} 个账户（状态变化 {len(changed)} 个）: {_format_account_ids(targets)}")
+    return result
+
+
+# ---------- NDJSON 导入导出 ----------
+
+ACCOUNT_EXPORT_BATCH = 500
+ACCOUNT_IMPORT_MODES = ("merge", "replace")
+_MAX_IMPORT_ERRORS = 20
+_MAX_IMPORT_LINE_BYTES = 1024 * 1024  # 单行上限，超出的行记为无效且不缓存
+
+
+def iter_accounts_ndjson(accounts_data: list, batch_size: int = ACCOUNT_EXPORT_BATCH):
+    """按批生成 NDJSON（每行一个账户，未设置ID的账户写入其位置ID，导入后ID不变）"""
+    batch = []
+    for i, acc in enumerate(accounts_data, 1):
+        if "id" not in acc:
+            acc = {"id": get_account_id(acc, i), **acc}
+        batch.append(json.dumps(acc, ensure_ascii=False, separators=(",", ":")))
+        if len(batch) >= batch_size:
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode("utf-8")
+
+
+class AccountImporter:
+    """
+    增量解析 NDJSON 账户数据
+
+    请求体按收到的数据块逐行解析和校验，只保留解析后的账户，不在内存中拼出完整请求体。
+    同一ID出现多次时以最后一行为准。未设置ID的行按非空行的序号生成ID（与按顺序加载同一份列表时一致，
+    空行不计入），require_id 为 True 时（merge 模式）未设置ID的行视为无效，避免按序号生成的ID覆盖已有账户。
+    超过 _MAX_IMPORT_LINE_BYTES 的行记为无效，超出部分直接丢弃
+    """
+
+    def __init__(self, require_id: bool = False):
+        self.require_id = require_id
+        self.accounts: Dict[str, dict] = {}
+        self.configs: Dict[str, AccountConfig] = {}
+        self.errors: List[str] = []
+        self.error_count = 0
+        self.line_count = 0  # 原始行号（含空行），用于错误提示
+        self.account_index = 0  # 非空行序号，用于生成默认ID
+        self._buffer = bytearray()
+        self._oversized = False
+
+    def feed(self, chunk: bytes):
+        """写入一个数据块，处理其中完整的行"""
+        view = memoryview(chunk)
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                self._append(view[start:])
+                return
+            self._append(view[start:end])
+            self._finish_line()
+            start = end + 1
+
+    def close(self):
+        """处理最后一行（没有换行符结尾时）"""
+        if self._buffer or self._oversized:
+            self._finish_line()
+
+    def _append(self, data: memoryview):
+        if self._oversized:
+            return
+        if len(self._buffer) + len(data) > _MAX_IMPORT_LINE_BYTES:
+            self._oversized = True
+            self._buffer.clear()
+            return
+        self._buffer += data
+
+    def _finish_line(self):
+        self.line_count += 1
+        if self._oversized:
+            self._oversized = False
+            self.account_index += 1
+            self._add_error(f"超过 {_MAX_IMPORT_LINE_BYTES // 1024} KB 单行上限")
+            return
+        raw = self._buffer.strip()
+        self._buffer.clear()
+        if raw:
+            self._parse_line(raw)
+
+    def _add_error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < _MAX_IMPORT_ERRORS:
+            self.errors.append(f"第 {self.line_count} 行: {message[:200]}")
+
+    def _parse_line(self, raw: bytes):
+        self.account_index += 1
+        try:
+            acc = json.loads(raw)
+            config = _build_account_config(acc, self.account_index)
+            if self.require_id and not acc.get("id"):
+                raise ValueError("merge 模式下账户必须包含 id")
+        except ValueError as e:
+            self._add_error(str(e))
+            return
+        if "id" not in acc:
+            acc = {"id": config.account_id, **acc}
+        self.accounts[config.account_id] = acc
+        self.configs[config.account_id] = config
+
+
+async def import_accounts(
+    importer: AccountImporter,
+    mode: str,
+    multi_account_mgr: MultiAccountManager,
+    http_client,
+    user_agent: str,
+    account_failure_threshold: int,
+    rate_limit_cooldown_seconds: int,
+    global_stats: dict
+) -> Dict[str, List[str]]:
+    """
+    应用导入的账户并保存一次
+
+    - merge: 按ID覆盖已有账户，新账户追加到末尾
+    - replace: 用导入的账户替换全部账户
+
+    已解析的配置直接应用到内存，不再重新读取存储
+
+    Returns:
+        apply_account_configs 的差异 {"added", "updated", "removed", "unchanged"}
+    """
+    if mode not in ACCOUNT_IMPORT_MODES:
+        raise ValueError(f"无效的导入模式: {mode}")
+
+    if mode == "replace":
+        accounts_data = list(importer.accounts.values())
+        configs = list(importer.configs.values())
+    else:
+        accounts_data = []
+        configs = []
+        existing = set()
+        for i, acc in enumerate(await load_accounts_from_source_async(), 1):
+            account_id = get_account_id(acc, i)
+            existing.add(account_id)
+            if account_id in importer.accounts:
+                accounts_data.append(importer.accounts[account_id])
+                configs.append(importer.configs[account_id])
+                continue
+            if "id" not in acc:
+                acc = {"id": account_id, **acc}
+            accounts_data.append(acc)
+            configs.append(_build_account_config(acc, i))
+        for account_id, acc in importer.accounts.items():
+            if account_id not in existing:
+                accounts_data.append(acc)
+                configs.append(importer.configs[account_id])
+
+    await save_accounts_to_file_async(accounts_data)
+    diff = multi_account_mgr.apply_account_configs(
+        configs,
+        http_client,
+        user_agent,
+        account_failure_threshold,
+        rate_limit_cooldown_seconds,
+        global_stats
+    )
+    _log_reload_diff(diff, multi_account_mgr)
+    return diff
@@ -14,7 +14,7 @@ import os
 import yaml
 import secrets
 from pathlib import Path
-from typing import Optional, List
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
 
@@ -74,13 +74,17 @@ class RetryConfig(BaseModel):
     account_failure_threshold: int = Field(default=3, ge=1, le=10, description="账户失败阈值")
     rate_limit_cooldown_seconds: int = Field(default=600, ge=60, le=3600, description="429冷却时间（秒）")
     session_cache_ttl_seconds: int = Field(default=3600, ge=300, le=86400, description="会话缓存时间（秒）")
+    session_cache_max_size: int = Field(default=1000, ge=100, le=1000000, description="会话缓存最大条目数")
     auto_refresh_accounts_seconds: int = Field(default=60, ge=0, le=600, description="自动刷新账号间隔（秒，0禁用）")
+    failover_context_max_chars: int = Field(default=0, ge=0, description="会话重建时上下文字符预算（0不限制）")
 
 
 class PublicDisplayConfig(BaseModel):
     """公开展示配置"""
     logo_url: str = Field(default="", description="Logo URL")
     chat_url: str = Field(default="", description="开始对话链接")
+    visitor_hourly_capacity: int = Field(default=20000, ge=100, le=1000000, description="访客统计：每小时预期独立访客数（决定 Bloom filter 大小）")
+    visitor_false_positive_rate: float = Field(default=0.01, gt=0.0, lt=0.5, description="访客统计：24 小时窗口的目标误判率")
 
 
 class SessionConfig(BaseModel):
@@ -88,6 +92,16 @@ class SessionConfig(BaseModel):
     expire_hours: int = Field(default=24, ge=1, le=168, description="Session过期时间（小时）")
 
 
+class LoggingConfig(BaseModel):
+    """日志配置"""
+    memory_capacity: int = Field(default=10000, ge=1000, le=1000000, description="内存日志容量（条）")
+    persist_enabled: bool = Field(default=False, description="是否将日志持久化到磁盘分段文件")
+    segment_max_mb: int = Field(default=16, ge=1, le=1024, description="单个日志分段大小上限（MB）")
+    segment_max_count: int = Field(default=20, ge=1, le=1000, description="保留的日志分段数量")
+    preview_sample_rate: float = Field(default=1.0, ge=0.0, le=1.0, description="内容预览日志的请求采样率（0~1）")
+    preview_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = Field(default="INFO", description="内容预览日志级别（DEBUG 时不记录）")
+
+
 class SecurityConfig(BaseModel):
     """安全配置（仅从环境变量读取，不可热更新）"""
     admin_key: str = Field(default="", description="管理员密钥（必需）")
@@ -105,6 +119,7 @@ class AppConfig(BaseModel):
     retry: RetryConfig
     public_display: PublicDisplayConfig
     session: SessionConfig
+    logging: LoggingConfig
 
 
 # ==================== 配置管理器 ====================
@@ -178,6 +193,10 @@ class ConfigManager:
             **yaml_data.get("session", {})
         )
 
+        logging_config = LoggingConfig(
+            **yaml_data.get("logging", {})
+        )
+
         # 5. 构建完整配置
         self._config = AppConfig(
             security=security_config,
@@ -185,7 +204,8 @@ class ConfigManager:
             image_generation=image_generation_config,
             retry=retry_config,
             public_display=public_display_config,
-            session=session_config
+            session=session_config,
+            logging=logging_config
         )
 
     def _load_yaml(self) -> dict:
@@ -318,11 +338,26 @@ class ConfigManager:
         """会话缓存时间（秒）"""
         return self._config.retry.session_cache_ttl_seconds
 
+    @property
+    def session_cache_max_size(self) -> int:
+        """会话缓存最大条目数"""
+        return self._config.retry.session_cache_max_size
+
     @property
     def auto_refresh_accounts_seconds(self) -> int:
         """自动刷新账号间隔（秒，0禁用）"""
         return self._config.retry.auto_refresh_accounts_seconds
 
+    @property
+    def failover_context_max_chars(self) -> int:
+        """会话重建时上下文字符预算（0不限制）"""
+        return self._config.retry.failover_context_max_chars
+
+    @property
+    def log_memory_capacity(self) -> int:
+        """内存日志容量（条）"""
+        return self._config.logging.memory_capacity
+
 
 # ==================== 全局配置管理器 ====================
 
@@ -361,4 +396,8 @@ class _ConfigProxy:
     def session(self):
         return config_manager.config.session
 
+    @property
+    def logging(self):
+        return config_manager.config.logging
+
 config = _ConfigProxy()
@@ -0,0 +1,129 @@
+"""上下文构建模块
+
+会话重建（重试、故障转移、缓存失效）时需要把历史对话作为文本发送给新 Session。
+本模块按会话键缓存已渲染的消息片段，后续只渲染新增消息，
+并按字符预算截断较早的对话轮次
+"""
+import logging
+from collections import OrderedDict
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from core.message import ConversationView
+
+logger = logging.getLogger(__name__)
+
+# 缓存的渲染片段总字符数上限（按最久未使用淘汰）
+CONTEXT_CACHE_MAX_CHARS = 16 * 1024 * 1024
+
+
+def render_message(role: str, text: str, image_count: int) -> str:
+    """渲染单条历史消息，图片以标记代替"""
+    label = "User" if role in ("user", "system") else "Assistant"
+    return f"{label}: {text}{'[图片]' * image_count}\n\n"
+
+
+class _ContextEntry:
+    __slots__ = ("prefix_hash", "segments", "chars")
+
+    def __init__(self, prefix_hash: str, segments: List[str], chars: int):
+        self.prefix_hash = prefix_hash
+        self.segments = segments
+        self.chars = chars
+
+
+class ContextBuilder:
+    """
+    故障转移上下文构建器
+
+    - 缓存：{conv_key: 已渲染片段}，历史前缀未变时只渲染新增消息；
+      只缓存片段不缓存拼接结果，按片段总字符数（而非条目数）淘汰最久未使用的会话
+    - 预算：超过 max_chars 时保留开头的 system 消息和最近的消息，
+      中间较早的轮次以一行省略标记代替
+    """
+
+    def __init__(self, max_chars: int = CONTEXT_CACHE_MAX_CHARS):
+        self.max_chars = max_chars
+        self._cache: "OrderedDict[str, _ContextEntry]" = OrderedDict()
+        self._chars = 0
+
+    def build(self, conv_key: str, view: "ConversationView", prefix_chain: List[str], max_chars: int = 0) -> str:
+        """
+        构建发送给新 Session 的完整上下文
+
+        Args:
+            conv_key: 会话键
+            view: 当前请求的消息视图
+            prefix_chain: view.prefix_chain() 的结果，用于校验缓存的历史前缀
+            max_chars: 字符预算，0 表示不限制
+        """
+        count = len(view)
+        entry = self._pop(conv_key)
+        segments = []
+        chars = 0
+
+        if entry is not None:
+            cached_count = len(entry.segments)
+            # 历史被编辑或分叉时缓存作废
+            if cached_count <= count and prefix_chain[cached_count] == entry.prefix_hash:
+                segments = entry.segments
+                chars = entry.chars
+
+        if len(segments) < count:
+            roles, texts, image_counts = view.roles, view.texts, view.image_counts
+            new_segments = [
+                render_message(roles[i], texts[i], image_counts[i])
+                for i in range(len(segments), count)
+            ]
+            segments = segments + new_segments
+            chars += sum(len(seg) for seg in new_segments)
+
+        if chars <= self.max_chars:
+            self._cache[conv_key] = _ContextEntry(prefix_chain[count], segments, chars)
+            self._chars += chars
+            while self._chars > self.max_chars:
+                _, evicted = self._cache.popitem(last=False)
+                self._chars -= evicted.chars
+        return self._apply_budget(segments, chars, view.roles, max_chars)
+
+    def _pop(self, conv_key: str):
+        entry = self._cache.pop(conv_key, None)
+        if entry is not None:
+            self._chars -= entry.chars
+        return entry
+
+    @staticmethod
+    def _apply_budget(segments: List[str], total: int, roles: List[str], max_chars: int) -> str:
+        if max_chars <= 0 or total <= max_chars:
+            return "".join(segments)
+
+        # 开头连续的 system 消息（系统提示词）在预算一半以内时保留
+        head_count = 0
+        head_chars = 0
+        while head_count < len(segments) - 1 and roles[head_count] == "system":
+            if head_chars + len(segments[head_count]) > max_chars // 2:
+                break
+            head_chars += len(segments[head_count])
+            head_count += 1
+
+        # 从最新消息往前保留，最后一条消息无论长短都保留
+        tail_start = len(segments) - 1
+        used = head_chars + len(segments[tail_start])
+        while tail_start - 1 >= head_count and used + len(segments[tail_start - 1]) <= max_chars:
+            tail_start -= 1
+            used += len(segments[tail_start])
+
+        omitted = tail_start - head_count
+        if omitted <= 0:
+            return "".join(segments)
+
+        logger.info(f"[CONTEXT] 上下文超出预算({total}/{max_chars}字符)，省略 {omitted} 条较早的消息")
+        marker = f"[已省略 {omitted} 条较早的消息]\n\n"
+        return "".join(segments[:head_count] + [marker] + segments[tail_start:])
+
+    def discard(self, conv_key: str):
+        self._pop(conv_key)
+
+    def clear(self):
+        self._cache.clear()
+        self._chars = 0
@@ -0,0 +1,93 @@
+"""会话指纹模块
+
+使用快速非加密哈希（优先 xxhash，未安装时使用 blake2b）流式计算消息指纹，
+并维护前缀哈希链，后续轮次可按最长已知前缀匹配到已缓存的会话
+"""
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional
+
+try:
+    import xxhash  # 可选依赖，安装后指纹计算更快
+except ImportError:
+    xxhash = None
+
+DIGEST_SIZE = 16  # 128 位摘要
+CHUNK_CHARS = 64 * 1024  # 长文本分块标准化，避免整段 lower() 复制
+FINGERPRINT_MESSAGES = 3  # 会话键使用的消息条数
+
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def _update_normalized(hasher, text: str):
+    """按块写入标准化文本（去除首尾空白、转小写）"""
+    start, end = 0, len(text)
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    for offset in range(start, end, CHUNK_CHARS):
+        chunk = text[offset:min(offset + CHUNK_CHARS, end)]
+        hasher.update(chunk.lower().encode("utf-8", "surrogatepass"))
+
+
+def message_digest(role: str, text: str) -> bytes:
+    """单条消息的摘要（角色+标准化文本）"""
+    hasher = _new_hasher()
+    hasher.update(role.encode("utf-8", "surrogatepass"))
+    hasher.update(b"\x00")
+    _update_normalized(hasher, text)
+    return hasher.digest()
+
+
+def chain_root(client_identifier: str = "") -> bytes:
+    """前缀哈希链的起点（只包含客户端标识）"""
+    hasher = _new_hasher()
+    hasher.update(client_identifier.encode("utf-8", "surrogatepass"))
+    return hasher.digest()
+
+
+def chain_next(prev: bytes, role: str, text: str) -> bytes:
+    """在前缀哈希后追加一条消息"""
+    hasher = _new_hasher()
+    hasher.update(prev)
+    hasher.update(message_digest(role, text))
+    return hasher.digest()
+
+
+class PrefixIndex:
+    """
+    前缀哈希 -> 会话键 的有界 LRU 索引
+
+    每次请求成功后登记本次请求完整历史的前缀哈希，下一轮请求
+    （历史 + 回复 + 新消息）即可按最长已知前缀找到同一会话
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._index: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, prefix_hash: str, conv_key: str):
+        self._index[prefix_hash] = conv_key
+        self._index.move_to_end(prefix_hash)
+        while len(self._index) > self.max_size:
+            self._index.popitem(last=False)
+
+    def longest_match(self, chain: List[str]) -> Optional[str]:
+        """从最长前缀开始查找，返回匹配到的会话键"""
+        for prefix_hash in reversed(chain):
+            conv_key = self._index.get(prefix_hash)
+            if conv_key is not None:
+                self._index.move_to_end(prefix_hash)
+                return conv_key
+        return None
+
+    def clear(self):
+        self._index.clear()
@@ -0,0 +1,225 @@
+"""账户健康事件总线
+
+账户运行时状态（429 冷却、失败计数、可用性）原本只存在于单个进程，
+多 worker 部署时一个正在被限流的账户要被每个 worker 各自撞一次才会冷却。
+本模块把健康状态变化作为事件广播给所有 worker：
+
+- PostgresHealthBus: 数据库 LISTEN/NOTIFY，适用于多副本
+- UnixSocketHealthBus: 本机 Unix 数据报套接字广播，适用于同一主机的多个 worker
+- HealthBus: 空实现（默认，单进程部署）
+
+通过环境变量 ACCOUNT_HEALTH_BUS 选择（none / postgres / unix）
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+
+from core import storage
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_RATE_LIMITED = "rate_limited"  # 429 限流，进入冷却
+EVENT_FAILED = "failed"              # 普通失败，失败计数 +1
+EVENT_RECOVERED = "recovered"        # 请求成功且之前处于异常状态
+EVENT_RESET = "reset"                # 管理员手动重置错误状态
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+HealthHandler = Callable[[dict], None]
+
+
+def make_event(account_id: str, kind: str, at: Optional[float] = None) -> dict:
+    return {
+        "account_id": account_id,
+        "kind": kind,
+        "at": at if at is not None else time.time(),
+        "origin": WORKER_ID,
+    }
+
+
+class HealthBus:
+    """事件总线接口（本身为空实现：只在本进程生效）"""
+
+    name = "none"
+
+    def __init__(self):
+        self._handler: Optional[HealthHandler] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: HealthHandler):
+        """开始接收其他 worker 的事件，handler 在应用事件循环中调用"""
+        self._handler = handler
+
+    async def stop(self):
+        pass
+
+    def publish(self, event: dict):
+        """广播事件（不等待发送完成，不抛出异常）"""
+        pass
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(event, dict) or event.get("origin") == WORKER_ID:
+            return  # 忽略自己发出的事件
+        self.received += 1
+        if self._handler is None:
+            return
+        try:
+            self._handler(event)
+        except Exception as e:
+            logger.error(f"[HEALTH] 处理账户健康事件失败: {type(e).__name__}: {str(e)[:80]}")
+
+    def stats(self) -> dict:
+        return {"bus": self.name, "published": self.published, "received": self.received}
+
+
+class PostgresHealthBus(HealthBus):
+    """
+    LISTEN/NOTIFY 事件总线
+
+    监听使用独立连接（不占用连接池），连接断开后由后台任务定期重连
+    """
+
+    name = "postgres"
+    CHANNEL = "account_health"
+    RECONNECT_SECONDS = 30
+
+    def __init__(self):
+        super().__init__()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._conn = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: HealthHandler):
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        while True:
+            if self._conn is None or self._conn.is_closed():
+                try:
+                    self._conn = await storage.run_async(
+                        storage.open_listener(self.CHANNEL, self._on_notify)
+                    )
+                    logger.info("[HEALTH] 账户健康事件监听已连接")
+                except Exception as e:
+                    self._conn = None
+                    logger.warning(f"[HEALTH] 账户健康事件监听连接失败: {str(e)[:80]}")
+            await asyncio.sleep(self.RECONNECT_SECONDS)
+
+    def _on_notify(self, payload: str):
+        # 回调可能在数据库线程中执行，统一转交给应用事件循环处理
+        self._loop.call_soon_threadsafe(self._dispatch, payload)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            try:
+                await storage.run_async(storage.close_listener(self._conn))
+            except Exception:
+                pass
+            self._conn = None
+
+    def publish(self, event: dict):
+        self.published += 1
+        storage.submit(storage.notify(self.CHANNEL, json.dumps(event)))
+
+
+class UnixSocketHealthBus(HealthBus):
+    """
+    本机 Unix 数据报套接字事件总线
+
+    每个 worker 在公共目录下绑定 <pid>.sock，广播时逐个发送给目录中的其他套接字；
+    对端已退出（连接被拒绝/文件不存在）时删除残留的套接字文件
+    """
+
+    name = "unix"
+    MAX_DATAGRAM = 4096
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+
+    async def start(self, handler: HealthHandler):
+        await super().start(handler)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(self.MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self._dispatch(data)
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def publish(self, event: dict):
+        if self._sock is None:
+            return
+        self.published += 1
+        data = json.dumps(event).encode("utf-8")
+        for peer in glob.glob(os.path.join(self.directory, "*.sock")):
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(data, peer)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except (BlockingIOError, OSError):
+                pass  # 对端接收缓冲区已满，丢弃本次事件
+
+
+def create_health_bus(socket_dir: str) -> HealthBus:
+    """按环境变量 ACCOUNT_HEALTH_BUS 创建事件总线（默认 none）"""
+    bus = os.environ.get("ACCOUNT_HEALTH_BUS", "none").strip().lower()
+    if bus == "postgres":
+        if storage.is_database_enabled():
+            logger.info("[HEALTH] 账户健康事件总线: postgres")
+            return PostgresHealthBus()
+        logger.warning("[HEALTH] ACCOUNT_HEALTH_BUS=postgres 需要配置 DATABASE_URL，不共享账户状态")
+    elif bus == "unix":
+        if hasattr(socket, "AF_UNIX"):
+            logger.info(f"[HEALTH] 账户健康事件总线: unix ({socket_dir})")
+            return UnixSocketHealthBus(socket_dir)
+        logger.warning("[HEALTH] 当前平台不支持 Unix 套接字，不共享账户状态")
+    elif bus not in ("", "none"):
+        logger.warning(f"[HEALTH] 未知的 ACCOUNT_HEALTH_BUS: {bus}，不共享账户状态")
+    return HealthBus()
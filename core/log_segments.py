@@ -0,0 +1,278 @@
+"""磁盘日志分段存储
+
+内存日志只保留最近若干条且重启即丢失。开启 logging.persist_enabled 后，
+日志条目同时以 JSON Lines 追加写入 data/logs 下的分段文件：
+
+- 分段文件 <编号>.jsonl 只追加写入，超过 segment_max_mb 后轮转到新分段，
+  超过 segment_max_count 个分段时删除最旧的分段
+- 每个分段有稀疏时间索引 <编号>.idx：每写入约 64KB 记录一次 [时间, 字节偏移]，
+  查询时从最新位置（或游标位置）所在的索引块开始逐块向前读取，凑够一页即停止，
+  按时间窗口查询时二分定位窗口终点，不需要扫描整个文件
+- 查询结果可用游标（"分段编号:偏移"）继续向前翻页
+"""
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_INTERVAL_BYTES = 64 * 1024
+_TAIL_READ_BYTES = 64 * 1024
+
+Position = Tuple[int, int]  # (分段编号, 字节偏移)
+
+
+class _Segment:
+    __slots__ = ("seg_id", "path", "idx_path", "times", "offsets", "first_time", "last_time", "size", "last_indexed")
+
+    def __init__(self, directory: str, seg_id: int):
+        self.seg_id = seg_id
+        self.path = os.path.join(directory, f"{seg_id:08d}.jsonl")
+        self.idx_path = os.path.join(directory, f"{seg_id:08d}.idx")
+        self.times: List[str] = []
+        self.offsets: List[int] = []
+        self.first_time: Optional[str] = None
+        self.last_time: Optional[str] = None
+        self.size = 0
+        self.last_indexed = -INDEX_INTERVAL_BYTES
+
+    def load(self):
+        """从磁盘恢复索引与首尾时间（启动时调用）"""
+        try:
+            with open(self.idx_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        time_str, offset = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue
+                    self.times.append(time_str)
+                    self.offsets.append(int(offset))
+        except FileNotFoundError:
+            pass
+        self.size = os.path.getsize(self.path)
+        if self.times:
+            self.first_time = self.times[0]
+            self.last_indexed = self.offsets[-1]
+        self.last_time = self._read_last_time()
+        if self.first_time is None:
+            self.first_time = self.last_time
+
+    def _read_last_time(self) -> Optional[str]:
+        with open(self.path, "rb") as f:
+            f.seek(max(0, self.size - _TAIL_READ_BYTES))
+            lines = f.read().splitlines()
+        for raw in reversed(lines):
+            try:
+                return json.loads(raw)["time"]
+            except (ValueError, KeyError, TypeError):
+                continue
+        return None
+
+
+class LogSegmentSink:
+    """日志条目的磁盘分段存储（线程安全）"""
+
+    def __init__(self, directory: str, max_segment_bytes: int, max_segments: int):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self._segments: List[_Segment] = []
+        self._file = None
+        self._idx_file = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".jsonl"):
+                    continue
+                try:
+                    segment = _Segment(self.directory, int(name[:-6]))
+                    segment.load()
+                except (ValueError, OSError) as e:
+                    logger.warning(f"[LOG] 跳过无法读取的日志分段 {name}: {e}")
+                    continue
+                self._segments.append(segment)
+            # 每次启动从新分段开始写入，不续写可能不完整的旧分段
+            self._rotate_locked()
+        logger.info(f"[LOG] 磁盘日志已启用: {self.directory}（{len(self._segments)} 个分段）")
+
+    def configure(self, max_segment_bytes: int, max_segments: int):
+        with self._lock:
+            self.max_segment_bytes = max_segment_bytes
+            self.max_segments = max_segments
+            self._prune_locked()
+
+    def close(self):
+        with self._lock:
+            self._close_files_locked()
+
+    def _close_files_locked(self):
+        for f in (self._file, self._idx_file):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._file = None
+        self._idx_file = None
+
+    def _rotate_locked(self):
+        self._close_files_locked()
+        seg_id = self._segments[-1].seg_id + 1 if self._segments else 1
+        segment = _Segment(self.directory, seg_id)
+        self._file = open(segment.path, "ab")
+        self._idx_file = open(segment.idx_path, "a", encoding="utf-8")
+        self._segments.append(segment)
+        self._prune_locked()
+
+    def _prune_locked(self):
+        while len(self._segments) > max(self.max_segments, 1):
+            segment = self._segments.pop(0)
+            for path in (segment.path, segment.idx_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def append(self, entry: dict):
+        data = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                return  # 已关闭
+            segment = self._segments[-1]
+            if segment.size and segment.size + len(data) > self.max_segment_bytes:
+                self._rotate_locked()
+                segment = self._segments[-1]
+            time_str = entry["time"]
+            if segment.size - segment.last_indexed >= INDEX_INTERVAL_BYTES:
+                segment.times.append(time_str)
+                segment.offsets.append(segment.size)
+                segment.last_indexed = segment.size
+                self._idx_file.write(json.dumps([time_str, segment.size]) + "\n")
+                self._idx_file.flush()
+            self._file.write(data)
+            self._file.flush()
+            segment.size += len(data)
+            if segment.first_time is None:
+                segment.first_time = time_str
+            segment.last_time = time_str
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "segments": len(self._segments),
+                "bytes": sum(s.size for s in self._segments),
+                "first_time": self._segments[0].first_time if self._segments else None,
+                "last_time": next((s.last_time for s in reversed(self._segments) if s.last_time), None),
+            }
+
+    def query(
+        self,
+        limit: int,
+        level: Optional[str] = None,
+        search: Optional[str] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        before: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        查询时间窗口内最近的 limit 条日志
+
+        从最新位置（或游标位置）开始，借助稀疏索引按块向前读取，凑够一页即停止，
+        每页的读取量与页大小成正比，与分段大小无关
+
+        返回 (条目列表（旧到新）, 下一页游标)；游标格式为 "分段编号:偏移"
+        """
+        before_pos = parse_cursor(before)
+        search = search.lower() if search else None
+        with self._lock:
+            segments = [
+                (s.seg_id, s.path, s.size, list(s.times), list(s.offsets))
+                for s in self._segments
+                if s.first_time is not None
+                and (not start_time or s.last_time >= start_time)
+                and (not end_time or s.first_time <= end_time)
+                and (before_pos is None or s.seg_id <= before_pos[0])
+            ]
+
+        collected: deque = deque()
+        for seg_id, path, size, times, offsets in reversed(segments):
+            stop = size
+            if before_pos is not None and seg_id == before_pos[0]:
+                stop = min(stop, before_pos[1])
+            if end_time:
+                # 索引点时间晚于窗口终点时，其后的条目都不在窗口内
+                j = bisect_right(times, end_time)
+                if j < len(offsets):
+                    stop = min(stop, offsets[j])
+            # 从不晚于 stop 的最近索引点开始，逐块向前
+            k = bisect_left(offsets, stop) - 1
+            while stop > 0 and len(collected) <= limit:
+                block_start = offsets[k] if k >= 0 else 0
+                matches = self._scan(
+                    path, seg_id, block_start, stop, level, search, start_time, end_time,
+                    limit + 1 - len(collected)
+                )
+                collected.extendleft(reversed(matches))
+                if k < 0 or (start_time and times[k] < start_time):
+                    break  # 已到分段开头，或更早的块都在窗口起点之前
+                stop = block_start
+                k -= 1
+            if len(collected) > limit:
+                break
+
+        has_more = len(collected) > limit
+        while len(collected) > limit:
+            collected.popleft()
+        next_cursor = None
+        if has_more and collected:
+            seg_id, offset = collected[0][0]
+            next_cursor = f"{seg_id}:{offset}"
+        return [entry for _, entry in collected], next_cursor
+
+    @staticmethod
+    def _scan(path, seg_id, offset, stop, level, search, start_time, end_time, keep) -> List[Tuple[Position, dict]]:
+        """顺序读取 [offset, stop) 内的条目，保留最后 keep 条匹配"""
+        matches: deque = deque(maxlen=keep)
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                pos = offset
+                while pos < stop:
+                    raw = f.readline()
+                    if not raw:
+                        break
+                    line_pos = pos
+                    pos += len(raw)
+                    try:
+                        entry = json.loads(raw)
+                    except ValueError:
+                        continue  # 未写完整的行
+                    time_str = entry.get("time", "")
+                    if start_time and time_str < start_time:
+                        continue
+                    if end_time and time_str > end_time:
+                        break
+                    if level and entry.get("level") != level:
+                        continue
+                    if search and search not in entry.get("message", "").lower():
+                        continue
+                    matches.append(((seg_id, line_pos), entry))
+        except FileNotFoundError:
+            pass  # 分段已被轮转删除
+        return list(matches)
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Position]:
+    """解析 "分段编号:偏移" 游标，格式错误时抛出 ValueError"""
+    if not cursor:
+        return None
+    seg_id, _, offset = cursor.partition(":")
+    return int(seg_id), int(offset)
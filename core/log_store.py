@@ -0,0 +1,397 @@
+"""结构化日志存储
+
+日志调用通过 extra= 携带结构化字段：
+
+    logger.info("...", extra={"request_id": rid, "account_id": aid, "event": "request_start"})
+
+LogStore 以环形缓冲区保存日志条目，写入时同步维护索引：
+- 按 request_id 分组，按请求查询时间线只需 O(结果)，无需对消息文本做正则解析
+- 按级别分列，每列按写入（时间）顺序排列，时间范围用二分查找定位
+- 预先计算小写消息文本，关键字搜索只扫描时间范围内的条目且凑够一页即停止
+- 每个条目有递增序号，管理面板用序号作为游标向前翻页
+
+写入走队列：请求路径上的 LogQueueHandler 只把原始 LogRecord 放入队列，
+由 QueueListener 后台线程完成格式化、建索引和落盘（见 start_log_pipeline）
+
+消息内容预览（用户消息、发送内容、AI 响应）通过 PreviewSampler 按请求采样，
+未被采样的请求不产生日志记录，被采样的预览也只在后台线程截断和格式化
+"""
+import hashlib
+import logging
+import queue
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_LOG_CAPACITY = 10000
+
+# 结构化字段：request_id / account_id / event，其余附加数据放在 data 中
+LOG_FIELDS = ("request_id", "account_id", "event")
+
+_BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def log_extra(
+    request_id: Optional[str] = None,
+    account_id: Optional[str] = None,
+    event: Optional[str] = None,
+    **data,
+) -> dict:
+    """构造 logger 调用的 extra 参数"""
+    extra = {"request_id": request_id, "account_id": account_id, "event": event}
+    if data:
+        extra["log_data"] = data
+    return extra
+
+
+class _Column:
+    """
+    按写入顺序排列的条目列
+
+    seqs/times/texts/entries 为平行列表，头部淘汰只移动 start（摊还 O(1)），
+    因此可以直接在列表上二分
+    """
+
+    __slots__ = ("seqs", "times", "texts", "entries", "start")
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.times: List[str] = []
+        self.texts: List[str] = []
+        self.entries: List[dict] = []
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.start
+
+    def append(self, seq: int, entry: dict, text: str):
+        self.seqs.append(seq)
+        self.times.append(entry["time"])
+        self.texts.append(text)
+        self.entries.append(entry)
+
+    def popleft(self) -> dict:
+        entry = self.entries[self.start]
+        self.entries[self.start] = None
+        self.start += 1
+        if self.start > 1024 and self.start * 2 > len(self.seqs):
+            del self.seqs[:self.start]
+            del self.times[:self.start]
+            del self.texts[:self.start]
+            del self.entries[:self.start]
+            self.start = 0
+        return entry
+
+    def tail(self, count: int) -> List[dict]:
+        return self.entries[max(self.start, len(self.entries) - count):]
+
+    def search(
+        self,
+        limit: int,
+        before: Optional[int] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[List[Tuple[int, dict]], bool]:
+        """从新到旧扫描，返回 ([(序号, 条目)...]（新到旧）, 是否还有更早的匹配)"""
+        lo = self.start
+        hi = len(self.seqs)
+        if start_time:
+            lo = bisect_left(self.times, start_time, lo, hi)
+        if end_time:
+            hi = bisect_right(self.times, end_time, lo, hi)
+        if before is not None:
+            hi = bisect_left(self.seqs, before, lo, hi)
+        result = []
+        for i in range(hi - 1, lo - 1, -1):
+            if search and search not in self.texts[i]:
+                continue
+            if len(result) >= limit:
+                return result, True
+            result.append((self.seqs[i], self.entries[i]))
+        return result, False
+
+
+class LogStore:
+    """
+    日志环形缓冲区 + 索引
+
+    - 条目为 dict：time、level、message，以及存在时的 request_id、account_id、event、data
+    - _all / _by_level: 全部条目及按级别拆分的条目列，用于管理面板查询
+    - _by_request: {request_id: [条目...]}，按请求首次出现顺序排列
+    条目被挤出缓冲区时同步从所有索引中移除
+    """
+
+    def __init__(self, capacity: int = DEFAULT_LOG_CAPACITY):
+        self._capacity = capacity
+        self._all = _Column()
+        self._by_level: Dict[str, _Column] = {}
+        self._by_request: Dict[str, deque] = {}
+        self._event_counts: Dict[str, int] = {}
+        self._next_seq = 1
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[dict], None]] = []
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """注册请求条目监听器：带 request_id 的条目写入后调用（在锁外）"""
+        self._listeners.append(callback)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def append(self, entry: dict):
+        with self._lock:
+            self._append_locked(self._next_seq, entry)
+            self._next_seq += 1
+        if entry.get("request_id"):
+            for callback in self._listeners:
+                callback(entry)
+
+    def _append_locked(self, seq: int, entry: dict):
+        if len(self._all) >= self._capacity:
+            self._evict_oldest()
+        text = entry["message"].lower()
+        self._all.append(seq, entry, text)
+        level = entry["level"]
+        column = self._by_level.get(level)
+        if column is None:
+            column = self._by_level[level] = _Column()
+        column.append(seq, entry, text)
+        event = entry.get("event")
+        if event:
+            self._event_counts[event] = self._event_counts.get(event, 0) + 1
+        request_id = entry.get("request_id")
+        if request_id:
+            bucket = self._by_request.get(request_id)
+            if bucket is None:
+                bucket = self._by_request[request_id] = deque()
+            bucket.append(entry)
+
+    def _evict_oldest(self):
+        entry = self._all.popleft()
+        # 被挤出的一定是该级别/该请求最旧的条目
+        self._by_level[entry["level"]].popleft()
+        event = entry.get("event")
+        if event:
+            self._event_counts[event] -= 1
+        request_id = entry.get("request_id")
+        if request_id:
+            bucket = self._by_request.get(request_id)
+            if bucket:
+                bucket.popleft()
+                if not bucket:
+                    del self._by_request[request_id]
+
+    def resize(self, capacity: int):
+        """调整容量（缩小时淘汰最旧条目，保留原有序号）"""
+        with self._lock:
+            self._capacity = capacity
+            while len(self._all) > capacity:
+                self._evict_oldest()
+
+    def query(
+        self,
+        limit: int,
+        level: Optional[str] = None,
+        search: Optional[str] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        before: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        按条件查询一页日志
+
+        返回 (条目列表（旧到新）, 下一页游标)；下一页游标为本页最早条目的序号，
+        作为 before 传入即可继续向前翻页，没有更早的匹配时为 None
+        """
+        with self._lock:
+            column = self._by_level.get(level) if level else self._all
+            if column is None:
+                return [], None
+            matches, has_more = column.search(
+                limit,
+                before=before,
+                start_time=start_time,
+                end_time=end_time,
+                search=search.lower() if search else None,
+            )
+        matches.reverse()
+        next_cursor = matches[0][0] if has_more and matches else None
+        return [entry for _, entry in matches], next_cursor
+
+    def level_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {level: len(column) for level, column in self._by_level.items() if len(column)}
+
+    def event_count(self, event: str) -> int:
+        with self._lock:
+            return self._event_counts.get(event, 0)
+
+    def recent_by_levels(self, levels, count: int) -> List[dict]:
+        """指定级别中最近的 count 条（旧到新）"""
+        with self._lock:
+            merged = []
+            for level in levels:
+                column = self._by_level.get(level)
+                if column is not None:
+                    start = max(column.start, len(column.seqs) - count)
+                    merged.extend(zip(column.seqs[start:], column.entries[start:]))
+        merged.sort(key=lambda pair: pair[0])
+        return [entry for _, entry in merged[-count:]]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return self._all.tail(len(self._all))
+
+    def by_request(self, request_id: str) -> List[dict]:
+        with self._lock:
+            return list(self._by_request.get(request_id, ()))
+
+    def recent_requests(self, limit: int) -> List[Tuple[str, List[dict]]]:
+        """最近出现的 limit 个请求及其条目（新到旧）"""
+        result = []
+        with self._lock:
+            for request_id in reversed(self._by_request):
+                if len(result) >= limit:
+                    break
+                result.append((request_id, list(self._by_request[request_id])))
+        return result
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._all)
+            self._all = _Column()
+            self._by_level.clear()
+            self._by_request.clear()
+            self._event_counts.clear()
+            return count
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.snapshot())
+
+
+class LogStoreHandler(logging.Handler):
+    """把日志记录转换为结构化条目写入 LogStore（以及可选的磁盘分段存储 sink）"""
+
+    def __init__(self, store: LogStore, sink=None):
+        super().__init__()
+        self.store = store
+        self.sink = sink
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            entry = {
+                # 北京时间（UTC+8）
+                "time": datetime.fromtimestamp(record.created, tz=_BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+                "level": record.levelname,
+                "message": record.getMessage(),
+            }
+            for field in LOG_FIELDS:
+                value = getattr(record, field, None)
+                if value is not None:
+                    entry[field] = value
+            data = getattr(record, "log_data", None)
+            if data:
+                entry["data"] = data
+            self.store.append(entry)
+            sink = self.sink
+            if sink is not None:
+                sink.append(entry)
+        except Exception:
+            self.handleError(record)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    只入队的日志处理器
+
+    标准 QueueHandler.prepare 会在调用线程格式化消息并复制记录；
+    这里直接放入原始记录，格式化全部交给后台线程
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_log_pipeline(target_logger: logging.Logger, *handlers: logging.Handler) -> QueueListener:
+    """
+    把 target_logger 的输出改为经队列交给后台线程的 handlers 处理
+
+    target_logger 不再向上传递给根日志器，需要控制台输出时把根日志器的处理器一并传入
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    target_logger.addHandler(LogQueueHandler(log_queue))
+    target_logger.propagate = False
+    listener.start()
+    return listener
+
+
+PREVIEW_MAX_CHARS = 500
+
+
+class _Preview:
+    """延迟格式化的内容预览（只在日志被写入时才截断/转换为字符串）"""
+
+    __slots__ = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+    def __str__(self) -> str:
+        content = self.content
+        if content is None or content == "":
+            return "[空消息]"
+        if not isinstance(content, str):
+            return f"[多模态: {len(content)}部分]"
+        if len(content) > PREVIEW_MAX_CHARS:
+            return content[:PREVIEW_MAX_CHARS] + "...(已截断)"
+        return content
+
+
+class PreviewSampler:
+    """
+    内容预览日志采样
+
+    - level: 预览日志的级别，低于日志器级别时（如 DEBUG）完全不记录
+    - rate: 请求采样率（0~1），按 request_id 哈希决定，同一请求的所有预览同进同出
+    """
+
+    def __init__(self, target_logger: logging.Logger, rate: float = 1.0, level: str = "INFO"):
+        self.logger = target_logger
+        self.rate = 1.0
+        self.level = logging.INFO
+        self.configure(rate, level)
+
+    def configure(self, rate: float, level: str):
+        self.rate = min(max(float(rate), 0.0), 1.0)
+        resolved = logging.getLevelName(level)
+        if not isinstance(resolved, int):
+            raise ValueError(f"无效的日志级别: {level}")
+        self.level = resolved
+
+    def sampled(self, request_id: str) -> bool:
+        if self.rate <= 0 or not self.logger.isEnabledFor(self.level):
+            return False
+        if self.rate >= 1:
+            return True
+        digest = hashlib.blake2b(request_id.encode("utf-8"), digest_size=4).digest()
+        return int.from_bytes(digest, "big") < self.rate * 0x100000000
+
+    def log(self, tag: str, request_id: str, account_id: Optional[str], label: str, content):
+        """记录一条内容预览：未采样时直接返回，消息在后台线程格式化"""
+        if not self.sampled(request_id):
+            return
+        self.logger.log(
+            self.level,
+            "%s [%s] [req_%s] %s: %s",
+            tag, account_id, request_id, label, _Preview(content),
+            extra=log_extra(request_id, account_id),
+        )
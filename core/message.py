@@ -5,19 +5,30 @@
 import asyncio
 import base64
 import hashlib
+import json
 import logging
-import re
-from typing import List, TYPE_CHECKING
+import os
+from typing import List, Optional
 
+import aiofiles
 import httpx
 
-if TYPE_CHECKING:
-    from main import Message
+from core.context import render_message
+from core.fingerprint import FINGERPRINT_MESSAGES, chain_next, chain_root
 
 logger = logging.getLogger(__name__)
 
+# URL 文件下载限制
+MAX_URL_FILE_BYTES = 20 * 1024 * 1024  # 单个文件最大 20MB
+URL_FETCH_TIMEOUT_SECONDS = 30
+URL_FETCH_MAX_CONNECTIONS = 10  # 独立连接池，避免慢速远端占满对话连接池
+URL_CACHE_MAX_FILES = 200  # 磁盘缓存最多保留的文件数
 
-def get_conversation_key(messages: List[dict], client_identifier: str = "") -> str:
+# Data URI 头部（data:mime;base64,）最大长度，只在此范围内查找逗号
+DATA_URI_HEADER_MAX = 256
+
+
+def get_conversation_key(messages, client_identifier: str = "") -> str:
     """
     生成对话指纹（使用前3条消息+客户端标识，确保唯一性）
 
@@ -27,37 +38,10 @@ def get_conversation_key(messages: List[dict], client_identifier: str = "") -> s
     3. 保持Session复用能力（同一用户的后续消息仍能找到同一Session）
 
     Args:
-        messages: 消息列表
+        messages: 消息列表（Message 对象或字典）或 ConversationView
         client_identifier: 客户端标识（如IP地址或request_id），用于区分不同用户
     """
-    if not messages:
-        return f"{client_identifier}:empty" if client_identifier else "empty"
-
-    # 提取前3条消息的关键信息（角色+内容）
-    message_fingerprints = []
-    for msg in messages[:3]:  # 只取前3条
-        role = msg.get("role", "")
-        content = msg.get("content", "")
-
-        # 统一处理内容格式（字符串或数组）
-        if isinstance(content, list):
-            # 多模态消息：只提取文本部分
-            text = extract_text_from_content(content)
-        else:
-            text = str(content)
-
-        # 标准化：去除首尾空白，转小写
-        text = text.strip().lower()
-
-        # 组合角色和内容
-        message_fingerprints.append(f"{role}:{text}")
-
-    # 使用前3条消息+客户端标识生成指纹
-    conversation_prefix = "|".join(message_fingerprints)
-    if client_identifier:
-        conversation_prefix = f"{client_identifier}|{conversation_prefix}"
-
-    return hashlib.md5(conversation_prefix.encode()).hexdigest()
+    return ConversationView.of(messages).conversation_key(client_identifier)
 
 
 def extract_text_from_content(content) -> str:
@@ -74,30 +58,385 @@ def extract_text_from_content(content) -> str:
         return str(content)
 
 
-async def parse_last_message(messages: List['Message'], http_client: httpx.AsyncClient, request_id: str = ""):
+class ConversationView:
+    """
+    请求消息的规范化视图
+
+    每条消息的文本、图片数量等只在首次访问时提取一次，
+    会话指纹、上下文拼接和最后一条消息解析共享同一份结果，
+    避免对整段对话反复 model_dump 和提取文本
+    """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self._roles: Optional[List[str]] = None
+        self._texts: Optional[List[str]] = None
+        self._image_counts: Optional[List[int]] = None
+        self._chains: dict = {}  # {client_identifier: [前缀摘要, ...]}
+
+    @classmethod
+    def of(cls, messages) -> "ConversationView":
+        """已是视图则直接返回，否则包装消息列表"""
+        if isinstance(messages, cls):
+            return messages
+        return cls(messages or [])
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def _normalize(self):
+        roles, texts, image_counts = [], [], []
+        for msg in self.messages:
+            if isinstance(msg, dict):
+                role, content = msg.get("role", ""), msg.get("content", "")
+            else:
+                role, content = msg.role, msg.content
+            roles.append(role)
+            texts.append(extract_text_from_content(content))
+            image_counts.append(
+                sum(1 for part in content if part.get("type") == "image_url")
+                if isinstance(content, list) else 0
+            )
+        self._roles, self._texts, self._image_counts = roles, texts, image_counts
+
+    @property
+    def roles(self) -> List[str]:
+        if self._roles is None:
+            self._normalize()
+        return self._roles
+
+    @property
+    def texts(self) -> List[str]:
+        """每条消息提取出的纯文本"""
+        if self._texts is None:
+            self._normalize()
+        return self._texts
+
+    @property
+    def image_counts(self) -> List[int]:
+        """每条消息中的图片/文件数量"""
+        if self._image_counts is None:
+            self._normalize()
+        return self._image_counts
+
+    @property
+    def last_content(self):
+        """最后一条消息的原始 content"""
+        if not self.messages:
+            return None
+        msg = self.messages[-1]
+        return msg.get("content", "") if isinstance(msg, dict) else msg.content
+
+    def _chain(self, client_identifier: str, length: int) -> List[bytes]:
+        """按需延伸前缀哈希链，chain[i] 为前 i 条消息的前缀摘要"""
+        chain = self._chains.get(client_identifier)
+        if chain is None:
+            chain = self._chains[client_identifier] = [chain_root(client_identifier)]
+        roles, texts = self.roles, self.texts
+        while len(chain) <= length:
+            i = len(chain) - 1
+            chain.append(chain_next(chain[-1], roles[i], texts[i]))
+        return chain
+
+    def prefix_chain(self, client_identifier: str = "") -> List[str]:
+        """完整前缀哈希链（十六进制），长度为消息数+1"""
+        return [digest.hex() for digest in self._chain(client_identifier, len(self.messages))]
+
+    def conversation_key(self, client_identifier: str = "") -> str:
+        """会话指纹：前3条消息（标准化后）+客户端标识的前缀哈希"""
+        if not self.messages:
+            return f"{client_identifier}:empty" if client_identifier else "empty"
+        length = min(FINGERPRINT_MESSAGES, len(self.messages))
+        return self._chain(client_identifier, length)[length].hex()
+
+    def context_text(self) -> str:
+        """拼接全部历史文本，图片以标记代替"""
+        return "".join(
+            render_message(role, text, image_count)
+            for role, text, image_count in zip(self.roles, self.texts, self.image_counts)
+        )
+
+
+def split_data_uri(url: str) -> Optional[tuple]:
+    """
+    拆分 base64 Data URI（data:mime/type;base64,xxxxxx）
+
+    只解析头部，不扫描也不复制 base64 数据
+
+    Returns:
+        (mime, payload_offset) 元组，不是 base64 Data URI 时返回 None
+    """
+    if not url.startswith("data:"):
+        return None
+    comma = url.find(",", 5, 5 + DATA_URI_HEADER_MAX)
+    if comma < 0 or comma + 1 >= len(url):
+        return None
+    header = url[5:comma]
+    if not header.endswith(";base64"):
+        return None
+    mime = header[:-len(";base64")].split(";", 1)[0]
+    if not mime:
+        return None
+    return mime, comma + 1
+
+
+class FileAttachment:
+    """
+    待上传的文件附件
+
+    Data URI 附件只记录原始字符串和数据偏移量，base64 数据在首次访问
+    data 时才切片，未被上传的附件不会产生任何拷贝
+    """
+    __slots__ = ("mime", "_source", "_offset", "_data")
+
+    def __init__(self, mime: str, data: Optional[str] = None, source: Optional[str] = None, offset: int = 0):
+        self.mime = mime
+        self._data = data
+        self._source = source
+        self._offset = offset
+
+    @classmethod
+    def from_data_uri(cls, url: str) -> Optional["FileAttachment"]:
+        parsed = split_data_uri(url)
+        if parsed is None:
+            return None
+        mime, offset = parsed
+        return cls(mime, source=url, offset=offset)
+
+    @property
+    def data(self) -> str:
+        """base64 数据（延迟切片，结果会被缓存供重试复用）"""
+        if self._data is None:
+            self._data = self._source[self._offset:]
+            self._source = None
+        return self._data
+
+    @property
+    def encoded_size(self) -> int:
+        """base64 数据长度（不触发切片）"""
+        if self._data is not None:
+            return len(self._data)
+        return len(self._source) - self._offset
+
+    def decode(self) -> bytes:
+        """解码为原始字节（仅在需要时调用）"""
+        return base64.b64decode(self.data)
+
+
+class UrlFileTooLarge(Exception):
+    """URL 文件超过大小限制"""
+
+
+class UrlFileFetcher:
+    """URL 文件下载器
+
+    - 使用独立的有界连接池，慢速远端不会占用对话连接池
+    - 流式下载，超过大小限制立即中断
+    - 边下载边计算哈希并增量 base64 编码
+    - 按 URL+ETag 缓存到磁盘，重复引用时通过 If-None-Match 复用
+    """
+
+    def __init__(
+        self,
+        proxy: str = "",
+        cache_dir: Optional[str] = None,
+        max_bytes: int = MAX_URL_FILE_BYTES,
+        max_connections: int = URL_FETCH_MAX_CONNECTIONS,
+    ):
+        self.proxy = proxy
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """延迟创建专用 HTTP 客户端"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                proxy=self.proxy or None,
+                verify=False,
+                http2=False,
+                follow_redirects=True,
+                timeout=httpx.Timeout(URL_FETCH_TIMEOUT_SECONDS, connect=10.0),
+                limits=httpx.Limits(
+                    max_keepalive_connections=self.max_connections,
+                    max_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def update_proxy(self, proxy: str):
+        """代理变化时重建客户端"""
+        if proxy == self.proxy:
+            return
+        self.proxy = proxy
+        await self.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def _cache_paths(self, url: str) -> tuple:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            os.path.join(self.cache_dir, f"{key}.json"),
+            os.path.join(self.cache_dir, f"{key}.b64"),
+        )
+
+    async def _load_cache_meta(self, url: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        meta_path, data_path = self._cache_paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(data_path)):
+            return None
+        try:
+            async with aiofiles.open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.loads(await f.read())
+            if meta.get("url") != url or not meta.get("etag"):
+                return None
+            return meta
+        except Exception:
+            return None
+
+    async def _read_cache_data(self, url: str) -> Optional[str]:
+        _, data_path = self._cache_paths(url)
+        try:
+            async with aiofiles.open(data_path, "r", encoding="ascii") as f:
+                data = await f.read()
+            os.utime(data_path)  # 刷新 mtime，用于按最近使用清理
+            return data
+        except Exception:
+            return None
+
+    async def _save_cache(self, url: str, meta: dict, b64: str):
+        if not self.cache_dir:
+            return
+        meta_path, data_path = self._cache_paths(url)
+        try:
+            async with aiofiles.open(data_path, "w", encoding="ascii") as f:
+                await f.write(b64)
+            async with aiofiles.open(meta_path, "w", encoding="utf-8") as f:
+                await f.write(json.dumps(meta, ensure_ascii=False))
+            self._prune_cache()
+        except Exception as e:
+            logger.warning(f"[FILE] URL缓存写入失败: {type(e).__name__}: {str(e)[:80]}")
+
+    def _prune_cache(self):
+        """超过缓存文件上限时，按最近使用时间删除最旧的条目"""
+        data_files = [
+            entry for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".b64")
+        ]
+        overflow = len(data_files) - URL_CACHE_MAX_FILES
+        if overflow <= 0:
+            return
+        data_files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in data_files[:overflow]:
+            base = entry.path[:-len(".b64")]
+            for path in (entry.path, f"{base}.json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def _stream_body(self, resp: httpx.Response) -> tuple:
+        """流式读取响应体，增量计算 sha256 和 base64，超限时抛出 UrlFileTooLarge"""
+        content_length = resp.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise UrlFileTooLarge(f"{content_length} bytes")
+
+        hasher = hashlib.sha256()
+        encoded_parts = []
+        pending = b""
+        size = 0
+        async for chunk in resp.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise UrlFileTooLarge(f">{self.max_bytes} bytes")
+            hasher.update(chunk)
+            # base64 以 3 字节为一组编码，余数留到下一块
+            buf = pending + chunk if pending else chunk
+            cut = len(buf) - len(buf) % 3
+            if cut:
+                encoded_parts.append(base64.b64encode(buf[:cut]))
+            pending = buf[cut:]
+        if pending:
+            encoded_parts.append(base64.b64encode(pending))
+        return b"".join(encoded_parts).decode("ascii"), hasher.hexdigest(), size
+
+    async def fetch(self, url: str, request_id: str = "", use_cache: bool = True) -> Optional[dict]:
+        """下载 URL 文件，返回 {"mime": str, "data": str_base64}，失败返回 None"""
+        cached = await self._load_cache_meta(url) if use_cache else None
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        cache_missing = False
+
+        try:
+            async with self._get_client().stream("GET", url, headers=headers) as resp:
+                if resp.status_code == 304 and cached:
+                    data = await self._read_cache_data(url)
+                    if data is not None:
+                        logger.info(f"[FILE] [req_{request_id}] URL文件命中缓存: {url[:50]}... ({cached.get('size', 0)} bytes, {cached['mime']})")
+                        return {"mime": cached["mime"], "data": data}
+                    # 缓存数据已丢失，稍后不带条件头重新下载
+                    cache_missing = True
+                elif resp.status_code == 404:
+                    logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
+                    return None
+                else:
+                    resp.raise_for_status()
+                    content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
+                    b64, digest, size = await self._stream_body(resp)
+                    etag = resp.headers.get("etag")
+        except UrlFileTooLarge as e:
+            logger.warning(f"[FILE] [req_{request_id}] URL文件超过大小限制({self.max_bytes} bytes)，已跳过: {url[:50]}... ({e})")
+            return None
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code if e.response else "unknown"
+            logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({status_code}): {url[:50]}... - {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败: {url[:50]}... - {e}")
+            return None
+
+        if cache_missing:
+            return await self.fetch(url, request_id, use_cache=False)
+
+        logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({size} bytes, {content_type})")
+        if etag:
+            await self._save_cache(url, {
+                "url": url,
+                "etag": etag,
+                "mime": content_type,
+                "sha256": digest,
+                "size": size,
+            }, b64)
+        return {"mime": content_type, "data": b64}
+
+
+async def parse_last_message(messages, fetcher: "UrlFileFetcher", request_id: str = ""):
     """解析最后一条消息，分离文本和文件（支持图片、PDF、文档等，base64 和 URL）"""
-    if not messages:
+    view = ConversationView.of(messages)
+    if not view.messages:
         return "", []
 
-    last_msg = messages[-1]
-    content = last_msg.content
+    content = view.last_content
 
-    text_content = ""
-    images = [] # List of {"mime": str, "data": str_base64} - 兼容变量名，实际支持所有文件
+    images: List[FileAttachment] = []  # 兼容变量名，实际支持所有文件
     image_urls = []  # 需要下载的 URL - 兼容变量名，实际支持所有文件
 
-    if isinstance(content, str):
-        text_content = content
-    elif isinstance(content, list):
+    # 文本部分直接复用视图中已提取的结果
+    text_content = view.texts[-1]
+    if isinstance(content, list):
         for part in content:
-            if part.get("type") == "text":
-                text_content += part.get("text", "")
-            elif part.get("type") == "image_url":
+            if part.get("type") == "image_url":
                 url = part.get("image_url", {}).get("url", "")
                 # 解析 Data URI: data:mime/type;base64,xxxxxx (支持所有 MIME 类型)
-                match = re.match(r"data:([^;]+);base64,(.+)", url)
-                if match:
-                    images.append({"mime": match.group(1), "data": match.group(2)})
+                attachment = FileAttachment.from_data_uri(url)
+                if attachment:
+                    images.append(attachment)
                 elif url.startswith(("http://", "https://")):
                     image_urls.append(url)
                 else:
@@ -105,50 +444,18 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
 
     # 并行下载所有 URL 文件（支持图片、PDF、文档等）
     if image_urls:
-        async def download_url(url: str):
-            try:
-                resp = await http_client.get(url, timeout=30, follow_redirects=True)
-                if resp.status_code == 404:
-                    logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
-                    return None
-                resp.raise_for_status()
-                content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
-                # 移除图片类型限制，支持所有文件类型
-                b64 = base64.b64encode(resp.content).decode()
-                logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({len(resp.content)} bytes, {content_type})")
-                return {"mime": content_type, "data": b64}
-            except httpx.HTTPStatusError as e:
-                status_code = e.response.status_code if e.response else "unknown"
-                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({status_code}): {url[:50]}... - {e}")
-                return None
-            except Exception as e:
-                logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败: {url[:50]}... - {e}")
-                return None
-
-        results = await asyncio.gather(*[download_url(u) for u in image_urls], return_exceptions=True)
+        results = await asyncio.gather(*[fetcher.fetch(u, request_id) for u in image_urls], return_exceptions=True)
         safe_results = []
         for result in results:
             if isinstance(result, Exception):
                 logger.warning(f"[FILE] [req_{request_id}] URL文件下载异常: {type(result).__name__}: {str(result)[:120]}")
                 continue
             safe_results.append(result)
-        images.extend([r for r in safe_results if r])
+        images.extend([FileAttachment(r["mime"], r["data"]) for r in safe_results if r])
 
     return text_content, images
 
 
-def build_full_context_text(messages: List['Message']) -> str:
+def build_full_context_text(messages) -> str:
     """仅拼接历史文本，图片只处理当次请求的"""
-    prompt = ""
-    for msg in messages:
-        role = "User" if msg.role in ["user", "system"] else "Assistant"
-        content_str = extract_text_from_content(msg.content)
-
-        # 为多模态消息添加图片标记
-        if isinstance(msg.content, list):
-            image_count = sum(1 for part in msg.content if part.get("type") == "image_url")
-            if image_count > 0:
-                content_str += "[图片]" * image_count
-
-        prompt += f"{role}: {content_str}\n\n"
-    return prompt
+    return ConversationView.of(messages).context_text()
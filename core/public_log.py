@@ -0,0 +1,124 @@
+"""公开日志时间线
+
+/public/log 是无需登录的接口，公开看板会频繁轮询。时间线在请求进行/结束时增量维护：
+
+- 日志存储写入带 request_id 的关键事件/错误时只把该请求标记为待更新
+- 请求结束时写入的统计记录（recent_conversations）直接放入时间线
+- 响应体按 limit 缓存，时间线未变化或仍在短 TTL 内时直接复用，
+  并生成 ETag，客户端带 If-None-Match 时返回 304
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+TimelineBuilder = Callable[[str, List[dict]], Optional[dict]]
+
+
+def _timeline_ts(item: dict) -> float:
+    if "start_ts" in item:
+        return float(item["start_ts"])
+    try:
+        return datetime.strptime(item.get("start_time", ""), "%Y-%m-%d %H:%M:%S").timestamp()
+    except Exception:
+        return 0.0
+
+
+class PublicLogTimeline:
+    """
+    请求时间线（request_id -> 时间线）
+
+    - 日志推导的时间线包含重试/切换等细节，优先于请求结束时保存的统计记录
+    - 日志条目被挤出缓冲区后保留已构建的时间线，最多保留 capacity 个请求
+    """
+
+    def __init__(self, log_store, builder: TimelineBuilder, capacity: int = 1000, ttl_seconds: float = 2.0):
+        self._log_store = log_store
+        self._builder = builder
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._items: Dict[str, dict] = {}
+        self._from_log: set = set()
+        self._dirty: set = set()
+        self._version = 0
+        self._cache: Dict[int, Tuple[int, float, bytes, str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def on_log_entry(self, entry: dict):
+        """日志存储写入请求条目时调用：只记录会影响时间线的请求 ID，不构建时间线"""
+        if not entry.get("event") and entry.get("level") != "ERROR":
+            return
+        with self._lock:
+            self._dirty.add(entry["request_id"])
+            self._version += 1
+
+    def record(self, entry: dict):
+        """请求结束时保存的统计记录；已有日志推导的时间线时不覆盖"""
+        request_id = entry.get("request_id")
+        if not request_id:
+            return
+        with self._lock:
+            if request_id in self._from_log and request_id not in self._dirty:
+                return
+            self._items[request_id] = entry
+            self._version += 1
+
+    def seed(self, entries: List[dict]):
+        """启动时用持久化的 recent_conversations 初始化"""
+        for entry in entries:
+            self.record(entry)
+
+    def _apply_dirty(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for request_id in dirty:
+            req_logs = self._log_store.by_request(request_id)
+            if not req_logs:
+                continue  # 日志已被挤出，保留已有时间线
+            timeline = self._builder(request_id, req_logs)
+            with self._lock:
+                if timeline is not None:
+                    self._items[request_id] = timeline
+                    self._from_log.add(request_id)
+                elif request_id in self._from_log:
+                    self._items.pop(request_id, None)
+                    self._from_log.discard(request_id)
+
+    def _trim(self, ordered: List[Tuple[str, dict]]):
+        with self._lock:
+            for request_id, _ in ordered[self.capacity:]:
+                self._items.pop(request_id, None)
+                self._from_log.discard(request_id)
+
+    def render(self, limit: int) -> Tuple[bytes, str]:
+        """返回 (JSON 响应体, ETag)，时间线未变化或仍在 TTL 内时复用缓存"""
+        limit = max(0, min(limit, self.capacity))
+        now = time.monotonic()
+        cached = self._cache.get(limit)
+        if cached is not None and (cached[0] == self._version or now < cached[1]):
+            return cached[2], cached[3]
+
+        version = self._version
+        self._apply_dirty()
+        with self._lock:
+            items = list(self._items.items())
+        items.sort(key=lambda pair: _timeline_ts(pair[1]), reverse=True)
+        if len(items) > self.capacity:
+            self._trim(items)
+
+        logs = []
+        for _, item in items[:limit]:
+            if "start_ts" in item:
+                item = dict(item)
+                item.pop("start_ts", None)
+            logs.append(item)
+        body = json.dumps({"total": len(logs), "logs": logs}, ensure_ascii=False).encode("utf-8")
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self._cache[limit] = (version, now + self.ttl_seconds, body, etag)
+        return body, etag
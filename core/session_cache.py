@@ -0,0 +1,604 @@
+"""会话缓存模块
+
+- SessionCache: conv_key -> {"account_id", "session_id", "updated_at"} 的 LRU + TTL 缓存，
+  所有操作均为 O(1)（过期清理为 O(过期条目数)）
+- SessionLockTable: 按对话分片、引用计数自动回收的会话锁表
+- SessionCacheStore: 会话缓存增量持久化（数据库表或本地追加日志），启动时预热
+- SessionBackend: 会话缓存/锁后端接口
+  - MemorySessionBackend: 进程内实现（默认）
+  - PostgresSessionBackend: 数据库表 + advisory lock，多 worker/多副本共享会话绑定
+
+后端通过环境变量 SESSION_BACKEND 选择（memory / postgres）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core import storage
+from core.fingerprint import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_SIZE = 1000
+
+
+class SessionCache:
+    """
+    会话缓存（OrderedDict 实现的 LRU + TTL）
+
+    条目按 updated_at 从旧到新排列：写入和 touch 都会移动到末尾，
+    因此淘汰最旧条目和清理过期条目都只需从头部弹出
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_MAX_SIZE, ttl_seconds: int = 3600):
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # 增量持久化：自上次 drain_changes 以来写入/删除的键
+        self._dirty: set = set()
+        self._removed: set = set()
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: int):
+        self._max_size = value
+        self._evict_overflow()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._is_expired(entry, time.time())
+
+    def _is_expired(self, entry: dict, now: float) -> bool:
+        return now - entry["updated_at"] > self.ttl_seconds
+
+    def _mark_dirty(self, key: str):
+        self._dirty.add(key)
+        self._removed.discard(key)
+
+    def _mark_removed(self, key: str):
+        self._dirty.discard(key)
+        self._removed.add(key)
+
+    def _evict_overflow(self):
+        while len(self._entries) > self._max_size:
+            key, _ = self._entries.popitem(last=False)
+            self._mark_removed(key)
+            self.evictions += 1
+
+    def get(self, key: str, default: Optional[dict] = None) -> Optional[dict]:
+        """读取缓存（过期条目视为未命中并删除）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if self._is_expired(entry, time.time()):
+            del self._entries[key]
+            self._mark_removed(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, account_id: str, session_id: str, updated_at: Optional[float] = None) -> dict:
+        """写入缓存并移动到末尾，超过容量时淘汰最旧条目"""
+        entry = {
+            "account_id": account_id,
+            "session_id": session_id,
+            "updated_at": updated_at if updated_at is not None else time.time(),
+        }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._mark_dirty(key)
+        self._evict_overflow()
+        return entry
+
+    def touch(self, key: str) -> bool:
+        """刷新条目时间戳并移动到末尾"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        entry["updated_at"] = time.time()
+        self._entries.move_to_end(key)
+        self._mark_dirty(key)
+        return True
+
+    def pop(self, key: str, default: Optional[dict] = None) -> Optional[dict]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        self._mark_removed(key)
+        return entry
+
+    def purge_expired(self) -> int:
+        """从头部清理过期条目，返回清理数量"""
+        now = time.time()
+        removed = 0
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._is_expired(entry, now):
+                break
+            del self._entries[key]
+            self._mark_removed(key)
+            removed += 1
+        self.expirations += removed
+        return removed
+
+    def retain_accounts(self, account_ids) -> int:
+        """只保留账户仍存在的条目，返回删除数量"""
+        stale_keys = [
+            key for key, entry in self._entries.items()
+            if entry["account_id"] not in account_ids
+        ]
+        for key in stale_keys:
+            del self._entries[key]
+            self._mark_removed(key)
+        return len(stale_keys)
+
+    def load_entries(self, entries) -> int:
+        """
+        批量载入持久化条目（预热用，不标记为待写入）
+
+        Args:
+            entries: 按 updated_at 升序的 (conv_key, account_id, session_id, updated_at) 序列
+        """
+        now = time.time()
+        loaded = 0
+        for key, account_id, session_id, updated_at in entries:
+            if now - updated_at > self.ttl_seconds:
+                continue
+            self._entries[key] = {
+                "account_id": account_id,
+                "session_id": session_id,
+                "updated_at": updated_at,
+            }
+            self._entries.move_to_end(key)
+            loaded += 1
+        self._evict_overflow()
+        return loaded
+
+    def drain_changes(self) -> Tuple[Dict[str, dict], List[str]]:
+        """取出自上次调用以来的增量变更：(待写入条目, 已删除键)"""
+        upserts = {
+            key: dict(self._entries[key])
+            for key in self._dirty
+            if key in self._entries
+        }
+        removed = list(self._removed)
+        self._dirty = set()
+        self._removed = set()
+        return upserts, removed
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        return iter(list(self._entries.items()))
+
+    def keys(self):
+        return self._entries.keys()
+
+    def clear(self):
+        for key in self._entries:
+            self._mark_removed(key)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SessionCacheStore:
+    """
+    会话缓存持久化
+
+    - 数据库模式：增量 upsert/delete 到 session_cache 表
+    - 文件模式：变更以 JSON 行追加到日志文件，日志行数超过缓存条目数
+      两倍时重写为快照，避免每次全量写入
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._journal_lines = 0
+
+    async def warm(self, cache: SessionCache, account_ids) -> int:
+        """启动时载入未过期且账户仍存在的条目"""
+        min_updated_at = time.time() - cache.ttl_seconds
+        entries = None
+        if storage.is_database_enabled():
+            try:
+                entries = await storage.run_async(storage.load_session_cache(min_updated_at))
+            except Exception as e:
+                logger.error(f"[CACHE] 数据库加载会话缓存失败: {str(e)[:80]}")
+        if entries is None:
+            entries = await asyncio.to_thread(self._load_file)
+        entries = [entry for entry in entries if entry[1] in account_ids]
+        return cache.load_entries(entries)
+
+    async def flush(self, cache: SessionCache) -> int:
+        """写入自上次 flush 以来的增量变更，返回变更条目数"""
+        upserts, removed = cache.drain_changes()
+        if not upserts and not removed:
+            return 0
+        if storage.is_database_enabled():
+            try:
+                saved = await storage.run_async(storage.save_session_cache_changes(upserts, removed))
+                if saved:
+                    return len(upserts) + len(removed)
+            except Exception as e:
+                logger.error(f"[CACHE] 数据库保存会话缓存失败: {str(e)[:80]}")
+        snapshot = None
+        if self._journal_lines + len(upserts) + len(removed) > max(1000, len(cache) * 2):
+            snapshot = list(cache.items())
+        await asyncio.to_thread(self._write_file, upserts, removed, snapshot)
+        return len(upserts) + len(removed)
+
+    def _load_file(self) -> list:
+        entries: Dict[str, tuple] = {}
+        if not os.path.exists(self.file_path):
+            return []
+        lines = 0
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # 忽略写入中断产生的残缺行
+                    key = record.get("k")
+                    if not key:
+                        continue
+                    if record.get("d"):
+                        entries.pop(key, None)
+                    else:
+                        entries[key] = (key, record["a"], record["s"], float(record["t"]))
+        except Exception as e:
+            logger.warning(f"[CACHE] 会话缓存文件加载失败: {str(e)[:80]}")
+            return []
+        self._journal_lines = lines
+        return sorted(entries.values(), key=lambda entry: entry[3])
+
+    def _write_file(self, upserts: Dict[str, dict], removed: List[str], snapshot: Optional[list]):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        if snapshot is not None:
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, entry in snapshot:
+                    f.write(self._encode(key, entry))
+            os.replace(tmp_path, self.file_path)
+            self._journal_lines = len(snapshot)
+            return
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            for key in removed:
+                f.write(json.dumps({"k": key, "d": 1}) + "\n")
+            for key, entry in upserts.items():
+                f.write(self._encode(key, entry))
+        self._journal_lines += len(removed) + len(upserts)
+
+    @staticmethod
+    def _encode(key: str, entry: dict) -> str:
+        return json.dumps({
+            "k": key,
+            "a": entry["account_id"],
+            "s": entry["session_id"],
+            "t": entry["updated_at"],
+        }, ensure_ascii=False) + "\n"
+
+
+SESSION_LOCK_SHARDS = 16
+
+
+class _SessionLockRef:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class SessionLockTable:
+    """
+    会话锁表（按 conv_key 哈希分片）
+
+    每把锁记录持有和等待它的请求数，最后一个请求释放后立即从表中移除，
+    内存只与正在处理的对话数相关，不会随历史对话增长。
+    分片字典的增删之间没有 await，在事件循环内天然原子，无需全局锁
+    """
+
+    def __init__(self, shards: int = SESSION_LOCK_SHARDS):
+        self._shards: List[Dict[str, _SessionLockRef]] = [{} for _ in range(shards)]
+
+    def _shard(self, key: str) -> Dict[str, _SessionLockRef]:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """持有指定对话的锁，退出时释放并在无人引用时回收"""
+        shard = self._shard(key)
+        ref = shard.get(key)
+        if ref is None:
+            ref = shard[key] = _SessionLockRef()
+        ref.refs += 1
+        try:
+            async with ref.lock:
+                yield True
+        finally:
+            ref.refs -= 1
+            if ref.refs == 0 and shard.get(key) is ref:
+                del shard[key]
+
+
+class SessionBackend(ABC):
+    """
+    会话缓存/锁后端接口
+
+    MultiAccountManager 只通过本接口读写会话绑定和获取对话锁，
+    替换实现即可在多个 worker/副本之间共享会话
+    """
+
+    name = "base"
+
+    def __init__(self, ttl_seconds: int, max_size: int = DEFAULT_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+
+    @abstractmethod
+    async def get(self, conv_key: str) -> Optional[dict]:
+        """读取会话绑定 {"account_id", "session_id", "updated_at"}，不存在或过期返回 None"""
+
+    @abstractmethod
+    async def set(self, conv_key: str, account_id: str, session_id: str):
+        """写入会话绑定"""
+
+    @abstractmethod
+    async def touch(self, conv_key: str):
+        """刷新会话绑定的使用时间"""
+
+    @abstractmethod
+    def lock(self, conv_key: str):
+        """
+        对话锁（async with 使用）
+
+        as 得到是否已完整持有锁；为 False 时（跨副本锁超时）调用方不应读写该对话的会话绑定
+        """
+
+    async def match_prefix(self, prefix_chain: List[str]) -> Optional[str]:
+        """按最长已知历史前缀查找会话键"""
+        return None
+
+    async def remember_prefix(self, prefix_hash: str, conv_key: str):
+        pass
+
+    async def cleanup(self) -> int:
+        """清理过期条目，返回清理数量"""
+        return 0
+
+    def retain_accounts(self, account_ids) -> int:
+        """丢弃账户已不存在的绑定，返回删除数量"""
+        return 0
+
+    async def restore(self, account_ids) -> int:
+        """启动时恢复持久化的绑定"""
+        return 0
+
+    async def flush(self) -> int:
+        """持久化尚未保存的变更"""
+        return 0
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "ttl_seconds": self.ttl_seconds}
+
+
+class MemorySessionBackend(SessionBackend):
+    """进程内会话后端：SessionCache + PrefixIndex + SessionLockTable，可选本地持久化"""
+
+    name = "memory"
+
+    def __init__(
+        self,
+        ttl_seconds: int,
+        max_size: int = DEFAULT_CACHE_MAX_SIZE,
+        store: Optional[SessionCacheStore] = None,
+    ):
+        self.cache = SessionCache(max_size, ttl_seconds)
+        self.prefix_index = PrefixIndex()
+        self.locks = SessionLockTable()
+        self.store = store
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self.cache.ttl_seconds
+
+    @ttl_seconds.setter
+    def ttl_seconds(self, value: int):
+        self.cache.ttl_seconds = value
+
+    @property
+    def max_size(self) -> int:
+        return self.cache.max_size
+
+    @max_size.setter
+    def max_size(self, value: int):
+        self.cache.max_size = value
+
+    async def get(self, conv_key: str) -> Optional[dict]:
+        return self.cache.get(conv_key)
+
+    async def set(self, conv_key: str, account_id: str, session_id: str):
+        self.cache.set(conv_key, account_id, session_id)
+
+    async def touch(self, conv_key: str):
+        self.cache.touch(conv_key)
+
+    def lock(self, conv_key: str):
+        return self.locks.hold(conv_key)
+
+    async def match_prefix(self, prefix_chain: List[str]) -> Optional[str]:
+        matched = self.prefix_index.longest_match(prefix_chain)
+        if matched and matched in self.cache:
+            return matched
+        return None
+
+    async def remember_prefix(self, prefix_hash: str, conv_key: str):
+        self.prefix_index.add(prefix_hash, conv_key)
+
+    async def cleanup(self) -> int:
+        return self.cache.purge_expired()
+
+    def retain_accounts(self, account_ids) -> int:
+        return self.cache.retain_accounts(account_ids)
+
+    async def restore(self, account_ids) -> int:
+        if self.store is None:
+            return 0
+        return await self.store.warm(self.cache, account_ids)
+
+    async def flush(self) -> int:
+        if self.store is None:
+            return 0
+        return await self.store.flush(self.cache)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.cache.stats()}
+
+
+def _advisory_lock_key(conv_key: str) -> int:
+    """会话键 -> advisory lock 使用的 64 位有符号整数"""
+    digest = hashlib.blake2b(conv_key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class PostgresSessionBackend(SessionBackend):
+    """
+    数据库会话后端
+
+    - 绑定直接读写 session_cache 表，不做本地缓存：故障转移后其他副本
+      必须立即看到新的 Session，否则会继续使用旧会话
+    - 历史前缀索引存放在 session_prefix 表
+    - 对话锁：进程内锁先串行化同一对话的本地请求，再用 pg_try_advisory_lock
+      （有超时）与其他副本互斥；数据库不可用时降级为仅进程内锁，
+      等待超时时不再读写会话绑定，由调用方创建不缓存的新会话
+    """
+
+    name = "postgres"
+
+    def __init__(self, ttl_seconds: int):
+        super().__init__(ttl_seconds, max_size=0)
+        self._local_locks = SessionLockTable()
+        self.hits = 0
+        self.misses = 0
+        self.lock_failures = 0
+
+    async def get(self, conv_key: str) -> Optional[dict]:
+        entry = await storage.run_async(
+            storage.get_session_entry(conv_key, time.time() - self.ttl_seconds)
+        )
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(self, conv_key: str, account_id: str, session_id: str):
+        entry = {"account_id": account_id, "session_id": session_id, "updated_at": time.time()}
+        await storage.run_async(storage.save_session_cache_changes({conv_key: entry}, []))
+
+    async def touch(self, conv_key: str):
+        await storage.run_async(storage.touch_session_entry(conv_key, time.time()))
+
+    @asynccontextmanager
+    async def lock(self, conv_key: str):
+        async with self._local_locks.hold(conv_key):
+            lock_key = _advisory_lock_key(conv_key)
+            try:
+                handle = await storage.run_async(storage.acquire_advisory_lock(lock_key))
+            except asyncio.TimeoutError:
+                self.lock_failures += 1
+                logger.warning("[CACHE] 获取数据库会话锁超时，本次请求使用不缓存的新会话")
+                yield False
+                return
+            except Exception as e:
+                self.lock_failures += 1
+                logger.warning(f"[CACHE] 获取数据库会话锁失败，仅使用进程内锁: {str(e)[:80]}")
+                handle = None
+            try:
+                yield True
+            finally:
+                if handle is not None:
+                    try:
+                        await storage.run_async(storage.release_advisory_lock(handle, lock_key))
+                    except Exception as e:
+                        logger.error(f"[CACHE] 释放数据库会话锁失败: {str(e)[:80]}")
+
+    async def match_prefix(self, prefix_chain: List[str]) -> Optional[str]:
+        if not prefix_chain:
+            return None
+        matches = await storage.run_async(storage.match_session_prefixes(prefix_chain))
+        for prefix_hash in reversed(prefix_chain):
+            conv_key = matches.get(prefix_hash)
+            if conv_key is not None:
+                return conv_key
+        return None
+
+    async def remember_prefix(self, prefix_hash: str, conv_key: str):
+        await storage.run_async(storage.save_session_prefix(prefix_hash, conv_key, time.time()))
+
+    async def cleanup(self) -> int:
+        return await storage.run_async(
+            storage.delete_expired_session_entries(time.time() - self.ttl_seconds)
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "lock_failures": self.lock_failures,
+        }
+
+
+def create_session_backend(
+    ttl_seconds: int,
+    max_size: int = DEFAULT_CACHE_MAX_SIZE,
+    store: Optional[SessionCacheStore] = None,
+) -> SessionBackend:
+    """按环境变量 SESSION_BACKEND 创建会话后端（默认 memory）"""
+    backend = os.environ.get("SESSION_BACKEND", "memory").strip().lower()
+    if backend == "postgres":
+        if storage.is_database_enabled():
+            logger.info("[CACHE] 会话后端: postgres（多副本共享）")
+            return PostgresSessionBackend(ttl_seconds)
+        logger.warning("[CACHE] SESSION_BACKEND=postgres 需要配置 DATABASE_URL，使用内存后端")
+    elif backend != "memory":
+        logger.warning(f"[CACHE] 未知的 SESSION_BACKEND: {backend}，使用内存后端")
+    return MemorySessionBackend(ttl_seconds, max_size, store)
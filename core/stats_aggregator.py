@@ -0,0 +1,151 @@
+"""管理面板统计快照
+
+/admin/stats 原本在每次刷新时遍历所有账户计算状态、裁剪时间戳列表、保存统计数据，
+再把全部时间戳分到 12 个小时桶中，开销随账户数和请求量增长。
+
+StatsAggregator 在后台维护：
+- 按小时的请求/失败/限流/模型计数（请求发生时 O(1) 累加，无需保留全部时间戳再分桶）
+- 账户状态计数，由后台任务每隔几秒重新计算一次
+/admin/stats 直接返回最近一次生成的快照
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TREND_HOURS = 12
+
+_BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def classify_account(account_manager) -> str:
+    """账户状态：rate_limited / failed / active / idle"""
+    config = account_manager.config
+    cooldown_seconds, cooldown_reason = account_manager.get_cooldown_info()
+    if cooldown_seconds > 0 and cooldown_reason and "429" in cooldown_reason:
+        return "rate_limited"
+    is_auto_disabled = (not account_manager.is_available) and (not config.disabled)
+    if is_auto_disabled or config.is_expired() or cooldown_reason == "错误禁用":
+        return "failed"
+    if not config.disabled:
+        return "active"
+    return "idle"
+
+
+class StatsAggregator:
+    """按小时聚合的请求趋势 + 定期刷新的账户状态快照"""
+
+    def __init__(
+        self,
+        accounts_provider: Callable[[], Iterable],
+        models: Iterable[str] = (),
+        refresh_seconds: float = 5.0,
+    ):
+        self._accounts_provider = accounts_provider
+        self._models = list(models)
+        self.refresh_seconds = refresh_seconds
+        # {小时编号: {"total": n, "failed": n, "rate_limited": n, "models": {model: n}}}
+        self._hours: Dict[int, dict] = {}
+        self._snapshot: Optional[dict] = None
+
+    def _bucket(self, ts: float) -> dict:
+        hour = int(ts // 3600)
+        bucket = self._hours.get(hour)
+        if bucket is None:
+            bucket = self._hours[hour] = {"total": 0, "failed": 0, "rate_limited": 0, "models": {}}
+        return bucket
+
+    def record_request(self, model: str, ts: Optional[float] = None):
+        bucket = self._bucket(ts if ts is not None else time.time())
+        bucket["total"] += 1
+        bucket["models"][model] = bucket["models"].get(model, 0) + 1
+
+    def record_failure(self, rate_limited: bool, ts: Optional[float] = None):
+        bucket = self._bucket(ts if ts is not None else time.time())
+        bucket["rate_limited" if rate_limited else "failed"] += 1
+
+    def seed(self, stats: dict):
+        """从持久化的时间戳列表恢复小时计数（启动时调用一次）"""
+        self._hours.clear()
+        cutoff = time.time() - TREND_HOURS * 3600
+        for model, timestamps in (stats.get("model_request_timestamps") or {}).items():
+            for ts in timestamps:
+                if ts >= cutoff:
+                    models = self._bucket(ts)["models"]
+                    models[model] = models.get(model, 0) + 1
+        for ts in stats.get("request_timestamps") or []:
+            if ts >= cutoff:
+                self._bucket(ts)["total"] += 1
+        for ts in stats.get("failure_timestamps") or []:
+            if ts >= cutoff:
+                self.record_failure(False, ts)
+        for ts in stats.get("rate_limit_timestamps") or []:
+            if ts >= cutoff:
+                self.record_failure(True, ts)
+
+    def refresh(self) -> dict:
+        """重新计算账户状态并生成快照"""
+        now = time.time()
+        counts = {"active": 0, "failed": 0, "rate_limited": 0, "idle": 0}
+        total_accounts = 0
+        for account_manager in list(self._accounts_provider()):
+            total_accounts += 1
+            counts[classify_account(account_manager)] += 1
+
+        current_hour = int(now // 3600)
+        first_hour = current_hour - TREND_HOURS + 1
+        for hour in [h for h in self._hours if h < first_hour]:
+            del self._hours[hour]
+
+        start_dt = datetime.fromtimestamp(first_hour * 3600, tz=_BEIJING_TZ)
+        labels = [(start_dt + timedelta(hours=i)).strftime("%H:00") for i in range(TREND_HOURS)]
+        buckets = [self._hours.get(first_hour + i) for i in range(TREND_HOURS)]
+
+        def series(key: str) -> list:
+            return [bucket[key] if bucket else 0 for bucket in buckets]
+
+        model_names = list(self._models)
+        for bucket in buckets:
+            if bucket:
+                model_names.extend(m for m in bucket["models"] if m not in model_names)
+        model_requests = {
+            model: [bucket["models"].get(model, 0) if bucket else 0 for bucket in buckets]
+            for model in model_names
+        }
+
+        self._snapshot = {
+            "total_accounts": total_accounts,
+            "active_accounts": counts["active"],
+            "failed_accounts": counts["failed"],
+            "rate_limited_accounts": counts["rate_limited"],
+            "idle_accounts": counts["idle"],
+            "trend": {
+                "labels": labels,
+                "total_requests": series("total"),
+                "failed_requests": series("failed"),
+                "rate_limited_requests": series("rate_limited"),
+                "model_requests": model_requests,
+            },
+            "generated_at": now,
+        }
+        return self._snapshot
+
+    def snapshot(self) -> dict:
+        """最近一次快照（尚未生成时立即计算）"""
+        return self._snapshot if self._snapshot is not None else self.refresh()
+
+    async def run(self):
+        """后台任务：定期刷新快照"""
+        while True:
+            try:
+                self.refresh()
+                await asyncio.sleep(self.refresh_seconds)
+            except asyncio.CancelledError:
+                logger.info("[STATS] 统计快照任务已停止")
+                break
+            except Exception as e:
+                logger.error(f"[STATS] 统计快照刷新失败: {type(e).__name__}: {str(e)[:100]}")
+                await asyncio.sleep(self.refresh_seconds)
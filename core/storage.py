@@ -9,7 +9,7 @@ import json
 import logging
 import os
 import threading
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -17,11 +17,31 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-_db_pool = None
-_db_pool_lock = None
 _db_loop = None
 _db_thread = None
 _db_loop_lock = threading.Lock()
+_app_loop = None
+_tables_ready = False
+
+
+class _PoolSet:
+    """Connection pools owned by one event loop (asyncpg pools are loop-bound)."""
+
+    def __init__(self):
+        self.pool = None
+        self.lock_pool = None
+        self._lock = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created lazily inside the owning loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+
+_db_pools = _PoolSet()   # used on the private DB thread loop (sync wrappers)
+_app_pools = None        # used on the app loop once open_app_pool() is called
 
 
 def _get_database_url() -> str:
@@ -59,28 +79,114 @@ def _run_in_db_loop(coro):
     return future.result()
 
 
+def _on_app_loop() -> bool:
+    if _app_pools is None:
+        return False
+    try:
+        return asyncio.get_running_loop() is _app_loop
+    except RuntimeError:
+        return False
+
+
+def _current_pools() -> _PoolSet:
+    return _app_pools if _on_app_loop() else _db_pools
+
+
+async def open_app_pool() -> None:
+    """
+    Bind the async storage API to the running (app) event loop.
+    After this, awaiting storage coroutines from the app loop uses a pool
+    owned by that loop instead of hopping to the DB thread.
+    Call once at startup; pair with close_app_pool() at shutdown.
+    """
+    global _app_loop, _app_pools
+    if not is_database_enabled() or _app_pools is not None:
+        return
+    _app_loop = asyncio.get_running_loop()
+    _app_pools = _PoolSet()
+    try:
+        await _get_pool()
+    except Exception:
+        _app_pools = None
+        _app_loop = None
+        raise
+
+
+async def close_app_pool() -> None:
+    """Close the app-loop pools opened by open_app_pool()."""
+    global _app_loop, _app_pools
+    pools = _app_pools
+    _app_pools = None
+    _app_loop = None
+    if pools is None:
+        return
+    for pool in (pools.lock_pool, pools.pool):
+        if pool is not None:
+            await pool.close()
+    logger.info("[STORAGE] PostgreSQL app pool closed")
+
+
+async def run_async(coro):
+    """
+    Await a storage coroutine from async code. Runs directly when the app
+    pool is open on this loop, otherwise on the DB thread loop.
+    """
+    if _on_app_loop():
+        return await coro
+    loop = _ensure_db_loop()
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+# Strong references to fire-and-forget work: the event loop only keeps
+# weak references to tasks, so an unreferenced task can be collected
+# before it finishes.
+_submitted = set()
+
+
+def _on_submitted_done(future) -> None:
+    _submitted.discard(future)
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.error(f"[STORAGE] Background storage task failed: {type(exc).__name__}: {exc}")
+
+
+def submit(coro):
+    """Schedule a storage coroutine without waiting for it; failures are logged."""
+    if _on_app_loop():
+        future = asyncio.ensure_future(coro)
+    else:
+        future = asyncio.run_coroutine_threadsafe(coro, _ensure_db_loop())
+    _submitted.add(future)
+    future.add_done_callback(_on_submitted_done)
+    return future
+
+
 async def _get_pool():
-    """Get (or create) the asyncpg connection pool."""
-    global _db_pool, _db_pool_lock
-    if _db_pool is not None:
-        return _db_pool
-    if _db_pool_lock is None:
-        _db_pool_lock = asyncio.Lock()
-    async with _db_pool_lock:
-        if _db_pool is not None:
-            return _db_pool
+    """Get (or create) the asyncpg connection pool for the current loop."""
+    global _tables_ready
+    pools = _current_pools()
+    if pools.pool is not None:
+        return pools.pool
+    async with pools.lock:
+        if pools.pool is not None:
+            return pools.pool
         db_url = _get_database_url()
         if not db_url:
             raise ValueError("DATABASE_URL is not set")
         try:
             import asyncpg
-            _db_pool = await asyncpg.create_pool(
+            pool = await asyncpg.create_pool(
                 db_url,
                 min_size=1,
                 max_size=10,
                 command_timeout=30,
             )
-            await _init_tables(_db_pool)
+            if not _tables_ready:
+                await _init_tables(pool)
+                _tables_ready = True
+            pools.pool = pool
             logger.info("[STORAGE] PostgreSQL pool initialized")
         except ImportError:
             logger.error("[STORAGE] asyncpg is required for database storage")
@@ -88,7 +194,29 @@ async def _get_pool():
         except Exception as e:
             logger.error(f"[STORAGE] Database connection failed: {e}")
             raise
-    return _db_pool
+    return pools.pool
+
+
+async def _get_lock_pool():
+    """
+    Get (or create) the connection pool reserved for advisory locks.
+    Lock holders keep a connection until release, so they must not
+    starve the main pool.
+    """
+    pools = _current_pools()
+    if pools.lock_pool is not None:
+        return pools.lock_pool
+    await _get_pool()
+    async with pools.lock:
+        if pools.lock_pool is not None:
+            return pools.lock_pool
+        import asyncpg
+        pools.lock_pool = await asyncpg.create_pool(
+            _get_database_url(),
+            min_size=1,
+            max_size=20,
+        )
+    return pools.lock_pool
 
 
 async def _init_tables(pool) -> None:
@@ -103,6 +231,83 @@ async def _init_tables(pool) -> None:
             )
             """
         )
+        await conn.execute("CREATE SEQUENCE IF NOT EXISTS accounts_version_seq")
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS accounts (
+                account_id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                data JSONB NOT NULL,
+                disabled BOOLEAN NOT NULL DEFAULT FALSE,
+                expires_at TEXT,
+                deleted BOOLEAN NOT NULL DEFAULT FALSE,
+                version BIGINT NOT NULL DEFAULT nextval('accounts_version_seq'),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        # Writer transaction id, used for the commit-safe change cursor (PostgreSQL 13+)
+        await conn.execute(
+            "ALTER TABLE accounts ADD COLUMN IF NOT EXISTS "
+            "txid xid8 NOT NULL DEFAULT pg_current_xact_id()"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS accounts_txid_idx ON accounts (txid)"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS accounts_disabled_idx ON accounts (disabled) WHERE NOT deleted"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS accounts_expires_at_idx ON accounts (expires_at) WHERE NOT deleted"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS accounts_version_idx ON accounts (version)"
+        )
+        await conn.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION notify_accounts_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{ACCOUNTS_CHANNEL}', TG_OP);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """
+        )
+        await conn.execute(
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_trigger WHERE tgname = 'accounts_notify_changed'
+                ) THEN
+                    CREATE TRIGGER accounts_notify_changed
+                    AFTER INSERT OR UPDATE OR DELETE ON accounts
+                    FOR EACH STATEMENT EXECUTE PROCEDURE notify_accounts_changed();
+                END IF;
+            END
+            $$
+            """
+        )
+        await _migrate_accounts_blob(conn)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_cache (
+                conv_key TEXT PRIMARY KEY,
+                account_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_prefix (
+                prefix_hash TEXT PRIMARY KEY,
+                conv_key TEXT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
         logger.info("[STORAGE] Database tables initialized")
 
 
@@ -139,6 +344,93 @@ async def db_set(key: str, value: dict) -> None:
 
 
 # ==================== Accounts storage ====================
+#
+# One row per account. `position` keeps the configured order, `version`
+# comes from a sequence and is bumped on every change (including soft
+# deletes), and `txid` records the writing transaction. Other replicas
+# poll only the rows written since their commit-safe cursor (see
+# load_accounts_changed_since). A statement-level trigger NOTIFYs
+# ACCOUNTS_CHANNEL after every write so listeners can react immediately.
+
+ACCOUNTS_CHANNEL = "accounts_changed"
+
+_ACCOUNT_UPSERT_SQL = """
+    INSERT INTO accounts (account_id, position, data, disabled, expires_at)
+    VALUES ($1, $2, $3::jsonb, $4, $5)
+    ON CONFLICT (account_id) DO UPDATE SET
+        position = EXCLUDED.position,
+        data = EXCLUDED.data,
+        disabled = EXCLUDED.disabled,
+        expires_at = EXCLUDED.expires_at,
+        deleted = FALSE,
+        version = nextval('accounts_version_seq'),
+        txid = pg_current_xact_id(),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE accounts.deleted
+        OR accounts.position <> EXCLUDED.position
+        OR accounts.data <> EXCLUDED.data
+"""
+
+
+def _account_row(acc: dict, position: int) -> tuple:
+    """
+    Build an accounts row. Accounts without an explicit id get the same
+    positional id the loader would give them ("account_<n>"), and the id
+    is stored in the data so it stays stable when other rows move.
+    """
+    account_id = acc.get("id") or f"account_{position}"
+    if acc.get("id") != account_id:
+        acc = {"id": account_id, **acc}
+    return (
+        account_id,
+        position,
+        json.dumps(acc, ensure_ascii=False),
+        bool(acc.get("disabled", False)),
+        acc.get("expires_at"),
+    )
+
+
+def _decode_json(value):
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+async def _write_account_rows(conn, accounts: list) -> None:
+    """Replace the full account list; only changed rows are touched."""
+    rows = [_account_row(acc, i) for i, acc in enumerate(accounts, 1)]
+    if rows:
+        await conn.executemany(_ACCOUNT_UPSERT_SQL, rows)
+    await conn.execute(
+        """
+        UPDATE accounts SET
+            deleted = TRUE,
+            version = nextval('accounts_version_seq'),
+            txid = pg_current_xact_id(),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE NOT deleted AND NOT (account_id = ANY($1::text[]))
+        """,
+        [row[0] for row in rows],
+    )
+
+
+async def _migrate_accounts_blob(conn) -> None:
+    """
+    One-time migration of the legacy kv_store "accounts" blob into the
+    accounts table. The legacy row is kept untouched as a backup.
+    """
+    if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM accounts)"):
+        return
+    row = await conn.fetchrow("SELECT value FROM kv_store WHERE key = $1", "accounts")
+    if not row:
+        return
+    accounts = _decode_json(row["value"])
+    if not accounts:
+        return
+    async with conn.transaction():
+        await _write_account_rows(conn, accounts)
+    logger.info(f"[STORAGE] Migrated {len(accounts)} accounts from kv_store to accounts table")
+
 
 async def load_accounts() -> Optional[list]:
     """
@@ -148,50 +440,119 @@ async def load_accounts() -> Optional[list]:
     if not is_database_enabled():
         return None
     try:
-        data = await db_get("accounts")
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT data FROM accounts WHERE NOT deleted ORDER BY position"
+            )
+        data = [_decode_json(row["data"]) for row in rows]
         if data:
             logger.info(f"[STORAGE] Loaded {len(data)} accounts from database")
-            return data
-        logger.info("[STORAGE] No accounts found in database")
-        return []
+        else:
+            logger.info("[STORAGE] No accounts found in database")
+        return data
     except Exception as e:
         logger.error(f"[STORAGE] Database read failed: {e}")
     return None
 
 
-async def get_accounts_updated_at() -> Optional[float]:
+AccountsCursor = Tuple[int, frozenset]
+
+
+async def _read_accounts_cursor(conn, watermark: Optional[int]) -> Tuple[list, AccountsCursor]:
+    """
+    Read rows written by transactions at or after the watermark, plus the
+    new watermark, in one REPEATABLE READ snapshot (caller opens it).
+
+    The new watermark is the snapshot xmin: every transaction below it has
+    finished, so anything it wrote is already visible here. Transactions
+    still in flight are at or above it and are picked up by the next read.
+    """
+    xmin = int(await conn.fetchval(
+        "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+    ))
+    if watermark is None:
+        rows = await conn.fetch(
+            "SELECT account_id, version FROM accounts WHERE txid >= $1::text::xid8",
+            str(xmin),
+        )
+    else:
+        rows = await conn.fetch(
+            """
+            SELECT account_id, position, data, deleted, version,
+                   txid::text::bigint AS txid
+            FROM accounts
+            WHERE txid >= $1::text::xid8
+            ORDER BY position
+            """,
+            str(watermark),
+        )
+    return rows, xmin
+
+
+async def get_accounts_cursor() -> Optional[AccountsCursor]:
     """
-    Get the accounts updated_at timestamp (epoch seconds).
-    Return None if database is not enabled or failed.
+    Get a change cursor for the current state: (watermark, versions already
+    visible at or above it). Pass it to load_accounts_changed_since.
     """
     if not is_database_enabled():
         return None
     try:
         pool = await _get_pool()
         async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT EXTRACT(EPOCH FROM updated_at) AS ts FROM kv_store WHERE key = $1",
-                "accounts",
-            )
-            if not row or row["ts"] is None:
-                return None
-            return float(row["ts"])
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                rows, xmin = await _read_accounts_cursor(conn, None)
+        return xmin, frozenset(row["version"] for row in rows)
     except Exception as e:
-        logger.error(f"[STORAGE] Database accounts updated_at failed: {e}")
+        logger.error(f"[STORAGE] Database accounts cursor failed: {e}")
     return None
 
 
-def get_accounts_updated_at_sync() -> Optional[float]:
-    """Sync wrapper for get_accounts_updated_at."""
-    return _run_in_db_loop(get_accounts_updated_at())
+async def load_accounts_changed_since(cursor: AccountsCursor) -> Optional[Tuple[List[dict], AccountsCursor]]:
+    """
+    Load account rows changed after the given cursor.
+    Return (rows, next_cursor); each row has account_id, position,
+    data and deleted. Return None if database is not enabled or failed.
+
+    Sequence versions are assigned before commit, so "version > last seen"
+    can skip a row whose transaction commits late. The cursor instead
+    tracks writer transaction ids against the snapshot xmin, and rows at
+    or above the watermark are re-read and deduplicated by version.
+    """
+    if not is_database_enabled():
+        return None
+    watermark, seen = cursor
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                rows, xmin = await _read_accounts_cursor(conn, watermark)
+        changes = [
+            {
+                "account_id": row["account_id"],
+                "position": row["position"],
+                "data": _decode_json(row["data"]),
+                "deleted": row["deleted"],
+            }
+            for row in rows
+            if row["version"] not in seen
+        ]
+        next_seen = frozenset(row["version"] for row in rows if row["txid"] >= xmin)
+        return changes, (xmin, next_seen)
+    except Exception as e:
+        logger.error(f"[STORAGE] Database accounts changes read failed: {e}")
+    return None
 
 
 async def save_accounts(accounts: list) -> bool:
-    """Save account configuration to database when enabled."""
+    """Save the full account list to database when enabled."""
     if not is_database_enabled():
         return False
     try:
-        await db_set("accounts", accounts)
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_account_rows(conn, accounts)
         logger.info(f"[STORAGE] Saved {len(accounts)} accounts to database")
         return True
     except Exception as e:
@@ -199,6 +560,56 @@ async def save_accounts(accounts: list) -> bool:
     return False
 
 
+async def delete_account(account_id: str) -> bool:
+    """Soft-delete a single account. Return True if a row was deleted."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                UPDATE accounts SET
+                    deleted = TRUE,
+                    version = nextval('accounts_version_seq'),
+                    txid = pg_current_xact_id(),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE account_id = $1 AND NOT deleted
+                """,
+                account_id,
+            )
+        return result.split()[-1] != "0"
+    except Exception as e:
+        logger.error(f"[STORAGE] Account delete failed: {e}")
+    return False
+
+
+async def set_account_disabled(account_id: str, disabled: bool) -> bool:
+    """Update the disabled flag of a single account. Return True if found."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                """
+                UPDATE accounts SET
+                    disabled = $2,
+                    data = jsonb_set(data, '{disabled}', to_jsonb($2::boolean)),
+                    version = nextval('accounts_version_seq'),
+                    txid = pg_current_xact_id(),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE account_id = $1 AND NOT deleted
+                """,
+                account_id,
+                disabled,
+            )
+        return result.split()[-1] != "0"
+    except Exception as e:
+        logger.error(f"[STORAGE] Account disabled update failed: {e}")
+    return False
+
+
 def load_accounts_sync() -> Optional[list]:
     """Sync wrapper for load_accounts (safe in sync/async call sites)."""
     return _run_in_db_loop(load_accounts())
@@ -209,6 +620,18 @@ def save_accounts_sync(accounts: list) -> bool:
     return _run_in_db_loop(save_accounts(accounts))
 
 
+def get_accounts_cursor_sync() -> Optional[AccountsCursor]:
+    return _run_in_db_loop(get_accounts_cursor())
+
+
+def delete_account_sync(account_id: str) -> bool:
+    return _run_in_db_loop(delete_account(account_id))
+
+
+def set_account_disabled_sync(account_id: str, disabled: bool) -> bool:
+    return _run_in_db_loop(set_account_disabled(account_id, disabled))
+
+
 # ==================== Settings storage ====================
 
 async def load_settings() -> Optional[dict]:
@@ -270,3 +693,271 @@ def load_stats_sync() -> Optional[dict]:
 
 def save_stats_sync(stats: dict) -> bool:
     return _run_in_db_loop(save_stats(stats))
+
+
+# ==================== Session cache storage ====================
+
+async def load_session_cache(min_updated_at: float = 0) -> Optional[list]:
+    """
+    Load persisted session cache entries newer than min_updated_at
+    (older rows are deleted). Return a list of
+    (conv_key, account_id, session_id, updated_at) ordered by updated_at,
+    or None when database is not enabled or failed.
+    """
+    if not is_database_enabled():
+        return None
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM session_cache WHERE updated_at <= $1",
+                min_updated_at,
+            )
+            rows = await conn.fetch(
+                """
+                SELECT conv_key, account_id, session_id, updated_at
+                FROM session_cache
+                WHERE updated_at > $1
+                ORDER BY updated_at
+                """,
+                min_updated_at,
+            )
+        return [
+            (row["conv_key"], row["account_id"], row["session_id"], row["updated_at"])
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error(f"[STORAGE] Session cache read failed: {e}")
+    return None
+
+
+async def save_session_cache_changes(upserts: dict, removed: list) -> bool:
+    """Apply incremental session cache changes in one transaction."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if removed:
+                    await conn.execute(
+                        "DELETE FROM session_cache WHERE conv_key = ANY($1::text[])",
+                        list(removed),
+                    )
+                if upserts:
+                    await conn.executemany(
+                        """
+                        INSERT INTO session_cache (conv_key, account_id, session_id, updated_at)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (conv_key) DO UPDATE SET
+                            account_id = EXCLUDED.account_id,
+                            session_id = EXCLUDED.session_id,
+                            updated_at = EXCLUDED.updated_at
+                        """,
+                        [
+                            (key, entry["account_id"], entry["session_id"], entry["updated_at"])
+                            for key, entry in upserts.items()
+                        ],
+                    )
+        return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Session cache write failed: {e}")
+    return False
+
+
+async def get_session_entry(conv_key: str, min_updated_at: float = 0) -> Optional[dict]:
+    """Fetch one session cache entry updated after min_updated_at."""
+    if not is_database_enabled():
+        return None
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                SELECT account_id, session_id, updated_at FROM session_cache
+                WHERE conv_key = $1 AND updated_at > $2
+                """,
+                conv_key,
+                min_updated_at,
+            )
+        if not row:
+            return None
+        return {
+            "account_id": row["account_id"],
+            "session_id": row["session_id"],
+            "updated_at": row["updated_at"],
+        }
+    except Exception as e:
+        logger.error(f"[STORAGE] Session entry read failed: {e}")
+    return None
+
+
+async def touch_session_entry(conv_key: str, updated_at: float) -> bool:
+    """Refresh the updated_at timestamp of a session cache entry."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE session_cache SET updated_at = $2 WHERE conv_key = $1",
+                conv_key,
+                updated_at,
+            )
+        return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Session entry touch failed: {e}")
+    return False
+
+
+async def delete_expired_session_entries(min_updated_at: float) -> int:
+    """Delete session cache entries and prefixes not updated since min_updated_at."""
+    if not is_database_enabled():
+        return 0
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            result = await conn.execute(
+                "DELETE FROM session_cache WHERE updated_at <= $1",
+                min_updated_at,
+            )
+            await conn.execute(
+                "DELETE FROM session_prefix WHERE updated_at <= $1",
+                min_updated_at,
+            )
+        return int(result.split()[-1])
+    except Exception as e:
+        logger.error(f"[STORAGE] Session cache cleanup failed: {e}")
+    return 0
+
+
+async def match_session_prefixes(prefix_hashes: list) -> dict:
+    """Look up conversation keys for the given prefix hashes."""
+    if not is_database_enabled() or not prefix_hashes:
+        return {}
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT prefix_hash, conv_key FROM session_prefix
+                WHERE prefix_hash = ANY($1::text[])
+                """,
+                list(prefix_hashes),
+            )
+        return {row["prefix_hash"]: row["conv_key"] for row in rows}
+    except Exception as e:
+        logger.error(f"[STORAGE] Session prefix lookup failed: {e}")
+    return {}
+
+
+async def save_session_prefix(prefix_hash: str, conv_key: str, updated_at: float) -> bool:
+    """Map a conversation prefix hash to its conversation key."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO session_prefix (prefix_hash, conv_key, updated_at)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (prefix_hash) DO UPDATE SET
+                    conv_key = EXCLUDED.conv_key,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                prefix_hash,
+                conv_key,
+                updated_at,
+            )
+        return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Session prefix save failed: {e}")
+    return False
+
+
+# ==================== Advisory locks ====================
+
+ADVISORY_LOCK_TIMEOUT_SECONDS = 15.0
+_ADVISORY_LOCK_RETRY_MIN = 0.05
+_ADVISORY_LOCK_RETRY_MAX = 0.5
+
+
+async def acquire_advisory_lock(lock_key: int, timeout: float = ADVISORY_LOCK_TIMEOUT_SECONDS):
+    """
+    Take a session-level advisory lock and return the connection holding it.
+    Pass the returned handle to release_advisory_lock.
+
+    Both the pool checkout and the lock itself are bounded by timeout
+    (pg_try_advisory_lock with backoff); raise asyncio.TimeoutError when
+    the lock cannot be taken in time.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pool = await _get_lock_pool()
+    conn = await pool.acquire(timeout=timeout)
+    try:
+        delay = _ADVISORY_LOCK_RETRY_MIN
+        while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_key):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"advisory lock {lock_key} not acquired within {timeout}s")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, _ADVISORY_LOCK_RETRY_MAX)
+    except BaseException:
+        await pool.release(conn)
+        raise
+    return conn
+
+
+async def release_advisory_lock(conn, lock_key: int) -> None:
+    """Release an advisory lock taken by acquire_advisory_lock."""
+    pool = await _get_lock_pool()
+    try:
+        await conn.execute("SELECT pg_advisory_unlock($1)", lock_key)
+    finally:
+        await pool.release(conn)
+
+
+# ==================== LISTEN/NOTIFY ====================
+
+async def notify(channel: str, payload: str) -> bool:
+    """Send a NOTIFY on the given channel."""
+    if not is_database_enabled():
+        return False
+    try:
+        pool = await _get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+        return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Notify failed: {e}")
+    return False
+
+
+async def open_listener(channel: str, callback, on_close=None):
+    """
+    Open a dedicated connection that LISTENs on the given channel.
+    callback(payload) runs on the loop that opened the connection;
+    on_close() is called if the connection is lost. Close the returned
+    connection to stop.
+    """
+    import asyncpg
+    conn = await asyncpg.connect(_get_database_url())
+    try:
+        await conn.add_listener(
+            channel,
+            lambda _conn, _pid, _channel, payload: callback(payload),
+        )
+        if on_close is not None:
+            conn.add_termination_listener(lambda _conn: on_close())
+    except BaseException:
+        await conn.close()
+        raise
+    return conn
+
+
+async def close_listener(conn) -> None:
+    """Close a connection returned by open_listener."""
+    if conn is not None and not conn.is_closed():
+        await conn.close()
@@ -0,0 +1,128 @@
+"""访客去重计数
+
+/public/log 按 IP 统计 24 小时内的独立访客。原实现把 24 小时内出现过的每个 IP
+都存进 dict 并整体写入统计文件，访问量突增时内存和每次统计写入都会膨胀。
+
+VisitorCounter 使用按小时轮转的 Bloom filter：
+- 每个小时一个位数组，共保留 24 个槽位；新访客写入当前小时的槽位
+- 任一有效槽位命中即视为 24 小时内已访问，因此各槽位的误判率会叠加；
+  槽位大小按「每小时预期访客数」和「整个窗口的目标误判率」计算
+  （每个槽位分到 1/24 的误判率，m = -n·ln p / ln²2，k = m/n·ln2）
+- 内存与持久化大小只取决于配置，与实际访客数量无关；持久化时按槽位 zlib 压缩，
+  只有当前小时的槽位会变化，其余槽位复用上次的编码
+"""
+import base64
+import hashlib
+import math
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+DEFAULT_HOURLY_CAPACITY = 20000
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+DEFAULT_WINDOW_HOURS = 24
+
+
+def bloom_size(capacity: int, false_positive_rate: float, slots: int) -> Tuple[int, int]:
+    """单个槽位的 (位数, 哈希数)：slots 个槽位叠加后的误判率不超过 false_positive_rate"""
+    p = false_positive_rate / slots
+    bits = math.ceil(-capacity * math.log(p) / (math.log(2) ** 2))
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+class VisitorCounter:
+    """按小时轮转的 Bloom filter，判断 IP 在窗口内是否出现过"""
+
+    def __init__(
+        self,
+        hourly_capacity: int = DEFAULT_HOURLY_CAPACITY,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+        window_hours: int = DEFAULT_WINDOW_HOURS,
+    ):
+        self.window_hours = window_hours
+        # {小时编号: 位数组}
+        self._slots: Dict[int, bytearray] = {}
+        # {小时编号: 压缩后的 base64 编码}，槽位写入后失效
+        self._encoded: Dict[int, str] = {}
+        self.configure(hourly_capacity, false_positive_rate)
+
+    def configure(self, hourly_capacity: int, false_positive_rate: float) -> bool:
+        """按容量和误判率设置槽位大小；大小变化时清空已有槽位，返回是否清空"""
+        self.hourly_capacity = hourly_capacity
+        self.false_positive_rate = false_positive_rate
+        bits, hashes = bloom_size(hourly_capacity, false_positive_rate, self.window_hours)
+        if bits == getattr(self, "bits", None) and hashes == getattr(self, "hashes", None):
+            return False
+        self.bits = bits
+        self.hashes = hashes
+        cleared = bool(self._slots)
+        self._slots = {}
+        self._encoded = {}
+        return cleared
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def _expire(self, hour: int):
+        oldest = hour - self.window_hours + 1
+        for slot_hour in [h for h in self._slots if h < oldest]:
+            del self._slots[slot_hour]
+            self._encoded.pop(slot_hour, None)
+
+    def seen(self, key: str, now: Optional[float] = None) -> bool:
+        hour = int((now if now is not None else time.time()) // 3600)
+        self._expire(hour)
+        positions = list(self._positions(key))
+        for slot in self._slots.values():
+            if all(slot[p >> 3] & (1 << (p & 7)) for p in positions):
+                return True
+        return False
+
+    def add(self, key: str, now: Optional[float] = None) -> bool:
+        """记录访问；窗口内首次出现时返回 True"""
+        now = now if now is not None else time.time()
+        if self.seen(key, now):
+            return False
+        hour = int(now // 3600)
+        slot = self._slots.get(hour)
+        if slot is None:
+            slot = self._slots[hour] = bytearray(self.bits // 8)
+        for p in self._positions(key):
+            slot[p >> 3] |= 1 << (p & 7)
+        self._encoded.pop(hour, None)
+        return True
+
+    def to_dict(self) -> dict:
+        for hour, slot in self._slots.items():
+            if hour not in self._encoded:
+                self._encoded[hour] = base64.b64encode(zlib.compress(bytes(slot), 1)).decode("ascii")
+        return {
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "encoding": "zlib",
+            "slots": {str(hour): self._encoded[hour] for hour in self._slots},
+        }
+
+    def load(self, data: Optional[dict], now: Optional[float] = None):
+        """从统计数据恢复；参数与当前配置不一致时丢弃"""
+        self._slots = {}
+        self._encoded = {}
+        if not isinstance(data, dict):
+            return
+        if data.get("bits") != self.bits or data.get("hashes") != self.hashes or data.get("encoding") != "zlib":
+            return
+        for hour, encoded in (data.get("slots") or {}).items():
+            try:
+                slot = bytearray(zlib.decompress(base64.b64decode(encoded)))
+            except (TypeError, ValueError, zlib.error):
+                continue
+            if len(slot) == self.bits // 8:
+                self._slots[int(hour)] = slot
+                self._encoded[int(hour)] = encoded
+        self._expire(int((now if now is not None else time.time()) // 3600))
@@ -1,4 +1,6 @@
-import json, time, os, asyncio, uuid, ssl, re, yaml, shutil, base64
+import json, time, os, asyncio, uuid, ssl, yaml, shutil, base64
+from bisect import bisect_right
+from itertools import islice
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional, Union, Dict, Any
 from pathlib import Path
@@ -16,12 +18,10 @@ import httpx
 import aiofiles
 from fastapi import FastAPI, HTTPException, Header, Request, Body, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from util.streaming_parser import parse_json_array_stream_async
-from collections import deque
-from threading import Lock
 
 # ---------- 数据目录配置 ----------
 # 自动检测环境：HF Spaces Pro 使用 /data，本地使用 ./data
@@ -40,6 +40,8 @@ ACCOUNTS_FILE = os.path.join(DATA_DIR, "accounts.json")
 SETTINGS_FILE = os.path.join(DATA_DIR, "settings.yaml")
 STATS_FILE = os.path.join(DATA_DIR, "stats.json")
 IMAGE_DIR = os.path.join(DATA_DIR, "images")
+URL_CACHE_DIR = os.path.join(DATA_DIR, "url_cache")
+SESSION_CACHE_FILE = os.path.join(DATA_DIR, "session_cache.jsonl")
 
 # 确保图片目录存在
 os.makedirs(IMAGE_DIR, exist_ok=True)
@@ -50,10 +52,14 @@ from core.session_auth import is_logged_in, login_user, logout_user, require_log
 
 # 导入核心模块
 from core.message import (
+    ConversationView,
+    UrlFileFetcher,
     get_conversation_key,
-    parse_last_message,
-    build_full_context_text
+    parse_last_message
 )
+from core.context import ContextBuilder
+from core.session_cache import SessionCacheStore, create_session_backend
+from core.health_bus import create_health_bus
 from core.google_api import (
     get_common_headers,
     create_google_session,
@@ -63,15 +69,22 @@ from core.google_api import (
     save_image_to_hf
 )
 from core.account import (
+    ACCOUNT_IMPORT_MODES,
+    ACCOUNT_STATUSES,
+    BULK_ACCOUNT_ACTIONS,
+    AccountImporter,
     AccountManager,
     MultiAccountManager,
     format_account_expiration,
+    iter_accounts_ndjson,
     load_multi_account_config,
-    load_accounts_from_source,
-    reload_accounts as _reload_accounts,
+    load_accounts_from_source_async,
+    apply_account_changes as _apply_account_changes,
     update_accounts_config as _update_accounts_config,
     delete_account as _delete_account,
-    update_account_disabled_status as _update_account_disabled_status
+    update_account_disabled_status as _update_account_disabled_status,
+    bulk_update_accounts as _bulk_update_accounts,
+    import_accounts as _import_accounts
 )
 
 # 导入 Uptime 追踪器
@@ -82,21 +95,38 @@ from core.config import config_manager, config
 
 # 数据库存储支持
 from core import storage
+from core.log_store import LogStore, LogStoreHandler, PreviewSampler, log_extra, start_log_pipeline
+from core.log_segments import LogSegmentSink, parse_cursor
+from core.public_log import PublicLogTimeline
+from core.visitors import VisitorCounter
+from core.stats_aggregator import StatsAggregator, TREND_HOURS
 
 # ---------- 日志配置 ----------
 
-# 内存日志缓冲区 (保留最近 1000 条日志，重启后清空)
-log_buffer = deque(maxlen=1000)
-log_lock = Lock()
+# 内存结构化日志存储 (容量见 logging.memory_capacity，按请求ID/级别/时间索引，重启后清空)
+log_store = LogStore(capacity=config.logging.memory_capacity)
+
+# 请求时间线事件类型（通过 extra= 写入日志条目）
+LOG_EVENT_START = "request_start"
+LOG_EVENT_RETRY = "session_retry"
+LOG_EVENT_SWITCH = "account_switch"
+LOG_EVENT_COMPLETE = "request_complete"
+LOG_EVENT_TIMEOUT = "request_timeout"
 
 # 统计数据持久化
 stats_lock = asyncio.Lock()  # 改为异步锁
 
+# 24 小时独立访客（按小时轮转的 Bloom filter，大小由容量和误判率配置决定）
+visitor_counter = VisitorCounter(
+    config.public_display.visitor_hourly_capacity,
+    config.public_display.visitor_false_positive_rate
+)
+
 async def load_stats():
     """加载统计数据（异步）。"""
     if storage.is_database_enabled():
         try:
-            data = await asyncio.to_thread(storage.load_stats_sync)
+            data = await storage.run_async(storage.load_stats())
             if isinstance(data, dict):
                 return data
         except Exception as e:
@@ -115,7 +145,7 @@ async def load_stats():
         "model_request_timestamps": {},
         "failure_timestamps": [],
         "rate_limit_timestamps": [],
-        "visitor_ips": {},
+        "visitor_filter": {},
         "account_conversations": {},
         "recent_conversations": []
     }
@@ -124,7 +154,7 @@ async def save_stats(stats):
     """保存统计数据（异步，避免阻塞事件循环）"""
     if storage.is_database_enabled():
         try:
-            saved = await asyncio.to_thread(storage.save_stats_sync, stats)
+            saved = await storage.run_async(storage.save_stats(stats))
             if saved:
                 return
         except Exception as e:
@@ -143,12 +173,23 @@ global_stats = {
     "model_request_timestamps": {},
     "failure_timestamps": [],
     "rate_limit_timestamps": [],
-    "visitor_ips": {},
+    "visitor_filter": {},
     "account_conversations": {},
     "recent_conversations": []
 }
 
 
+# 统计时间戳只保留趋势图窗口（12小时）内的记录
+STATS_WINDOW_SECONDS = TREND_HOURS * 3600
+
+
+def append_stats_timestamp(timestamps: list, ts: float):
+    """追加时间戳，并丢弃统计窗口之前的记录（列表按时间递增）"""
+    timestamps.append(ts)
+    if ts - timestamps[0] >= STATS_WINDOW_SECONDS:
+        del timestamps[:bisect_right(timestamps, ts - STATS_WINDOW_SECONDS)]
+
+
 def get_beijing_time_str(ts: Optional[float] = None) -> str:
     tz = timezone(timedelta(hours=8))
     current = datetime.fromtimestamp(ts or time.time(), tz=tz)
@@ -219,20 +260,6 @@ def build_recent_conversation_entry(
         "events": events,
     }
 
-class MemoryLogHandler(logging.Handler):
-    """自定义日志处理器，将日志写入内存缓冲区"""
-    def emit(self, record):
-        log_entry = self.format(record)
-        # 转换为北京时间（UTC+8）
-        beijing_tz = timezone(timedelta(hours=8))
-        beijing_time = datetime.fromtimestamp(record.created, tz=beijing_tz)
-        with log_lock:
-            log_buffer.append({
-                "time": beijing_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "level": record.levelname,
-                "message": record.getMessage()
-            })
-
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -241,10 +268,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger("gemini")
 
-# 添加内存日志处理器
-memory_handler = MemoryLogHandler()
-memory_handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s", datefmt="%H:%M:%S"))
-logger.addHandler(memory_handler)
+# 添加内存日志处理器（结构化条目，按请求ID索引）
+memory_handler = LogStoreHandler(log_store)
+# 请求路径只把日志记录放入队列，控制台输出、内存索引和磁盘日志都在后台线程完成
+log_listener = start_log_pipeline(logger, memory_handler, *logging.getLogger().handlers)
+
+# 内容预览日志采样（用户消息/发送内容/AI响应）
+preview_sampler = PreviewSampler(logger, config.logging.preview_sample_rate, config.logging.preview_level)
+
+# 磁盘日志分段目录（logging.persist_enabled 开启时写入）
+LOG_SEGMENT_DIR = os.path.join(DATA_DIR, "logs")
+
+
+def configure_log_sink():
+    """按 logging 配置开启/关闭/调整磁盘日志"""
+    sink = memory_handler.sink
+    max_bytes = config.logging.segment_max_mb * 1024 * 1024
+    if not config.logging.persist_enabled:
+        if sink is not None:
+            memory_handler.sink = None
+            sink.close()
+            logger.info("[LOG] 磁盘日志已关闭")
+        return
+    if sink is not None:
+        sink.configure(max_bytes, config.logging.segment_max_count)
+        return
+    sink = LogSegmentSink(LOG_SEGMENT_DIR, max_bytes, config.logging.segment_max_count)
+    try:
+        sink.open()
+    except OSError as e:
+        logger.error(f"[LOG] 磁盘日志启用失败: {e}")
+        return
+    memory_handler.sink = sink
+
+
+configure_log_sink()
 
 # ---------- 配置管理（使用统一配置系统）----------
 # 所有配置通过 config_manager 访问，优先级：环境变量 > YAML > 默认值
@@ -294,6 +352,16 @@ http_client = httpx.AsyncClient(
     )
 )
 
+# URL 附件下载器（独立连接池，带大小限制和磁盘缓存）
+url_file_fetcher = UrlFileFetcher(proxy=PROXY, cache_dir=URL_CACHE_DIR)
+
+# 会话重建上下文构建器（按会话缓存，按字符预算截断）
+context_builder = ContextBuilder()
+
+# 会话缓存持久化（内存后端使用；数据库优先，否则写入本地日志文件）
+session_cache_store = SessionCacheStore(SESSION_CACHE_FILE)
+SESSION_CACHE_FLUSH_SECONDS = 10
+
 # ---------- 工具函数 ----------
 def get_base_url(request: Request) -> str:
     """获取完整的base URL（优先环境变量，否则从请求自动获取）"""
@@ -327,6 +395,17 @@ multi_account_mgr = load_multi_account_config(
     SESSION_CACHE_TTL_SECONDS,
     global_stats
 )
+# 会话缓存/锁后端（SESSION_BACKEND=memory|postgres），重载账户时由新管理器接管
+multi_account_mgr.session_backend = create_session_backend(
+    SESSION_CACHE_TTL_SECONDS,
+    config.retry.session_cache_max_size,
+    session_cache_store
+)
+# 账户健康事件总线（ACCOUNT_HEALTH_BUS=none|postgres|unix），多 worker 共享限流/失败状态
+multi_account_mgr.health_bus = create_health_bus(os.path.join(DATA_DIR, "health_bus"))
+
+# 管理面板统计快照（账户状态每隔几秒重新计算，请求趋势按小时累加）
+stats_aggregator = StatsAggregator(lambda: multi_account_mgr.accounts.values(), MODEL_MAPPING.keys())
 
 # ---------- 自动注册/刷新服务 ----------
 register_service = None
@@ -487,68 +566,128 @@ else:
 
 # ---------- 后台任务启动 ----------
 
-# 全局变量：记录上次检测到的账号更新时间（用于自动刷新检测）
-_last_known_accounts_version: float | None = None
+# 全局变量：账号变化游标（用于自动刷新检测，见 storage.load_accounts_changed_since）
+_accounts_cursor: storage.AccountsCursor | None = None
+ACCOUNTS_LISTENER_CHECK_SECONDS = 30  # 监听模式下检查连接状态的间隔
+
+
+async def _refresh_changed_accounts():
+    """读取游标之后变化的账号行并增量应用"""
+    global multi_account_mgr, _accounts_cursor
+
+    if _accounts_cursor is None:
+        _accounts_cursor = await storage.run_async(storage.get_accounts_cursor())
+        return
+    changes = await storage.run_async(storage.load_accounts_changed_since(_accounts_cursor))
+    if changes is None:
+        return
+    changed_rows, next_cursor = changes
+
+    if changed_rows:
+        logger.info(f"[AUTO-REFRESH] 检测到 {len(changed_rows)} 个账号变化，正在自动刷新...")
+
+        # 增量应用变化的账号
+        multi_account_mgr = _apply_account_changes(
+            changed_rows,
+            multi_account_mgr,
+            http_client,
+            USER_AGENT,
+            ACCOUNT_FAILURE_THRESHOLD,
+            RATE_LIMIT_COOLDOWN_SECONDS,
+            SESSION_CACHE_TTL_SECONDS,
+            global_stats
+        )
+
+        logger.info(f"[AUTO-REFRESH] 账号刷新完成，当前账号数: {len(multi_account_mgr.accounts)}")
+    _accounts_cursor = next_cursor
 
 
 async def auto_refresh_accounts_task():
-    """后台任务：定期检查数据库中的账号变化，自动刷新"""
-    global multi_account_mgr, _last_known_accounts_version
+    """
+    后台任务：数据库中的账号变化后自动刷新
+
+    优先 LISTEN 账号表触发器发出的通知（独立连接，收到通知立即刷新）；
+    监听连接断开期间按 auto_refresh_accounts_seconds 轮询，并在每轮尝试重新监听
+    """
+    global _accounts_cursor
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    listener = None
 
-    # 初始化：记录当前账号更新时间
+    def _wake(_payload=None):
+        loop.call_soon_threadsafe(changed.set)
+
+    # 初始化：记录当前账号游标
     if storage.is_database_enabled() and not os.environ.get("ACCOUNTS_CONFIG"):
-        _last_known_accounts_version = await asyncio.to_thread(
-            storage.get_accounts_updated_at_sync
-        )
+        _accounts_cursor = await storage.run_async(storage.get_accounts_cursor())
 
-    while True:
-        try:
-            # 获取配置的刷新间隔（支持热更新）
-            refresh_interval = config_manager.auto_refresh_accounts_seconds
-            if refresh_interval <= 0:
-                # 自动刷新已禁用，等待一段时间后再检查配置
-                await asyncio.sleep(60)
-                continue
-
-            await asyncio.sleep(refresh_interval)
-
-            # 环境变量优先时无需自动刷新
-            if os.environ.get("ACCOUNTS_CONFIG"):
-                continue
-
-            # 检查数据库是否启用
-            if not storage.is_database_enabled():
-                continue
-
-            # 获取数据库中的账号更新时间
-            db_version = await asyncio.to_thread(storage.get_accounts_updated_at_sync)
-            if db_version is None:
-                continue
-
-            # 比较更新时间变化
-            if _last_known_accounts_version != db_version:
-                logger.info("[AUTO-REFRESH] 检测到账号变化，正在自动刷新...")
-
-                # 重新加载账号配置
-                multi_account_mgr = _reload_accounts(
-                    multi_account_mgr,
-                    http_client,
-                    USER_AGENT,
-                    ACCOUNT_FAILURE_THRESHOLD,
-                    RATE_LIMIT_COOLDOWN_SECONDS,
-                    SESSION_CACHE_TTL_SECONDS,
-                    global_stats
-                )
+    try:
+        while True:
+            try:
+                # 获取配置的刷新间隔（支持热更新）
+                refresh_interval = config_manager.auto_refresh_accounts_seconds
+                if refresh_interval <= 0:
+                    # 自动刷新已禁用，等待一段时间后再检查配置
+                    await asyncio.sleep(60)
+                    continue
+
+                # 环境变量优先时无需自动刷新；未启用数据库时无需刷新
+                if os.environ.get("ACCOUNTS_CONFIG") or not storage.is_database_enabled():
+                    await asyncio.sleep(refresh_interval)
+                    continue
+
+                if listener is not None and listener.is_closed():
+                    logger.warning("[AUTO-REFRESH] 账号变更监听已断开，改为轮询")
+                    listener = None
+                if listener is None:
+                    try:
+                        listener = await storage.run_async(
+                            storage.open_listener(storage.ACCOUNTS_CHANNEL, _wake, on_close=_wake)
+                        )
+                        logger.info("[AUTO-REFRESH] 已监听账号变更通知")
+                        changed.set()  # 补查未监听期间的变化
+                    except Exception as e:
+                        logger.warning(f"[AUTO-REFRESH] 账号变更监听失败，使用轮询: {type(e).__name__}: {str(e)[:80]}")
+
+                if listener is not None:
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=ACCOUNTS_LISTENER_CHECK_SECONDS)
+                    except asyncio.TimeoutError:
+                        continue
+                    changed.clear()
+                    if listener.is_closed():
+                        continue
+                else:
+                    await asyncio.sleep(refresh_interval)
+
+                await _refresh_changed_accounts()
+
+            except asyncio.CancelledError:
+                logger.info("[AUTO-REFRESH] 自动刷新任务已停止")
+                break
+            except Exception as e:
+                logger.error(f"[AUTO-REFRESH] 自动刷新任务异常: {type(e).__name__}: {str(e)[:100]}")
+                await asyncio.sleep(60)  # 出错后等待60秒再重试
+    finally:
+        if listener is not None:
+            try:
+                await storage.run_async(storage.close_listener(listener))
+            except Exception:
+                pass
 
-                _last_known_accounts_version = db_version
-                logger.info(f"[AUTO-REFRESH] 账号刷新完成，当前账号数: {len(multi_account_mgr.accounts)}")
 
+async def session_cache_persist_task():
+    """后台任务：定期增量保存会话缓存"""
+    while True:
+        try:
+            await asyncio.sleep(SESSION_CACHE_FLUSH_SECONDS)
+            await multi_account_mgr.session_backend.flush()
         except asyncio.CancelledError:
-            logger.info("[AUTO-REFRESH] 自动刷新任务已停止")
+            logger.info("[CACHE] 会话缓存持久化任务已停止")
             break
         except Exception as e:
-            logger.error(f"[AUTO-REFRESH] 自动刷新任务异常: {type(e).__name__}: {str(e)[:100]}")
-            await asyncio.sleep(60)  # 出错后等待60秒再重试
+            logger.error(f"[CACHE] 会话缓存持久化异常: {type(e).__name__}: {str(e)[:100]}")
 
 
 @app.on_event("startup")
@@ -556,6 +695,14 @@ async def startup_event():
     """应用启动时初始化后台任务"""
     global global_stats
 
+    # 数据库连接池绑定到应用事件循环（异步调用不再经过后台线程中转）
+    if storage.is_database_enabled():
+        try:
+            await storage.open_app_pool()
+            logger.info("[SYSTEM] 数据库连接池已绑定到应用事件循环")
+        except Exception as e:
+            logger.error(f"[SYSTEM] 数据库连接池初始化失败，使用后台线程: {type(e).__name__}: {str(e)[:100]}")
+
     # 文件迁移逻辑：将根目录的旧文件迁移到 data 目录
     old_accounts = "accounts.json"
     if os.path.exists(old_accounts) and not os.path.exists(ACCOUNTS_FILE):
@@ -572,20 +719,52 @@ async def startup_event():
     global_stats.setdefault("failure_timestamps", [])
     global_stats.setdefault("rate_limit_timestamps", [])
     global_stats.setdefault("recent_conversations", [])
+    public_log_timeline.seed(global_stats["recent_conversations"])
+    visitor_counter.load(global_stats.get("visitor_filter"))
+    stats_aggregator.seed(global_stats)
+    # 兼容旧版统计数据：把 24 小时内的 visitor_ips 导入 Bloom filter
+    legacy_visitors = global_stats.pop("visitor_ips", None)
+    if isinstance(legacy_visitors, dict):
+        now = time.time()
+        for ip, ts in legacy_visitors.items():
+            if isinstance(ts, (int, float)) and now - ts <= 86400:
+                visitor_counter.add(ip, ts)
+        global_stats["visitor_filter"] = visitor_counter.to_dict()
     uptime_tracker.configure_storage(os.path.join(DATA_DIR, "uptime.json"))
     uptime_tracker.load_heartbeats()
     logger.info(f"[SYSTEM] 统计数据已加载: {global_stats['total_requests']} 次请求, {global_stats['total_visitors']} 位访客")
 
+    # 预热会话缓存（重启后保留对话与 Session 的绑定）
+    try:
+        restored = await multi_account_mgr.session_backend.restore(multi_account_mgr.accounts)
+        logger.info(f"[SYSTEM] 会话缓存已恢复: {restored} 条")
+    except Exception as e:
+        logger.error(f"[SYSTEM] 会话缓存恢复失败: {type(e).__name__}: {str(e)[:100]}")
+
+    # 接收其他 worker 广播的账户健康事件（始终应用到当前的账户管理器）
+    try:
+        await multi_account_mgr.health_bus.start(
+            lambda event: multi_account_mgr.apply_health_event(event)
+        )
+    except Exception as e:
+        logger.error(f"[SYSTEM] 账户健康事件总线启动失败: {type(e).__name__}: {str(e)[:100]}")
+
     # 启动缓存清理任务
     asyncio.create_task(multi_account_mgr.start_background_cleanup())
     logger.info("[SYSTEM] 后台缓存清理任务已启动（间隔: 5分钟）")
 
+    # 启动会话缓存持久化任务
+    asyncio.create_task(session_cache_persist_task())
+
+    # 启动管理面板统计快照任务
+    asyncio.create_task(stats_aggregator.run())
+
     # 启动自动刷新账号任务（仅数据库模式有效）
     if os.environ.get("ACCOUNTS_CONFIG"):
         logger.info("[SYSTEM] 自动刷新账号已跳过（使用 ACCOUNTS_CONFIG）")
     elif storage.is_database_enabled() and AUTO_REFRESH_ACCOUNTS_SECONDS > 0:
         asyncio.create_task(auto_refresh_accounts_task())
-        logger.info(f"[SYSTEM] 自动刷新账号任务已启动（间隔: {AUTO_REFRESH_ACCOUNTS_SECONDS}秒）")
+        logger.info(f"[SYSTEM] 自动刷新账号任务已启动（监听变更通知，断开时轮询间隔: {AUTO_REFRESH_ACCOUNTS_SECONDS}秒）")
     elif storage.is_database_enabled():
         logger.info("[SYSTEM] 自动刷新账号功能已禁用（配置为0）")
 
@@ -599,210 +778,107 @@ async def startup_event():
     else:
         logger.info("[SYSTEM] 自动登录刷新未启用或依赖不可用")
 
-# ---------- 日志脱敏函数 ----------
-def get_sanitized_logs(limit: int = 100) -> list:
-    """获取脱敏后的日志列表，按请求ID分组并提取关键事件"""
-    with log_lock:
-        logs = list(log_buffer)
-
-    # 按请求ID分组（支持两种格式：带[req_xxx]和不带的）
-    request_logs = {}
-    orphan_logs = []  # 没有request_id的日志（如选择账户）
-
-    for log in logs:
-        message = log["message"]
-        req_match = re.search(r'\[req_([a-z0-9]+)\]', message)
-
-        if req_match:
-            request_id = req_match.group(1)
-            if request_id not in request_logs:
-                request_logs[request_id] = []
-            request_logs[request_id].append(log)
-        else:
-            # 没有request_id的日志（如选择账户），暂存
-            orphan_logs.append(log)
-
-    # 将orphan_logs（如选择账户）关联到对应的请求
-    # 策略：将orphan日志关联到时间上最接近的后续请求
-    for orphan in orphan_logs:
-        orphan_time = orphan["time"]
-        # 找到时间上最接近且在orphan之后的请求
-        closest_request_id = None
-        min_time_diff = None
-
-        for request_id, req_logs in request_logs.items():
-            if req_logs:
-                first_log_time = req_logs[0]["time"]
-                # orphan应该在请求之前或同时
-                if first_log_time >= orphan_time:
-                    if min_time_diff is None or first_log_time < min_time_diff:
-                        min_time_diff = first_log_time
-                        closest_request_id = request_id
-
-        # 如果找到最接近的请求，将orphan日志插入到该请求的日志列表开头
-        if closest_request_id:
-            request_logs[closest_request_id].insert(0, orphan)
-
-    # 为每个请求提取关键事件
-    sanitized = []
-    for request_id, req_logs in request_logs.items():
-        # 收集关键信息
-        model = None
-        message_count = None
-        retry_events = []
-        final_status = "in_progress"
-        duration = None
-        start_time = req_logs[0]["time"]
-
-        # 遍历该请求的所有日志
-        for log in req_logs:
-            message = log["message"]
-
-            # 提取模型名称和消息数量（开始对话）
-            if '收到请求:' in message and not model:
-                model_match = re.search(r'收到请求: ([^ |]+)', message)
-                if model_match:
-                    model = model_match.group(1)
-                count_match = re.search(r'(\d+)条消息', message)
-                if count_match:
-                    message_count = int(count_match.group(1))
-
-            # 提取重试事件（包括失败尝试、账户切换、选择账户）
-            # 注意：不提取"正在重试"日志，因为它和"失败 (尝试"是配套的
-            if any(keyword in message for keyword in ['切换账户', '选择账户', '失败 (尝试']):
-                retry_events.append({
-                    "time": log["time"],
-                    "message": message
-                })
-
-            # 提取响应完成（最高优先级 - 最终成功则忽略中间错误）
-            if '响应完成:' in message:
-                time_match = re.search(r'响应完成: ([\d.]+)秒', message)
-                if time_match:
-                    duration = time_match.group(1) + 's'
-                    final_status = "success"
-
-            # 检测非流式响应完成
-            if '非流式响应完成' in message:
-                final_status = "success"
-
-            # 检测失败状态（仅在非success状态下）
-            if final_status != "success" and (log['level'] == 'ERROR' or '失败' in message):
-                final_status = "error"
-
-            # 检测超时（仅在非success状态下）
-            if final_status != "success" and '超时' in message:
-                final_status = "timeout"
-
-        # 如果没有模型信息但有错误，仍然显示
-        if not model and final_status == "in_progress":
-            continue
-
-        # 构建关键事件列表
-        events = []
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时保存尚未持久化的会话缓存"""
+    try:
+        await multi_account_mgr.session_backend.flush()
+    except Exception as e:
+        logger.error(f"[SYSTEM] 会话缓存保存失败: {type(e).__name__}: {str(e)[:100]}")
+    await multi_account_mgr.health_bus.stop()
+    await url_file_fetcher.aclose()
+    await storage.close_app_pool()
+    log_listener.stop()  # 处理完队列中剩余的日志
+    if memory_handler.sink is not None:
+        memory_handler.sink.close()
 
-        # 1. 开始对话
-        if model:
+# ---------- 日志脱敏函数 ----------
+def _build_request_timeline(request_id: str, req_logs: list) -> Optional[dict]:
+    """根据单个请求的结构化日志条目构建脱敏时间线"""
+    model = None
+    message_count = None
+    duration = None
+    final_status = "in_progress"
+    events = []
+    failure_count = 0
+
+    for log in req_logs:
+        event = log.get("event")
+        data = log.get("data") or {}
+
+        if event == LOG_EVENT_START and not model:
+            model = data.get("model")
+            message_count = data.get("message_count")
+        elif event == LOG_EVENT_RETRY:
+            failure_count += 1
             events.append({
-                "time": start_time,
-                "type": "start",
-                "content": f"{model} | {message_count}条消息" if message_count else model
+                "time": log["time"],
+                "type": "retry",
+                "content": f"服务异常，正在重试（{failure_count}）"
             })
-        else:
-            # 没有模型信息但有错误的情况
+        elif event == LOG_EVENT_SWITCH:
             events.append({
-                "time": start_time,
-                "type": "start",
-                "content": "请求处理中"
+                "time": log["time"],
+                "type": "switch",
+                "content": "切换服务节点"
             })
+        elif event == LOG_EVENT_COMPLETE:
+            # 最高优先级：最终成功则忽略中间错误
+            final_status = "success"
+            if data.get("duration") is not None:
+                duration = data["duration"]
+
+        if final_status != "success":
+            if event == LOG_EVENT_TIMEOUT:
+                final_status = "timeout"
+            elif log["level"] == "ERROR" and final_status != "timeout":
+                final_status = "error"
 
-        # 2. 重试事件
-        failure_count = 0  # 失败重试计数
-        account_select_count = 0  # 账户选择计数
-
-        for i, retry in enumerate(retry_events):
-            msg = retry["message"]
-
-            # 识别不同类型的重试事件（按优先级匹配）
-            if '失败 (尝试' in msg:
-                # 创建会话失败
-                failure_count += 1
-                events.append({
-                    "time": retry["time"],
-                    "type": "retry",
-                    "content": f"服务异常，正在重试（{failure_count}）"
-                })
-            elif '选择账户' in msg:
-                # 账户选择/切换
-                account_select_count += 1
-
-                # 检查下一条日志是否是"切换账户"，如果是则跳过当前"选择账户"（避免重复）
-                next_is_switch = (i + 1 < len(retry_events) and '切换账户' in retry_events[i + 1]["message"])
-
-                if not next_is_switch:
-                    if account_select_count == 1:
-                        # 第一次选择：显示为"选择服务节点"
-                        events.append({
-                            "time": retry["time"],
-                            "type": "select",
-                            "content": "选择服务节点"
-                        })
-                    else:
-                        # 第二次及以后：显示为"切换服务节点"
-                        events.append({
-                            "time": retry["time"],
-                            "type": "switch",
-                            "content": "切换服务节点"
-                        })
-            elif '切换账户' in msg:
-                # 运行时切换账户（显示为"切换服务节点"）
-                events.append({
-                    "time": retry["time"],
-                    "type": "switch",
-                    "content": "切换服务节点"
-                })
+    # 没有模型信息且仍在处理中的请求不展示
+    if not model and final_status == "in_progress":
+        return None
 
-        # 3. 完成事件
-        if final_status == "success":
-            if duration:
-                events.append({
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "success",
-                    "content": f"响应完成 | 耗时{duration}"
-                })
-            else:
-                events.append({
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "success",
-                    "content": "响应完成"
-                })
-        elif final_status == "error":
-            events.append({
-                "time": req_logs[-1]["time"],
-                "type": "complete",
-                "status": "error",
-                "content": "请求失败"
-            })
-        elif final_status == "timeout":
-            events.append({
-                "time": req_logs[-1]["time"],
-                "type": "complete",
-                "status": "timeout",
-                "content": "请求超时"
-            })
+    start_time = req_logs[0]["time"]
+    if model:
+        start_content = f"{model} | {message_count}条消息" if message_count else model
+    else:
+        start_content = "请求处理中"
+    events.insert(0, {"time": start_time, "type": "start", "content": start_content})
 
-        sanitized.append({
-            "request_id": request_id,
-            "start_time": start_time,
-            "status": final_status,
-            "events": events
+    end_time = req_logs[-1]["time"]
+    if final_status == "success":
+        events.append({
+            "time": end_time,
+            "type": "complete",
+            "status": "success",
+            "content": f"响应完成 | 耗时{duration:.2f}s" if duration is not None else "响应完成"
+        })
+    elif final_status == "error":
+        events.append({
+            "time": end_time,
+            "type": "complete",
+            "status": "error",
+            "content": "请求失败"
+        })
+    elif final_status == "timeout":
+        events.append({
+            "time": end_time,
+            "type": "complete",
+            "status": "timeout",
+            "content": "请求超时"
         })
 
-    # 按时间排序并限制数量
-    sanitized.sort(key=lambda x: x["start_time"], reverse=True)
-    return sanitized[:limit]
+    return {
+        "request_id": request_id,
+        "start_time": start_time,
+        "status": final_status,
+        "events": events
+    }
+
+
+# 公开日志时间线（请求进行/结束时增量维护，/public/log 直接读取缓存）
+public_log_timeline = PublicLogTimeline(log_store, _build_request_timeline)
+log_store.add_listener(public_log_timeline.on_log_entry)
 
 class Message(BaseModel):
     role: str
@@ -856,138 +932,130 @@ async def admin_logout(request: Request):
 @app.get("/admin/stats")
 @require_login()
 async def admin_stats(request: Request):
-    now = time.time()
-    window_seconds = 12 * 3600
+    """账户状态与 12 小时趋势（后台定期刷新的快照）"""
+    stats = dict(stats_aggregator.snapshot())
+    stats.pop("generated_at", None)
+    return {"session_cache": multi_account_mgr.session_backend.stats(), **stats}
+
+# /admin/accounts 可选返回字段（fields 参数）
+ACCOUNT_INFO_FIELDS = (
+    "id", "state", "status", "expires_at", "remaining_hours", "remaining_display",
+    "is_available", "error_count", "disabled", "cooldown_seconds", "cooldown_reason",
+    "conversation_count",
+)
 
-    active_accounts = 0
-    failed_accounts = 0
-    rate_limited_accounts = 0
-    idle_accounts = 0
 
-    for account_manager in multi_account_mgr.accounts.values():
-        config = account_manager.config
-        cooldown_seconds, cooldown_reason = account_manager.get_cooldown_info()
-        is_rate_limited = cooldown_seconds > 0 and cooldown_reason and "429" in cooldown_reason
-        is_expired = config.is_expired()
-        is_auto_disabled = (not account_manager.is_available) and (not config.disabled)
-        is_failed = is_auto_disabled or is_expired or cooldown_reason == "错误禁用"
-        is_active = (not is_failed) and (not config.disabled) and (not is_rate_limited)
-
-        if is_rate_limited:
-            rate_limited_accounts += 1
-        elif is_failed:
-            failed_accounts += 1
-        elif is_active:
-            active_accounts += 1
-        else:
-            idle_accounts += 1
+def build_account_info(account_manager: AccountManager, fields: Optional[set] = None) -> dict:
+    """账户状态信息（fields 为 None 时返回全部字段，否则只计算所需字段）"""
+    config = account_manager.config
 
-    total_accounts = len(multi_account_mgr.accounts)
+    def want(*names) -> bool:
+        return fields is None or any(name in fields for name in names)
 
-    beijing_tz = timezone(timedelta(hours=8))
-    now_dt = datetime.now(beijing_tz)
-    start_dt = (now_dt - timedelta(hours=11)).replace(minute=0, second=0, microsecond=0)
-    start_ts = start_dt.timestamp()
-    labels = [(start_dt + timedelta(hours=i)).strftime("%H:00") for i in range(12)]
+    info = {}
+    if want("id"):
+        info["id"] = config.account_id
+    if want("state"):
+        info["state"] = account_manager.get_status()
+    if want("status", "remaining_hours", "remaining_display"):
+        remaining_hours = config.get_remaining_hours()
+        status, _, remaining_display = format_account_expiration(remaining_hours)
+        if want("status"):
+            info["status"] = status
+        if want("expires_at"):
+            info["expires_at"] = config.expires_at or "未设置"
+        if want("remaining_hours"):
+            info["remaining_hours"] = remaining_hours
+        if want("remaining_display"):
+            info["remaining_display"] = remaining_display
+    elif want("expires_at"):
+        info["expires_at"] = config.expires_at or "未设置"
+    if want("is_available"):
+        info["is_available"] = account_manager.is_available
+    if want("error_count"):
+        info["error_count"] = account_manager.error_count
+    if want("disabled"):
+        info["disabled"] = config.disabled
+    if want("cooldown_seconds", "cooldown_reason"):
+        cooldown_seconds, cooldown_reason = account_manager.get_cooldown_info()
+        if want("cooldown_seconds"):
+            info["cooldown_seconds"] = cooldown_seconds
+        if want("cooldown_reason"):
+            info["cooldown_reason"] = cooldown_reason
+    if want("conversation_count"):
+        info["conversation_count"] = account_manager.conversation_count
+    return info
 
-    def bucketize(timestamps: list) -> list:
-        buckets = [0] * 12
-        for ts in timestamps:
-            idx = int((ts - start_ts) // 3600)
-            if 0 <= idx < 12:
-                buckets[idx] += 1
-        return buckets
 
-    async with stats_lock:
-        global_stats.setdefault("request_timestamps", [])
-        global_stats.setdefault("failure_timestamps", [])
-        global_stats.setdefault("rate_limit_timestamps", [])
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats["request_timestamps"] = [
-            ts for ts in global_stats["request_timestamps"]
-            if now - ts < window_seconds
-        ]
-        global_stats["failure_timestamps"] = [
-            ts for ts in global_stats["failure_timestamps"]
-            if now - ts < window_seconds
-        ]
-        global_stats["rate_limit_timestamps"] = [
-            ts for ts in global_stats["rate_limit_timestamps"]
-            if now - ts < window_seconds
-        ]
-        model_request_timestamps = {}
-        for model, timestamps in global_stats["model_request_timestamps"].items():
-            model_request_timestamps[model] = [
-                ts for ts in timestamps
-                if now - ts < window_seconds
-            ]
-        global_stats["model_request_timestamps"] = model_request_timestamps
+def _parse_csv_param(value: Optional[str], allowed: tuple, name: str) -> Optional[set]:
+    if not value:
+        return None
+    items = {item.strip() for item in value.split(",") if item.strip()}
+    invalid = items - set(allowed)
+    if invalid:
+        raise HTTPException(400, f"无效的 {name}: {', '.join(sorted(invalid))}（可选: {', '.join(allowed)}）")
+    return items
 
-        await save_stats(global_stats)
-
-        request_timestamps = list(global_stats["request_timestamps"])
-        failure_timestamps = list(global_stats["failure_timestamps"])
-        rate_limit_timestamps = list(global_stats["rate_limit_timestamps"])
-        model_request_timestamps = global_stats.get("model_request_timestamps", {})
-        model_requests = {}
-        for model in MODEL_MAPPING.keys():
-            model_requests[model] = bucketize(model_request_timestamps.get(model, []))
-        for model, timestamps in model_request_timestamps.items():
-            if model not in model_requests:
-                model_requests[model] = bucketize(timestamps)
-
-    return {
-        "total_accounts": total_accounts,
-        "active_accounts": active_accounts,
-        "failed_accounts": failed_accounts,
-        "rate_limited_accounts": rate_limited_accounts,
-        "idle_accounts": idle_accounts,
-        "trend": {
-            "labels": labels,
-            "total_requests": bucketize(request_timestamps),
-            "failed_requests": bucketize(failure_timestamps),
-            "rate_limited_requests": bucketize(rate_limit_timestamps),
-            "model_requests": model_requests,
-        }
-    }
 
 @app.get("/admin/accounts")
 @require_login()
-async def admin_get_accounts(request: Request):
-    """获取所有账户的状态信息"""
-    accounts_info = []
-    for account_id, account_manager in multi_account_mgr.accounts.items():
-        config = account_manager.config
-        remaining_hours = config.get_remaining_hours()
-        status, status_color, remaining_display = format_account_expiration(remaining_hours)
-        cooldown_seconds, cooldown_reason = account_manager.get_cooldown_info()
+async def admin_get_accounts(
+    request: Request,
+    page: Optional[int] = None,
+    page_size: int = 50,
+    status: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    获取账户状态信息
 
-        accounts_info.append({
-            "id": config.account_id,
-            "status": status,
-            "expires_at": config.expires_at or "未设置",
-            "remaining_hours": remaining_hours,
-            "remaining_display": remaining_display,
-            "is_available": account_manager.is_available,
-            "error_count": account_manager.error_count,
-            "disabled": config.disabled,
-            "cooldown_seconds": cooldown_seconds,
-            "cooldown_reason": cooldown_reason,
-            "conversation_count": account_manager.conversation_count
-        })
+    - status: 按状态筛选（active/cooldown/failed/expired/disabled，可逗号分隔多个）
+    - fields: 只返回指定字段（逗号分隔）
+    - page/page_size: 分页（从 1 开始）；不传 page 时返回全部
+    """
+    statuses = _parse_csv_param(status, ACCOUNT_STATUSES, "status")
+    field_set = _parse_csv_param(fields, ACCOUNT_INFO_FIELDS, "fields")
+
+    if statuses:
+        # 状态索引由账户状态变化维护，筛选时不逐个计算状态
+        total = multi_account_mgr.count_by_status(statuses)
+        managers = multi_account_mgr.iter_by_status(statuses)
+    else:
+        total = len(multi_account_mgr.accounts)
+        managers = iter(multi_account_mgr.accounts.values())
 
-    return {"total": len(accounts_info), "accounts": accounts_info}
+    result = {"total": total}
+    if page is not None:
+        page = max(page, 1)
+        page_size = max(1, min(page_size, 1000))
+        managers = islice(managers, (page - 1) * page_size, page * page_size)
+        result.update({"page": page, "page_size": page_size})
+
+    result["accounts"] = [build_account_info(m, field_set) for m in list(managers)]
+    return result
 
 @app.get("/admin/accounts-config")
 @require_login()
-async def admin_get_config(request: Request):
-    """获取完整账户配置"""
-    try:
-        accounts_data = load_accounts_from_source()
+async def admin_get_config(request: Request, page: Optional[int] = None, page_size: int = 50):
+    """获取完整账户配置（传 page 时分页返回）"""
+    if page is None:
+        try:
+            accounts_data = await load_accounts_from_source_async()
+        except Exception as e:
+            logger.error(f"[CONFIG] 获取配置失败: {str(e)}")
+            raise HTTPException(500, f"获取失败: {str(e)}")
         return {"accounts": accounts_data}
-    except Exception as e:
-        logger.error(f"[CONFIG] 获取配置失败: {str(e)}")
-        raise HTTPException(500, f"获取失败: {str(e)}")
+    # 分页时直接取内存中已加载的账户配置，只转换当前页
+    page = max(page, 1)
+    page_size = max(1, min(page_size, 1000))
+    accounts = multi_account_mgr.accounts
+    page_accounts = islice(accounts.values(), (page - 1) * page_size, page * page_size)
+    return {
+        "total": len(accounts),
+        "page": page,
+        "page_size": page_size,
+        "accounts": [account.config.to_dict() for account in page_accounts],
+    }
 
 @app.put("/admin/accounts-config")
 @require_login()
@@ -1005,6 +1073,66 @@ async def admin_update_config(request: Request, accounts_data: list = Body(...))
         logger.error(f"[CONFIG] 更新配置失败: {str(e)}")
         raise HTTPException(500, f"更新失败: {str(e)}")
 
+@app.get("/admin/accounts-config/export")
+@require_login()
+async def admin_export_config(request: Request):
+    """以 NDJSON 流式导出账户配置（每行一个账户）"""
+    try:
+        accounts_data = await load_accounts_from_source_async()
+    except Exception as e:
+        logger.error(f"[CONFIG] 导出配置失败: {str(e)}")
+        raise HTTPException(500, f"导出失败: {str(e)}")
+    logger.info(f"[CONFIG] 导出账户配置: {len(accounts_data)} 个账户")
+    return StreamingResponse(
+        iter_accounts_ndjson(accounts_data),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="accounts.ndjson"'}
+    )
+
+@app.post("/admin/accounts-config/import")
+@require_login()
+async def admin_import_config(request: Request, mode: str = "merge"):
+    """
+    以 NDJSON 流式导入账户配置（每行一个账户）
+
+    - mode=merge: 按ID覆盖已有账户，新账户追加（默认）；每行必须包含 id
+    - mode=replace: 替换全部账户
+
+    请求体边接收边解析校验；任一行无效时不做任何修改，全部有效时只保存一次
+    """
+    if mode not in ACCOUNT_IMPORT_MODES:
+        raise HTTPException(400, f"无效的 mode: {mode}（可选: {', '.join(ACCOUNT_IMPORT_MODES)}）")
+
+    importer = AccountImporter(require_id=(mode == "merge"))
+    async for chunk in request.stream():
+        importer.feed(chunk)
+    importer.close()
+
+    if importer.error_count:
+        raise HTTPException(400, {
+            "message": f"{importer.error_count} 行无效，未导入任何账户",
+            "errors": importer.errors
+        })
+    if not importer.accounts:
+        raise HTTPException(400, "没有可导入的账户")
+
+    try:
+        diff = await _import_accounts(
+            importer, mode, multi_account_mgr, http_client, USER_AGENT,
+            ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS, global_stats
+        )
+    except Exception as e:
+        logger.error(f"[CONFIG] 导入配置失败: {str(e)}")
+        raise HTTPException(500, f"导入失败: {str(e)}")
+    return {
+        "status": "success",
+        "imported": len(importer.accounts),
+        "added": len(diff["added"]),
+        "updated": len(diff["updated"]),
+        "removed": len(diff["removed"]),
+        "account_count": len(multi_account_mgr.accounts)
+    }
+
 @app.post("/admin/register/start")
 @require_login()
 async def admin_start_register(request: Request, count: Optional[int] = Body(default=None), domain: Optional[str] = Body(default=None)):
@@ -1075,7 +1203,7 @@ async def admin_delete_account(request: Request, account_id: str):
     """删除单个账户"""
     global multi_account_mgr
     try:
-        multi_account_mgr = _delete_account(
+        multi_account_mgr = await _delete_account(
             account_id, multi_account_mgr, http_client, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
@@ -1091,7 +1219,7 @@ async def admin_disable_account(request: Request, account_id: str):
     """手动禁用账户"""
     global multi_account_mgr
     try:
-        multi_account_mgr = _update_account_disabled_status(
+        multi_account_mgr = await _update_account_disabled_status(
             account_id, True, multi_account_mgr, http_client, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
@@ -1107,7 +1235,7 @@ async def admin_enable_account(request: Request, account_id: str):
     """启用账户（同时重置错误禁用状态）"""
     global multi_account_mgr
     try:
-        multi_account_mgr = _update_account_disabled_status(
+        multi_account_mgr = await _update_account_disabled_status(
             account_id, False, multi_account_mgr, http_client, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
@@ -1115,10 +1243,7 @@ async def admin_enable_account(request: Request, account_id: str):
 
         # 重置运行时错误状态（允许手动恢复错误禁用的账户）
         if account_id in multi_account_mgr.accounts:
-            account_mgr = multi_account_mgr.accounts[account_id]
-            account_mgr.is_available = True
-            account_mgr.error_count = 0
-            account_mgr.last_429_time = 0.0
+            multi_account_mgr.accounts[account_id].reset_health()
             logger.info(f"[CONFIG] 账户 {account_id} 错误状态已重置")
 
         return {"status": "success", "message": f"账户 {account_id} 已启用", "account_count": len(multi_account_mgr.accounts)}
@@ -1126,6 +1251,49 @@ async def admin_enable_account(request: Request, account_id: str):
         logger.error(f"[CONFIG] 启用账户失败: {str(e)}")
         raise HTTPException(500, f"启用失败: {str(e)}")
 
+@app.post("/admin/accounts/bulk")
+@require_login()
+async def admin_bulk_accounts(
+    request: Request,
+    action: str = Body(...),
+    ids: Optional[List[str]] = Body(default=None),
+    status: Optional[str] = Body(default=None)
+):
+    """
+    批量操作账户（全部变更在内存中完成后只保存一次）
+
+    - action: enable / disable / delete / reset_errors
+    - ids: 账户ID列表
+    - status: 按状态选择（active/cooldown/failed/expired/disabled，可逗号分隔多个），与 ids 同时传入时取并集
+    """
+    if action not in BULK_ACCOUNT_ACTIONS:
+        raise HTTPException(400, f"无效的 action: {action}（可选: {', '.join(BULK_ACCOUNT_ACTIONS)}）")
+    statuses = _parse_csv_param(status, ACCOUNT_STATUSES, "status")
+    if not ids and not statuses:
+        raise HTTPException(400, "需要提供 ids 或 status")
+
+    account_ids = list(ids or [])
+    if statuses:
+        account_ids.extend(
+            account_id for account_id, account_mgr in multi_account_mgr.accounts.items()
+            if account_mgr.get_status() in statuses
+        )
+    try:
+        result = await _bulk_update_accounts(
+            action, account_ids, multi_account_mgr, http_client, USER_AGENT,
+            ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS, global_stats
+        )
+    except Exception as e:
+        logger.error(f"[CONFIG] 批量操作账户失败: {str(e)}")
+        raise HTTPException(500, f"批量操作失败: {str(e)}")
+    return {
+        "status": "success",
+        "action": action,
+        "updated": result["updated"],
+        "not_found": result["not_found"],
+        "account_count": len(multi_account_mgr.accounts)
+    }
+
 # ---------- Auth endpoints (API) ----------
 @app.get("/admin/settings")
 @require_login()
@@ -1158,14 +1326,26 @@ async def admin_get_settings(request: Request):
             "account_failure_threshold": config.retry.account_failure_threshold,
             "rate_limit_cooldown_seconds": config.retry.rate_limit_cooldown_seconds,
             "session_cache_ttl_seconds": config.retry.session_cache_ttl_seconds,
-            "auto_refresh_accounts_seconds": config.retry.auto_refresh_accounts_seconds
+            "session_cache_max_size": config.retry.session_cache_max_size,
+            "auto_refresh_accounts_seconds": config.retry.auto_refresh_accounts_seconds,
+            "failover_context_max_chars": config.retry.failover_context_max_chars
         },
         "public_display": {
             "logo_url": config.public_display.logo_url,
-            "chat_url": config.public_display.chat_url
+            "chat_url": config.public_display.chat_url,
+            "visitor_hourly_capacity": config.public_display.visitor_hourly_capacity,
+            "visitor_false_positive_rate": config.public_display.visitor_false_positive_rate
         },
         "session": {
             "expire_hours": config.session.expire_hours
+        },
+        "logging": {
+            "memory_capacity": config.logging.memory_capacity,
+            "persist_enabled": config.logging.persist_enabled,
+            "segment_max_mb": config.logging.segment_max_mb,
+            "segment_max_count": config.logging.segment_max_count,
+            "preview_sample_rate": config.logging.preview_sample_rate,
+            "preview_level": config.logging.preview_level
         }
     }
 
@@ -1202,9 +1382,25 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         new_settings["image_generation"] = image_generation
 
         retry = dict(new_settings.get("retry") or {})
+        retry.setdefault("session_cache_max_size", config.retry.session_cache_max_size)
         retry.setdefault("auto_refresh_accounts_seconds", config.retry.auto_refresh_accounts_seconds)
+        retry.setdefault("failover_context_max_chars", config.retry.failover_context_max_chars)
         new_settings["retry"] = retry
 
+        public_display = dict(new_settings.get("public_display") or {})
+        public_display.setdefault("visitor_hourly_capacity", config.public_display.visitor_hourly_capacity)
+        public_display.setdefault("visitor_false_positive_rate", config.public_display.visitor_false_positive_rate)
+        new_settings["public_display"] = public_display
+
+        logging_settings = dict(new_settings.get("logging") or {})
+        logging_settings.setdefault("memory_capacity", config.logging.memory_capacity)
+        logging_settings.setdefault("persist_enabled", config.logging.persist_enabled)
+        logging_settings.setdefault("segment_max_mb", config.logging.segment_max_mb)
+        logging_settings.setdefault("segment_max_count", config.logging.segment_max_count)
+        logging_settings.setdefault("preview_sample_rate", config.logging.preview_sample_rate)
+        logging_settings.setdefault("preview_level", config.logging.preview_level)
+        new_settings["logging"] = logging_settings
+
         # 保存旧配置用于对比
         old_proxy = PROXY
         old_retry_config = {
@@ -1236,6 +1432,20 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         AUTO_REFRESH_ACCOUNTS_SECONDS = config.retry.auto_refresh_accounts_seconds
         SESSION_EXPIRE_HOURS = config.session.expire_hours
 
+        # 访客统计容量变化时重建 Bloom filter（已有去重记录清空）
+        if visitor_counter.configure(
+            config.public_display.visitor_hourly_capacity,
+            config.public_display.visitor_false_positive_rate
+        ):
+            logger.info("[STATS] 访客统计容量已变化，24 小时去重记录已重置")
+        async with stats_lock:
+            global_stats["visitor_filter"] = visitor_counter.to_dict()
+
+        # 内存日志容量（缩小时立即淘汰最旧条目）与磁盘日志
+        log_store.resize(config.logging.memory_capacity)
+        configure_log_sink()
+        preview_sampler.configure(config.logging.preview_sample_rate, config.logging.preview_level)
+
         # 检查是否需要重建 HTTP 客户端（代理变化）
         if old_proxy != PROXY:
             logger.info(f"[CONFIG] 代理配置已变化，重建 HTTP 客户端")
@@ -1252,6 +1462,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             )
             # 更新所有账户的 http_client 引用
             multi_account_mgr.update_http_client(http_client)
+            await url_file_fetcher.update_proxy(PROXY)
 
         # 检查是否需要更新账户管理器配置（重试策略变化）
         retry_changed = (
@@ -1260,6 +1471,9 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             old_retry_config["session_cache_ttl_seconds"] != SESSION_CACHE_TTL_SECONDS
         )
 
+        # 会话缓存容量（缩小时立即淘汰最旧条目）
+        multi_account_mgr.cache_max_size = config.retry.session_cache_max_size
+
         if retry_changed:
             logger.info(f"[CONFIG] 重试策略已变化，更新账户管理器配置")
             # 更新所有账户管理器的配置
@@ -1267,6 +1481,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             for account_id, account_mgr in multi_account_mgr.accounts.items():
                 account_mgr.account_failure_threshold = ACCOUNT_FAILURE_THRESHOLD
                 account_mgr.rate_limit_cooldown_seconds = RATE_LIMIT_COOLDOWN_SECONDS
+            multi_account_mgr.rebuild_status_index()
 
         logger.info(f"[CONFIG] 系统设置已更新并实时生效")
         return {"status": "success", "message": "设置已保存并实时生效！"}
@@ -1282,44 +1497,66 @@ async def admin_get_logs(
     level: str = None,
     search: str = None,
     start_time: str = None,
-    end_time: str = None
+    end_time: str = None,
+    cursor: str = None,
+    source: str = "memory"
 ):
-    with log_lock:
-        logs = list(log_buffer)
-
-    stats_by_level = {}
-    error_logs = []
-    chat_count = 0
-    for log in logs:
-        level_name = log.get("level", "INFO")
-        stats_by_level[level_name] = stats_by_level.get(level_name, 0) + 1
-        if level_name in ["ERROR", "CRITICAL"]:
-            error_logs.append(log)
-        if "收到请求" in log.get("message", ""):
-            chat_count += 1
+    """
+    查询日志（旧到新）
 
+    source=memory 查询内存日志，source=history 按时间窗口查询磁盘日志分段；
+    cursor 为上一页返回的 next_cursor，用于继续向前（更早）翻页
+    """
     if level:
         level = level.upper()
-        logs = [log for log in logs if log["level"] == level]
-    if search:
-        logs = [log for log in logs if search.lower() in log["message"].lower()]
-    if start_time:
-        logs = [log for log in logs if log["time"] >= start_time]
-    if end_time:
-        logs = [log for log in logs if log["time"] <= end_time]
+    limit = max(1, min(limit, log_store.capacity))
+    if source == "history":
+        sink = memory_handler.sink
+        if sink is None:
+            raise HTTPException(400, "未启用磁盘日志（logging.persist_enabled）")
+        try:
+            parse_cursor(cursor)
+        except ValueError:
+            raise HTTPException(400, "无效的 cursor")
+        logs, next_cursor = await asyncio.to_thread(
+            sink.query, limit, level, search, start_time, end_time, cursor
+        )
+        return {
+            "total": len(logs),
+            "limit": limit,
+            "source": "history",
+            "filters": {"level": level, "search": search, "start_time": start_time, "end_time": end_time},
+            "logs": logs,
+            "next_cursor": next_cursor,
+            "stats": {"history": sink.stats()}
+        }
+
+    try:
+        before = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(400, "无效的 cursor")
+    logs, next_cursor = log_store.query(
+        limit,
+        level=level,
+        search=search,
+        start_time=start_time,
+        end_time=end_time,
+        before=before,
+    )
 
-    limit = min(limit, log_buffer.maxlen)
-    filtered_logs = logs[-limit:]
+    stats_by_level = log_store.level_counts()
+    error_count = stats_by_level.get("ERROR", 0) + stats_by_level.get("CRITICAL", 0)
 
     return {
-        "total": len(filtered_logs),
+        "total": len(logs),
         "limit": limit,
         "filters": {"level": level, "search": search, "start_time": start_time, "end_time": end_time},
-        "logs": filtered_logs,
+        "logs": logs,
+        "next_cursor": next_cursor,
         "stats": {
-            "memory": {"total": len(log_buffer), "by_level": stats_by_level, "capacity": log_buffer.maxlen},
-            "errors": {"count": len(error_logs), "recent": error_logs[-10:]},
-            "chat_count": chat_count
+            "memory": {"total": len(log_store), "by_level": stats_by_level, "capacity": log_store.capacity},
+            "errors": {"count": error_count, "recent": log_store.recent_by_levels(("ERROR", "CRITICAL"), 10)},
+            "chat_count": log_store.event_count(LOG_EVENT_START)
         }
     }
 
@@ -1328,9 +1565,7 @@ async def admin_get_logs(
 async def admin_clear_logs(request: Request, confirm: str = None):
     if confirm != "yes":
         raise HTTPException(400, "需要 confirm=yes 参数确认清空操作")
-    with log_lock:
-        cleared_count = len(log_buffer)
-        log_buffer.clear()
+    cleared_count = log_store.clear()
     logger.info("[LOG] 日志已清空")
     return {"status": "success", "message": "已清空内存日志", "cleared_count": cleared_count}
 
@@ -1385,6 +1620,8 @@ async def chat_impl(
         if monitor_recorded:
             return
         monitor_recorded = True
+        if status == "timeout":
+            logger.warning(f"[CHAT] [req_{request_id}] 请求超时", extra=log_extra(request_id, None, LOG_EVENT_TIMEOUT))
         duration_s = time.time() - start_ts
         latency_ms = None
         first_response_time = getattr(request.state, "first_response_time", None)
@@ -1410,13 +1647,16 @@ async def chat_impl(
             global_stats.setdefault("rate_limit_timestamps", [])
             global_stats.setdefault("recent_conversations", [])
             if status != "success":
+                failed_at = time.time()
                 if status_code == 429:
-                    global_stats["rate_limit_timestamps"].append(time.time())
+                    append_stats_timestamp(global_stats["rate_limit_timestamps"], failed_at)
                 else:
-                    global_stats["failure_timestamps"].append(time.time())
+                    append_stats_timestamp(global_stats["failure_timestamps"], failed_at)
+                stats_aggregator.record_failure(status_code == 429, failed_at)
             global_stats["recent_conversations"].append(entry)
             global_stats["recent_conversations"] = global_stats["recent_conversations"][-60:]
             await save_stats(global_stats)
+        public_log_timeline.record(entry)
 
     def classify_error_status(status_code: Optional[int], error: Exception) -> str:
         if status_code == 504:
@@ -1437,14 +1677,15 @@ async def chat_impl(
     async with stats_lock:
         timestamp = time.time()
         global_stats["total_requests"] += 1
-        global_stats["request_timestamps"].append(timestamp)
+        append_stats_timestamp(global_stats["request_timestamps"], timestamp)
         global_stats.setdefault("model_request_timestamps", {})
-        global_stats["model_request_timestamps"].setdefault(req.model, []).append(timestamp)
+        append_stats_timestamp(global_stats["model_request_timestamps"].setdefault(req.model, []), timestamp)
+        stats_aggregator.record_request(req.model, timestamp)
         await save_stats(global_stats)
 
     # 2. 模型校验
     if req.model not in MODEL_MAPPING:
-        logger.error(f"[CHAT] [req_{request_id}] 不支持的模型: {req.model}")
+        logger.error(f"[CHAT] [req_{request_id}] 不支持的模型: {req.model}", extra=log_extra(request_id))
         await finalize_result("error", 404, f"HTTP 404: Model '{req.model}' not found")
         raise HTTPException(
             status_code=404,
@@ -1455,12 +1696,33 @@ async def chat_impl(
     request.state.model = req.model
 
     # 3. 生成会话指纹，获取Session锁（防止同一对话的并发请求冲突）
-    conv_key = get_conversation_key([m.model_dump() for m in req.messages], client_ip)
-    session_lock = await multi_account_mgr.acquire_session_lock(conv_key)
+    # 规范化视图只提取一次消息文本，指纹、消息解析和上下文拼接共用
+    conversation = ConversationView(req.messages)
+    prefix_chain = conversation.prefix_chain(client_ip)
+    conv_key = await multi_account_mgr.resolve_conversation_key(
+        prefix_chain,
+        get_conversation_key(conversation, client_ip)
+    )
+
+    # 未持有跨副本会话锁时（等待超时）不读写共享绑定，会话只在本次请求内使用
+    session_cached = True
+    local_session = None
+
+    async def lookup_session() -> Optional[dict]:
+        if session_cached:
+            return await multi_account_mgr.get_session_cache(conv_key)
+        return local_session
+
+    async def bind_session(account_id: str, session_id: str):
+        nonlocal local_session
+        if session_cached:
+            await multi_account_mgr.set_session_cache(conv_key, account_id, session_id)
+        else:
+            local_session = {"account_id": account_id, "session_id": session_id}
 
     # 4. 在锁的保护下检查缓存和处理Session（保证同一对话的请求串行化）
-    async with session_lock:
-        cached_session = multi_account_mgr.global_session_cache.get(conv_key)
+    async with multi_account_mgr.session_lock(conv_key) as session_cached:
+        cached_session = await lookup_session()
 
         if cached_session:
             # 使用已绑定的账户
@@ -1468,7 +1730,7 @@ async def chat_impl(
             account_manager = await multi_account_mgr.get_account(account_id, request_id)
             google_session = cached_session["session_id"]
             is_new_conversation = False
-            logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: {google_session[-12:]}")
+            logger.info(f"[CHAT] [{account_id}] [req_{request_id}] 继续会话: {google_session[-12:]}", extra=log_extra(request_id, account_id))
         else:
             # 新对话：轮询选择可用账户，失败时尝试其他账户
             max_account_tries = min(MAX_NEW_SESSION_TRIES, len(multi_account_mgr.accounts))
@@ -1479,13 +1741,9 @@ async def chat_impl(
                     account_manager = await multi_account_mgr.get_account(None, request_id)
                     google_session = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
                     # 线程安全地绑定账户到此对话
-                    await multi_account_mgr.set_session_cache(
-                        conv_key,
-                        account_manager.config.account_id,
-                        google_session
-                    )
+                    await bind_session(account_manager.config.account_id, google_session)
                     is_new_conversation = True
-                    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 新会话创建并绑定账户")
+                    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 新会话创建并绑定账户", extra=log_extra(request_id, account_manager.config.account_id))
                     # 记录账号池状态（账户可用）
                     uptime_tracker.record_request("account_pool", True)
                     break
@@ -1494,40 +1752,26 @@ async def chat_impl(
                     error_type = type(e).__name__
                     # 安全获取账户ID
                     account_id = account_manager.config.account_id if 'account_manager' in locals() and account_manager else 'unknown'
-                    logger.error(f"[CHAT] [req_{request_id}] 账户 {account_id} 创建会话失败 (尝试 {attempt + 1}/{max_account_tries}) - {error_type}: {str(e)}")
+                    logger.error(f"[CHAT] [req_{request_id}] 账户 {account_id} 创建会话失败 (尝试 {attempt + 1}/{max_account_tries}) - {error_type}: {str(e)}", extra=log_extra(request_id, account_id, LOG_EVENT_RETRY))
                     # 记录账号池状态（单个账户失败）
                     status_code = e.status_code if isinstance(e, HTTPException) else None
                     uptime_tracker.record_request("account_pool", False, status_code=status_code)
                     if attempt == max_account_tries - 1:
-                        logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用")
+                        logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用", extra=log_extra(request_id))
                         status = classify_error_status(503, last_error if isinstance(last_error, Exception) else Exception("account_pool_unavailable"))
                         await finalize_result(status, 503, f"All accounts unavailable: {str(last_error)[:100]}")
                         raise HTTPException(503, f"All accounts unavailable: {str(last_error)[:100]}")
                     # 继续尝试下一个账户
 
-    # 提取用户消息内容用于日志
-    if req.messages:
-        last_content = req.messages[-1].content
-        if isinstance(last_content, str):
-            # 显示完整消息，但限制在500字符以内
-            if len(last_content) > 500:
-                preview = last_content[:500] + "...(已截断)"
-            else:
-                preview = last_content
-        else:
-            preview = f"[多模态: {len(last_content)}部分]"
-    else:
-        preview = "[空消息]"
-
     # 记录请求基本信息
-    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 收到请求: {req.model} | {len(req.messages)}条消息 | stream={req.stream}")
+    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 收到请求: {req.model} | {len(req.messages)}条消息 | stream={req.stream}", extra=log_extra(request_id, account_manager.config.account_id, LOG_EVENT_START, model=req.model, message_count=len(req.messages)))
 
-    # 单独记录用户消息内容（方便查看）
-    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 用户消息: {preview}")
+    # 单独记录用户消息内容（方便查看，按采样率记录，限制500字符）
+    preview_sampler.log("[CHAT]", request_id, account_manager.config.account_id, "用户消息", req.messages[-1].content if req.messages else None)
 
     # 3. 解析请求内容
     try:
-        last_text, current_images = await parse_last_message(req.messages, http_client, request_id)
+        last_text, current_images = await parse_last_message(conversation, url_file_fetcher, request_id)
     except HTTPException as e:
         status = classify_error_status(e.status_code, e)
         await finalize_result(status, e.status_code, f"HTTP {e.status_code}: {e.detail}")
@@ -1572,15 +1816,11 @@ async def chat_impl(
         while retry_count <= max_retries:
             try:
                 # 安全：使用.get()防止缓存被清理导致KeyError
-                cached = multi_account_mgr.global_session_cache.get(conv_key)
+                cached = await lookup_session()
                 if not cached:
-                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session")
+                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session", extra=log_extra(request_id, account_manager.config.account_id))
                     new_sess = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
-                    await multi_account_mgr.set_session_cache(
-                        conv_key,
-                        account_manager.config.account_id,
-                        new_sess
-                    )
+                    await bind_session(account_manager.config.account_id, new_sess)
                     current_session = new_sess
                     current_retry_mode = True
                     current_file_ids = []
@@ -1591,12 +1831,17 @@ async def chat_impl(
                 # 注意：每次重试如果是新 Session，都需要重新上传图片
                 if current_images and not current_file_ids:
                     for img in current_images:
-                        fid = await upload_context_file(current_session, img["mime"], img["data"], account_manager, http_client, USER_AGENT, request_id)
+                        fid = await upload_context_file(current_session, img.mime, img.data, account_manager, http_client, USER_AGENT, request_id)
                         current_file_ids.append(fid)
 
-                # B. 准备文本 (重试模式下发全文)
+                # B. 准备文本 (重试模式下发全文，按预算截断并复用已构建的上下文)
                 if current_retry_mode:
-                    current_text = build_full_context_text(req.messages)
+                    current_text = context_builder.build(
+                        conv_key,
+                        conversation,
+                        prefix_chain,
+                        config_manager.failover_context_max_chars
+                    )
 
                 # C. 发起对话
                 async for chunk in stream_chat_generator(
@@ -1613,9 +1858,12 @@ async def chat_impl(
                 ):
                     yield chunk
 
+                # 登记完整历史前缀，下一轮请求可按最长前缀找回此会话
+                if session_cached:
+                    await multi_account_mgr.remember_prefix(prefix_chain[-1], conv_key)
+
                 # 请求成功，重置账户失败计数
-                account_manager.is_available = True
-                account_manager.error_count = 0
+                account_manager.mark_success()
                 account_manager.conversation_count += 1  # 增加对话次数
 
                 # 记录账号池状态（请求成功）
@@ -1652,16 +1900,12 @@ async def chat_impl(
 
                 # 429错误单独处理（不增加error_count，只设置冷却时间）
                 if is_rate_limit:
-                    account_manager.last_429_time = time.time()
-                    account_manager.is_available = False  # 临时禁用，冷却期后自动恢复
-                    logger.warning(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒后自动恢复")
+                    account_manager.mark_rate_limited()  # 临时禁用，冷却期后自动恢复
+                    logger.warning(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒后自动恢复", extra=log_extra(request_id, account_manager.config.account_id))
                 else:
                     # 非429错误才增加失败计数
-                    account_manager.last_error_time = time.time()
-                    account_manager.error_count += 1
-                    if account_manager.error_count >= ACCOUNT_FAILURE_THRESHOLD:
-                        account_manager.is_available = False
-                        logger.error(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 请求连续失败{account_manager.error_count}次，账户已永久禁用")
+                    if account_manager.mark_failed():
+                        logger.error(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 请求连续失败{account_manager.error_count}次，账户已永久禁用", extra=log_extra(request_id, account_manager.config.account_id))
 
                 retry_count += 1
 
@@ -1672,15 +1916,15 @@ async def chat_impl(
                 # 特殊处理HTTPException，提取状态码和详情
                 if isinstance(e, HTTPException):
                     if is_rate_limit:
-                        logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流错误，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒")
+                        logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流错误，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒", extra=log_extra(request_id, account_manager.config.account_id))
                     else:
-                        logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] HTTP错误 {e.status_code}: {e.detail}")
+                        logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] HTTP错误 {e.status_code}: {e.detail}", extra=log_extra(request_id, account_manager.config.account_id))
                 else:
-                    logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] {error_type}: {error_detail}")
+                    logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] {error_type}: {error_detail}", extra=log_extra(request_id, account_manager.config.account_id))
 
                 # 检查是否还能继续重试
                 if retry_count <= max_retries:
-                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 正在重试 ({retry_count}/{max_retries})")
+                    logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 正在重试 ({retry_count}/{max_retries})", extra=log_extra(request_id, account_manager.config.account_id))
 
                     # 快速失败：检查是否还有可用账户（避免无效重试）
                     available_count = sum(
@@ -1692,7 +1936,7 @@ async def chat_impl(
                     )
 
                     if available_count == 0:
-                        logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用，快速失败")
+                        logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用，快速失败", extra=log_extra(request_id))
                         await finalize_result("error", 503, "All accounts unavailable")
                         if req.stream: yield f"data: {json.dumps({'error': {'message': 'All accounts unavailable'}})}\n\n"
                         return
@@ -1710,22 +1954,18 @@ async def chat_impl(
                                 break
 
                         if not new_account:
-                            logger.error(f"[CHAT] [req_{request_id}] 所有可用账户均已失败")
+                            logger.error(f"[CHAT] [req_{request_id}] 所有可用账户均已失败", extra=log_extra(request_id))
                             await finalize_result("error", 503, "All available accounts failed")
                             if req.stream: yield f"data: {json.dumps({'error': {'message': 'All available accounts failed'}})}\n\n"
                             return
 
-                        logger.info(f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}")
+                        logger.info(f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}", extra=log_extra(request_id, new_account.config.account_id, LOG_EVENT_SWITCH))
 
                         # 创建新 Session
                         new_sess = await create_google_session(new_account, http_client, USER_AGENT, request_id)
 
                         # 更新缓存绑定到新账户
-                        await multi_account_mgr.set_session_cache(
-                            conv_key,
-                            new_account.config.account_id,
-                            new_sess
-                        )
+                        await bind_session(new_account.config.account_id, new_sess)
 
                         # 更新账户管理器
                         account_manager = new_account
@@ -1736,7 +1976,7 @@ async def chat_impl(
 
                     except Exception as create_err:
                         error_type = type(create_err).__name__
-                        logger.error(f"[CHAT] [req_{request_id}] 账户切换失败 ({error_type}): {str(create_err)}")
+                        logger.error(f"[CHAT] [req_{request_id}] 账户切换失败 ({error_type}): {str(create_err)}", extra=log_extra(request_id))
                         # 记录账号池状态（账户切换失败）
                         status_code = create_err.status_code if isinstance(create_err, HTTPException) else None
 
@@ -1749,7 +1989,7 @@ async def chat_impl(
                         return
                 else:
                     # 已达到最大重试次数
-                    logger.error(f"[CHAT] [req_{request_id}] 已达到最大重试次数 ({max_retries})，请求失败")
+                    logger.error(f"[CHAT] [req_{request_id}] 已达到最大重试次数 ({max_retries})，请求失败", extra=log_extra(request_id))
                     status = classify_error_status(status_code, e)
                     await finalize_result(status, status_code, error_detail)
                     if req.stream: yield f"data: {json.dumps({'error': {'message': f'Max retries ({max_retries}) exceeded: {e}'}})}\n\n"
@@ -1771,9 +2011,9 @@ async def chat_impl(
                 if "reasoning_content" in delta:
                     full_reasoning += delta["reasoning_content"]
             except json.JSONDecodeError as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}")
+                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}", extra=log_extra(request_id, account_manager.config.account_id))
             except (KeyError, IndexError) as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 响应格式错误 ({type(e).__name__}): {str(e)}")
+                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 响应格式错误 ({type(e).__name__}): {str(e)}", extra=log_extra(request_id, account_manager.config.account_id))
 
     # 构建响应消息
     message = {"role": "assistant", "content": full_content}
@@ -1781,11 +2021,10 @@ async def chat_impl(
         message["reasoning_content"] = full_reasoning
 
     # 非流式请求完成日志
-    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 非流式响应完成")
+    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 非流式响应完成", extra=log_extra(request_id, account_manager.config.account_id, LOG_EVENT_COMPLETE))
 
-    # 记录响应内容（限制500字符）
-    response_preview = full_content[:500] + "...(已截断)" if len(full_content) > 500 else full_content
-    logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] AI响应: {response_preview}")
+    # 记录响应内容（按采样率记录，限制500字符）
+    preview_sampler.log("[CHAT]", request_id, account_manager.config.account_id, "AI响应", full_content)
 
     return {
         "id": chat_id,
@@ -1838,11 +2077,10 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
     full_content = ""
     first_response_time = None
 
-    # 记录发送给API的内容
-    text_preview = text_content[:500] + "...(已截断)" if len(text_content) > 500 else text_content
-    logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 发送内容: {text_preview}")
+    # 记录发送给API的内容（按采样率记录）
+    preview_sampler.log("[API]", request_id, account_manager.config.account_id, "发送内容", text_content)
     if file_ids:
-        logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 附带文件: {len(file_ids)}个")
+        logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 附带文件: {len(file_ids)}个", extra=log_extra(request_id, account_manager.config.account_id))
 
     jwt = await account_manager.get_jwt(request_id)
     headers = get_common_headers(jwt, USER_AGENT)
@@ -1929,15 +2167,15 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                 file_ids, session_name = parse_images_from_response(json_objects)
                 if file_ids and session_name:
                     file_ids_info = (file_ids, session_name)
-                    logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 检测到{len(file_ids)}张生成图片")
+                    logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 检测到{len(file_ids)}张生成图片", extra=log_extra(request_id, account_manager.config.account_id))
 
         except ValueError as e:
             uptime_tracker.record_request(model_name, False)
-            logger.error(f"[API] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}")
+            logger.error(f"[API] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}", extra=log_extra(request_id, account_manager.config.account_id))
         except Exception as e:
             error_type = type(e).__name__
             uptime_tracker.record_request(model_name, False)
-            logger.error(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 流处理错误 ({error_type}): {str(e)}")
+            logger.error(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 流处理错误 ({error_type}): {str(e)}", extra=log_extra(request_id, account_manager.config.account_id))
             raise
 
     # 在 async with 块外处理图片下载（避免占用上游连接）
@@ -1963,7 +2201,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
             success_count = 0
             for idx, ((fid, mime, _), result) in enumerate(zip(download_tasks, results), 1):
                 if isinstance(result, Exception):
-                    logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}下载失败: {type(result).__name__}: {str(result)[:100]}")
+                    logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}下载失败: {type(result).__name__}: {str(result)[:100]}", extra=log_extra(request_id, account_manager.config.account_id))
                     # 降级处理：返回错误提示而不是静默失败
                     error_msg = f"\n\n⚠️ 图片 {idx} 下载失败\n\n"
                     chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
@@ -1978,34 +2216,33 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                         # Base64 模式：直接返回 base64 编码
                         b64 = base64.b64encode(result).decode()
                         markdown = f"\n\n![生成的图片](data:{mime};base64,{b64})\n\n"
-                        logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}已编码为base64")
+                        logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}已编码为base64", extra=log_extra(request_id, account_manager.config.account_id))
                     else:
                         # URL 模式：保存到本地并返回 URL
                         image_url = save_image_to_hf(result, chat_id, fid, mime, base_url, IMAGE_DIR)
                         markdown = f"\n\n![生成的图片]({image_url})\n\n"
-                        logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}已保存: {image_url}")
+                        logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}已保存: {image_url}", extra=log_extra(request_id, account_manager.config.account_id))
 
                     success_count += 1
                     chunk = create_chunk(chat_id, created_time, model_name, {"content": markdown}, None)
                     yield f"data: {chunk}\n\n"
                 except Exception as save_error:
-                    logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}处理失败: {str(save_error)[:100]}")
+                    logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}处理失败: {str(save_error)[:100]}", extra=log_extra(request_id, account_manager.config.account_id))
                     error_msg = f"\n\n⚠️ 图片 {idx} 处理失败\n\n"
                     chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
                     yield f"data: {chunk}\n\n"
 
-            logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理完成: {success_count}/{len(file_ids)} 成功")
+            logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理完成: {success_count}/{len(file_ids)} 成功", extra=log_extra(request_id, account_manager.config.account_id))
 
         except Exception as e:
-            logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理失败: {type(e).__name__}: {str(e)[:100]}")
+            logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理失败: {type(e).__name__}: {str(e)[:100]}", extra=log_extra(request_id, account_manager.config.account_id))
             # 降级处理：通知用户图片处理失败
             error_msg = f"\n\n⚠️ 图片处理失败: {type(e).__name__}\n\n"
             chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
             yield f"data: {chunk}\n\n"
 
     if full_content:
-        response_preview = full_content[:500] + "...(已截断)" if len(full_content) > 500 else full_content
-        logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] AI响应: {response_preview}")
+        preview_sampler.log("[CHAT]", request_id, account_manager.config.account_id, "AI响应", full_content)
 
     if first_response_time:
         latency_ms = int((first_response_time - start_time) * 1000)
@@ -2014,7 +2251,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
         uptime_tracker.record_request(model_name, True)
 
     total_time = time.time() - start_time
-    logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 响应完成: {total_time:.2f}秒")
+    logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 响应完成: {total_time:.2f}秒", extra=log_extra(request_id, account_manager.config.account_id, LOG_EVENT_COMPLETE, duration=round(total_time, 2)))
     
     if is_stream:
         final_chunk = create_chunk(chat_id, created_time, model_name, {}, "stop")
@@ -2079,59 +2316,22 @@ async def get_public_display():
 async def get_public_logs(request: Request, limit: int = 100):
     try:
         # 基于IP的访问统计（24小时内去重）
-        client_ip = request.client.host
+        client_ip = request.client.host if request.client else "unknown"
         current_time = time.time()
 
         async with stats_lock:
-            # 清理24小时前的IP记录
-            if "visitor_ips" not in global_stats:
-                global_stats["visitor_ips"] = {}
-            global_stats["visitor_ips"] = {
-                ip: timestamp for ip, timestamp in global_stats["visitor_ips"].items()
-                if current_time - timestamp <= 86400
-            }
-
-            # 记录新访问（24小时内同一IP只计数一次）
-            if client_ip not in global_stats["visitor_ips"]:
-                global_stats["visitor_ips"][client_ip] = current_time
+            # 记录新访问（24小时内同一IP只计数一次，只有新访客才需要持久化）
+            if visitor_counter.add(client_ip, current_time):
                 global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
-
-            global_stats.setdefault("recent_conversations", [])
-            await save_stats(global_stats)
-
-            stored_logs = list(global_stats.get("recent_conversations", []))
-
-        sanitized_logs = get_sanitized_logs(limit=min(limit, 1000))
-
-        log_map = {log.get("request_id"): log for log in sanitized_logs}
-        for log in stored_logs:
-            request_id = log.get("request_id")
-            if request_id and request_id not in log_map:
-                log_map[request_id] = log
-
-        def get_log_ts(item: dict) -> float:
-            if "start_ts" in item:
-                return float(item["start_ts"])
-            try:
-                return datetime.strptime(item.get("start_time", ""), "%Y-%m-%d %H:%M:%S").timestamp()
-            except Exception:
-                return 0.0
-
-        merged_logs = sorted(log_map.values(), key=get_log_ts, reverse=True)[:min(limit, 1000)]
-        output_logs = []
-        for log in merged_logs:
-            if "start_ts" in log:
-                log = dict(log)
-                log.pop("start_ts", None)
-            output_logs.append(log)
-
-        return {
-            "total": len(output_logs),
-            "logs": output_logs
-        }
-    except Exception as e:
-        logger.error(f"[LOG] 获取公开日志失败: {e}")
-        return {"total": 0, "logs": [], "error": str(e)}
+                global_stats["visitor_filter"] = visitor_counter.to_dict()
+                await save_stats(global_stats)
+
+        # 时间线增量维护，响应体短时间缓存；内容未变化时返回 304
+        body, etag = public_log_timeline.render(limit)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as e:
         logger.error(f"[LOG] 获取公开日志失败: {e}")
         return {"total": 0, "logs": [], "error": str(e)}